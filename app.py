@@ -1,11 +1,14 @@
+import asyncio
 import streamlit as st
 from datetime import datetime, timedelta
 from uuid import uuid4
 from langchain.schema import HumanMessage, AIMessage
-from src.agents.graph import graph_agent
-from langchain_community.document_loaders import PyPDFLoader
+from src.agents.graph import graph_agent, checkpointer
+from src.core import config
+from src.tools.rag import watch_vector_store
+from src.tools.uploads import upload_store
+from src.warmup import warmup
 import os
-import tempfile
 import logging
 from src.core.logging_config import setup_logging
 
@@ -16,6 +19,20 @@ logger = logging.getLogger(__name__)
 # ── PAGE CONFIG ───────────────────────────────────────────────────────
 st.set_page_config(page_title="RAG Assistant", layout="centered")
 
+# ── WARM-UP ─────────────────────────────────────────────────────────────
+# Streamlit re-runs this script on every interaction; cache_resource makes
+# the (parallel) preload of the vector store, search client and LLMs run once
+# per process.
+@st.cache_resource(show_spinner="Warming up the assistant…")
+def _warmup():
+    report = warmup()
+    if config.KB_RELOAD_INTERVAL_SECONDS > 0:
+        # Picks up versions published by scripts/build_vector_store.py.
+        watch_vector_store(config.KB_RELOAD_INTERVAL_SECONDS)
+    return report
+
+_warmup()
+
 # ── SIDEBAR SETUP ────────────────────────────────────────────────────
 st.sidebar.title("Do Chat 💬")
 test_pdf_path = "data/testfile.pdf"
@@ -89,7 +106,51 @@ else:
     st.markdown("Upload a PDF or ask me anything — I’ll leverage your document, RAG knowledge base, and web search to deliver the best answer.")
 
 
-    SESSION_TIMEOUT = timedelta(minutes=10)
+    # Progress labels for the graph stages that run before the answer streams in
+    STAGE_LABELS = {
+        "router": "🧭 Routing your question…",
+        "rag_lookup": "🗄️ Searching the knowledge base…",
+        "retrieve": "🗄️ Searching the knowledge base…",
+        "fused_answer": "✍️ Writing the answer…",
+        "web_search": "🌐 Searching the web…",
+        "answer": "✍️ Writing the answer…",
+    }
+
+    async def _stream_turn(inputs, config):
+        """
+        Runs one turn through graph_agent.astream_events, showing stage progress
+        and streaming answer tokens into the assistant bubble as they arrive.
+        Returns the final AIMessage (or None).
+        """
+        with st.chat_message("assistant"):
+            status = st.status("Thinking…", expanded=False)
+            placeholder = st.empty()
+            answer, final_state = "", None
+            async for event in graph_agent.astream_events(inputs, config=config, version="v2"):
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+                if kind == "on_custom_event" and event["name"] == "semantic_cache_hit":
+                    answer, final_state = event["data"]["answer"], event["data"]["output"]
+                    status.update(label="⚡ Answered from cache", state="complete")
+                elif kind == "on_chain_start" and event["name"] in STAGE_LABELS and node == event["name"]:
+                    status.update(label=STAGE_LABELS[event["name"]])
+                elif (kind == "on_chat_model_stream" and node == "answer"
+                      and "history_summary" not in event.get("tags", [])):
+                    answer += event["data"]["chunk"].content or ""
+                    placeholder.markdown(answer + "▌")
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    final_state = event["data"].get("output")
+            status.update(state="complete")
+
+            messages = (final_state or {}).get("messages", [])
+            ai_msg = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
+            if ai_msg:
+                placeholder.markdown(ai_msg.content)
+            else:
+                placeholder.empty()
+            return ai_msg
+
+    SESSION_TIMEOUT = timedelta(seconds=config.SESSION_TIMEOUT_SECONDS)
     now = datetime.now()
 
     if "thread_id" not in st.session_state or "last_active" not in st.session_state:
@@ -99,6 +160,10 @@ else:
         logger.info(f"New session started with thread_id: {st.session_state.thread_id}")
     elif now - st.session_state.last_active > SESSION_TIMEOUT:
         logger.warning(f"Session timed out. Creating new session.")
+        # The old thread can never be resumed, so free its checkpoints now
+        # rather than waiting for the checkpointer's TTL sweep.
+        checkpointer.delete_thread(st.session_state.thread_id)
+        upload_store.release(st.session_state.thread_id)
         st.session_state.thread_id = str(uuid4())
         st.session_state.messages = []
         st.session_state.last_active = now
@@ -126,49 +191,42 @@ else:
         st.chat_message("user").markdown(question)
         logger.info(f"User question: {question}")
 
-        # Extract PDF text if uploaded
-        file_ctx = ""
+        # Index the uploaded PDF into this session's in-memory upload index;
+        # the answer node retrieves from it instead of getting raw pages.
+        new_upload = False
         if user_input.files:
             pdf = user_input.files[0]
             st.chat_message("user").markdown(f"📄 Uploaded: **{pdf.name}**")
             logger.info(f"User uploaded file: {pdf.name}")
             try:
-                suffix = os.path.splitext(pdf.name)[1]
-                with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                    tmp.write(pdf.getvalue())
-                    tmp_path = tmp.name
-
-                loader = PyPDFLoader(tmp_path)
-                pages = loader.load()[:2]        # first two pages only
-                os.unlink(tmp_path)
-                file_ctx = "\n\n".join(p.page_content for p in pages)
-                logger.info(f"Successfully loaded and processed PDF file: {pdf.name}")
+                info = upload_store.add(st.session_state.thread_id, pdf.name, pdf.getvalue())
+                new_upload = True
+                logger.info(f"Successfully loaded and processed PDF file: {pdf.name} ({info})")
             except Exception as e:
                 logger.error(f"Error processing uploaded PDF file: {e}")
                 st.chat_message("assistant").markdown(f"❌ Error processing PDF: `{e}`")
-                file_ctx = ""
-
 
-        full_payload = (file_ctx + "\n\n" + question).strip()
-        user_msg = HumanMessage(content=full_payload)
+        # Keep uploaded text out of the message so it never lands in the history.
+        user_msg = HumanMessage(content=question)
         st.session_state.messages.append(user_msg)
 
         try:
-            logger.info("Invoking graph agent")
-            result = graph_agent.invoke(
+            logger.info("Streaming graph agent")
+            ai_msg = asyncio.run(_stream_turn(
                 {
                     "messages": [user_msg],
-                    "upload_file_content": file_ctx
+                    "upload_file_content": "",
+                    "upload_session": (st.session_state.thread_id
+                                       if upload_store.files(st.session_state.thread_id) else None),
+                    "new_upload": new_upload,
                 },
-                config={"configurable": {"thread_id": st.session_state.thread_id}}
-            )
+                {"configurable": {"thread_id": st.session_state.thread_id}},
+            ))
             logger.info("Graph agent invocation successful")
-            # extract assistant reply
-            ai_msg = next((m for m in reversed(result["messages"]) if isinstance(m, AIMessage)), None)
             if ai_msg:
-                st.chat_message("assistant").markdown(ai_msg.content)
                 st.session_state.messages.append(ai_msg)
-                logger.info(f"AI response: {ai_msg.content}")
+                logger.info(f"AI response: {len(ai_msg.content)} chars")
+                logger.debug(f"AI response: {ai_msg.content}")
             else:
                 st.chat_message("assistant").markdown("⚠️ No response generated.")
                 logger.warning("No response generated by the AI.")
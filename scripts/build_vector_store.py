@@ -0,0 +1,55 @@
+"""
+Builds the knowledge-base collections offline and publishes each as a new version.
+
+    python scripts/build_vector_store.py [--collections NAME ...] [--index-types flat hnsw] [--rebuild]
+
+Serving processes (Streamlit app, HTTP API) load the published version and
+swap in newer ones while running; see KB_RELOAD_INTERVAL_SECONDS.
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from src.core import config
+from src.core.logging_config import setup_logging
+from src.tools import kb_collections, kb_versions
+from src.tools.faiss_index import INDEX_TYPES
+from src.tools.rag import MANIFEST_FILE, SAVE_PATH, build_collections
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Build and publish vector store versions.")
+    parser.add_argument("--collections", nargs="+",
+                        help="Collections to build (default: every one in the source folder; see KB_COLLECTIONS)")
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=[config.FAISS_INDEX_TYPE],
+                        help="Serving index types to build (default: FAISS_INDEX_TYPE)")
+    parser.add_argument("--batch-size", type=int, default=config.INGEST_EMBED_BATCH_SIZE,
+                        help="Chunks per embedding request")
+    parser.add_argument("--concurrency", type=int, default=config.INGEST_EMBED_CONCURRENCY,
+                        help="Embedding requests in flight")
+    parser.add_argument("--keep", type=int, default=config.KB_KEEP_VERSIONS, help="Versions to keep on disk")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Re-index every document instead of only the changed ones")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    setup_logging()
+    versions = build_collections(args.index_types, args.batch_size, args.concurrency, args.keep, args.rebuild,
+                                 args.collections)
+    report = {}
+    for name, version in versions.items():
+        path = kb_versions.version_path(kb_collections.collection_root(SAVE_PATH, name), version)
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        report[name] = {k: manifest.get(k) for k in ("version", "built_at", "chunks", "index_types", "params")}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
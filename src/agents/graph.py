@@ -1,29 +1,86 @@
 import logging
 from langgraph.graph import StateGraph, END
-from src.agents.nodes import router_node, rag_node, web_node, answer_node
+from langchain_core.runnables import RunnableLambda
+from src.agents.nodes import (
+    router_node, rag_node, web_node, answer_node, retrieve_node, fused_answer_node,
+    arouter_node, arag_node, aweb_node, aanswer_node, aretrieve_node, afused_answer_node,
+)
 from src.core.state import AgentState
-from src.agents.routing import from_router, after_rag
-from langgraph.checkpoint.memory import MemorySaver
+from src.agents.routing import from_router, after_rag, after_retrieve, after_fused
+from src.core.checkpointer import BoundedCheckpointSaver
+from src.agents.semantic_cache import SemanticAnswerCache, CachedGraphAgent
+from src.core import config
+from src.core.telemetry import instrument_node
+from src.tools.rag import get_embeddings, get_kb_version
 
 # ── LOGGING ─────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
 # ── Build graph ─────────────────────────────────────────────────────
-logger.info("Building agent graph...")
-g = StateGraph(AgentState)
-g.add_node("router", router_node)
-g.add_node("rag_lookup", rag_node)
-g.add_node("web_search", web_node)
-g.add_node("answer", answer_node)
-
-g.set_entry_point("router")
-g.add_conditional_edges("router", from_router,
-                        {"rag": "rag_lookup", "answer": "answer", "end": END})
-g.add_conditional_edges("rag_lookup", after_rag,
-                        {"answer": "answer", "web": "web_search"})
-g.add_edge("web_search", "answer")
-g.add_edge("answer", END)
+TOPOLOGIES = ("staged", "fused")
+
+# Each node carries a sync and an async implementation: invoke() runs the
+# former, ainvoke()/astream()/astream_events() the latter. Both are timed as
+# "node.seconds{name=...}".
+def _node(name, func, afunc) -> RunnableLambda:
+    return RunnableLambda(instrument_node(name, func), afunc=instrument_node(name, afunc), name=name)
+
+def build_graph(topology: str = "staged") -> StateGraph:
+    """
+    The agent graph, uncompiled. "staged" routes, retrieves and judges with
+    separate LLM calls; "fused" retrieves first and answers with one call
+    that also judges sufficiency (see config.GRAPH_TOPOLOGY).
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown GRAPH_TOPOLOGY {topology!r}; expected one of {TOPOLOGIES}")
+    logger.info(f"Building agent graph ({topology} topology)...")
+    g = StateGraph(AgentState)
+    g.add_node("web_search", _node("web_search", web_node, aweb_node))
+    g.add_node("answer", _node("answer", answer_node, aanswer_node))
+    g.add_edge("web_search", "answer")
+    g.add_edge("answer", END)
+
+    if topology == "fused":
+        g.add_node("retrieve", _node("retrieve", retrieve_node, aretrieve_node))
+        g.add_node("fused_answer", _node("fused_answer", fused_answer_node, afused_answer_node))
+        g.set_entry_point("retrieve")
+        g.add_conditional_edges("retrieve", after_retrieve,
+                                {"fused": "fused_answer", "answer": "answer", "web": "web_search", "end": END})
+        g.add_conditional_edges("fused_answer", after_fused,
+                                {"end": END, "web": "web_search", "answer": "answer"})
+        return g
+
+    g.add_node("router", _node("router", router_node, arouter_node))
+    g.add_node("rag_lookup", _node("rag_lookup", rag_node, arag_node))
+    g.set_entry_point("router")
+    g.add_conditional_edges("router", from_router,
+                            {"rag": "rag_lookup", "answer": "answer", "end": END})
+    g.add_conditional_edges("rag_lookup", after_rag,
+                            {"answer": "answer", "web": "web_search"})
+    return g
+
+g = build_graph(config.GRAPH_TOPOLOGY)
 
 logger.info("Compiling agent graph...")
-graph_agent = g.compile(checkpointer=MemorySaver())
+checkpointer = BoundedCheckpointSaver(
+    max_threads=config.CHECKPOINT_MAX_THREADS,
+    max_bytes=config.CHECKPOINT_MAX_BYTES,
+    ttl_seconds=config.SESSION_TIMEOUT_SECONDS,
+    max_history=config.CHECKPOINT_MAX_HISTORY,
+    spill_path=config.CHECKPOINT_SPILL_PATH or None,
+)
+compiled_graph = g.compile(checkpointer=checkpointer)
 logger.info("Agent graph compiled successfully.")
+
+# ── Semantic answer cache in front of the graph ─────────────────────
+answer_cache = None
+if config.SEMANTIC_CACHE_ENABLED:
+    answer_cache = SemanticAnswerCache(
+        embed_fn=lambda query: get_embeddings().embed_query(query),
+        version_fn=get_kb_version,
+        threshold=config.SEMANTIC_CACHE_THRESHOLD,
+        max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS,
+    )
+    logger.info(f"Semantic answer cache enabled (threshold={config.SEMANTIC_CACHE_THRESHOLD}).")
+graph_agent = CachedGraphAgent(compiled_graph, answer_cache)
@@ -0,0 +1,166 @@
+import logging
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from src.core import config
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Token counting ──────────────────────────────────────────────────
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        # gpt-4.1 family tokenizer
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # tiktoken missing or its BPE file not downloadable
+        logger.warning(f"tiktoken unavailable ({e}); estimating token counts as len(text) / 4")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cuts `text` to at most `budget` tokens, marking the cut."""
+    if budget <= 0 or count_tokens(text) <= budget:
+        return text
+    metrics.inc("history.truncations")
+    encoding = _encoding()
+    if encoding is None:
+        return text[:budget * 4] + " …[truncated]"
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:budget]) + " …[truncated]"
+
+
+# ── Message history ─────────────────────────────────────────────────
+def _role(message: BaseMessage) -> str:
+    return "User" if isinstance(message, HumanMessage) else "AI"
+
+
+def dedupe_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Drops back-to-back repeats of the same message (same role and content)."""
+    out: List[BaseMessage] = []
+    for message in messages:
+        if out and _role(out[-1]) == _role(message) and out[-1].content == message.content:
+            continue
+        out.append(message)
+    return out
+
+
+def split_turns(messages: Sequence[BaseMessage], recent_turns: int) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Splits the history into (older, recent), where recent holds the last
+    `recent_turns` turns. A turn starts at a user message.
+    """
+    starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if recent_turns <= 0 or len(starts) <= recent_turns:
+        return [], list(messages)
+    cut = starts[-recent_turns]
+    return list(messages[:cut]), list(messages[cut:])
+
+
+def format_history(messages: Sequence[BaseMessage], budget: int) -> str:
+    """
+    Renders messages as "User: …" / "AI: …" lines, keeping the newest ones
+    that fit in `budget` tokens. A single message larger than the budget is
+    truncated rather than dropped.
+    """
+    lines: List[str] = []
+    used = 0
+    for message in reversed(messages):
+        line = f"{_role(message)}: {message.content}"
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            if not lines:
+                lines.append(truncate_to_tokens(line, budget))
+            else:
+                metrics.inc("history.dropped_messages")
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(reversed(lines))
+
+
+def summary_prompt(summary: str, older: Sequence[BaseMessage]):
+    transcript = format_history(older, config.HISTORY_TOKEN_BUDGET)
+    return [
+        ("system", (
+            "You maintain a running summary of a conversation between a user and an AI assistant. "
+            "Update the summary with the new exchanges. Keep names, facts, numbers, decisions and "
+            "open questions; drop greetings and filler. Answer with the updated summary only, in "
+            f"at most {config.HISTORY_SUMMARY_TOKENS} tokens."
+        )),
+        ("user", f"Current summary:\n{summary or '(empty)'}\n\nNew exchanges:\n{transcript}"),
+    ]
+
+
+class HistoryWindow:
+    """
+    The part of a conversation an LLM call gets to see: a rolling summary of
+    older turns plus the most recent turns verbatim. `older` holds the turns
+    that still have to be folded into the summary.
+    """
+
+    def __init__(self, messages: Sequence[BaseMessage], summary: str = "",
+                 recent_turns: Optional[int] = None):
+        recent_turns = config.HISTORY_RECENT_TURNS if recent_turns is None else recent_turns
+        self.older, self.recent = split_turns(dedupe_messages(messages), recent_turns)
+        self.summary = summary or ""
+
+    @property
+    def needs_summary(self) -> bool:
+        return bool(self.older)
+
+    def fold(self, new_summary: str) -> None:
+        self.summary = truncate_to_tokens(new_summary.strip(), config.HISTORY_SUMMARY_TOKENS)
+        metrics.inc("history.summarized_messages", len(self.older))
+        logger.info(f"Folded {len(self.older)} older messages into the conversation summary")
+        self.older = []
+
+    def fold_without_llm(self) -> None:
+        # Fallback when the summary call fails: keep a truncated transcript.
+        transcript = format_history(self.older, config.HISTORY_SUMMARY_TOKENS)
+        self.fold(f"{self.summary}\n{transcript}" if self.summary else transcript)
+
+    def render(self, budget: Optional[int] = None) -> str:
+        budget = config.HISTORY_TOKEN_BUDGET if budget is None else budget
+        history = format_history(self.recent, budget)
+        if self.summary:
+            return f"Summary of earlier conversation:\n{self.summary}\n\n{history}"
+        return history
+
+
+def fold_history(window: HistoryWindow, summarizer) -> None:
+    """Updates the window's summary with its older turns using `summarizer`."""
+    if not window.needs_summary:
+        return
+    try:
+        result = summarizer.invoke(summary_prompt(window.summary, window.older),
+                                   config={"tags": ["history_summary"]})
+        window.fold(result.content)
+    except Exception as e:
+        logger.warning(f"Conversation summary failed, keeping a truncated transcript: {e}")
+        window.fold_without_llm()
+
+
+async def afold_history(window: HistoryWindow, summarizer) -> None:
+    if not window.needs_summary:
+        return
+    try:
+        # Tagged so the UI doesn't stream the summary as part of the answer.
+        result = await summarizer.ainvoke(summary_prompt(window.summary, window.older),
+                                          config={"tags": ["history_summary"]})
+        window.fold(result.content)
+    except Exception as e:
+        logger.warning(f"Conversation summary failed, keeping a truncated transcript: {e}")
+        window.fold_without_llm()
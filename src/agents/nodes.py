@@ -1,139 +1,298 @@
+import time
+import asyncio
 import logging
-from langchain_core.messages import HumanMessage, AIMessage
-from src.core.llm_config import router_llm, judge_llm, answer_llm
-from src.core.state import AgentState, RouteDecision, RagJudge
-from src.tools.rag import rag_search_tool
+from langchain_core.messages import HumanMessage, AIMessage, RemoveMessage
+from langchain_core.runnables import RunnableConfig
+from src.core import config as settings
+from src.core.blobs import resolve
+from src.core.metrics import metrics
+from src.core.llm_config import get_router_llm, get_judge_llm, get_answer_llm, get_summary_llm, get_fused_llm
+from src.core.llm_pool import LLMUnavailable
+from src.core.state import AgentState, RouteDecision, RagJudge, FusedAnswer
+from src.tools.rag import rag_search_with_scores
 from src.tools.web_search import web_search_tool
+from src.tools.uploads import upload_store
+from src.agents.speculation import maybe_speculate
+from src.agents.sufficiency import sufficiency_gate
+from src.agents.prerouter import pre_route
+from src.agents.history import HistoryWindow, fold_history, afold_history, truncate_to_tokens
 
 # ── LOGGING ─────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
+# Each node comes in a sync flavour (graph.invoke) and an async flavour
+# (graph.ainvoke / astream / astream_events). Prompt building and state
+# updates are shared; only the model / tool call differs.
+
+def _latest_query(state: AgentState) -> str:
+    return next((m.content for m in reversed(state.get("messages", []))
+                 if isinstance(m, HumanMessage)), "")
+
 # ── Node 1: decision/router ─────────────────────────────────────────
-def router_node(state: AgentState) -> AgentState:
-    try:
-        logger.info("Entering router_node")
-        user_msgs = [m for m in state.get("messages", []) if isinstance(m, HumanMessage)]
-        query = user_msgs[-1].content if user_msgs else ""
-        logger.info(f"Router query: {query}")
-
-        file_ctx = state.get("upload_file_content", "").strip()
-        has_file = bool(file_ctx)
-
-        system_prompt = (
-            "You are a router that decides how to handle user queries.\n"
-            "- If the user is just greeting or small‑talk, return route='end'.\n"
-            "- If upload_file_content is non‑empty, return route='answer' so the assistant "
-            "can answer directly from that content.\n"
-            "- Otherwise, if the question needs domain knowledge from the KB, return route='rag'.\n"
-            "- If RAG lookup is not enough, return route='web'.\n"
-            "- If you can answer without any external info, return route='answer'.\n\n"
-            f"Upload present? {'Yes' if has_file else 'No'}"
-        )
+def _router_query(state: AgentState):
+    user_msgs = [m for m in state.get("messages", []) if isinstance(m, HumanMessage)]
+    query = user_msgs[-1].content if user_msgs else ""
+    logger.info(f"Router query: {query}")
+
+    # Only the turn that brings a document is forced to "answer"; later turns
+    # in the session are routed normally and still see its excerpts.
+    file_ctx = resolve(state.get("upload_file_content")).strip()
+    return query, bool(file_ctx or state.get("new_upload"))
+
+def _router_prompt(query: str, has_file: bool):
+    system_prompt = (
+        "You are a router that decides how to handle user queries.\n"
+        "- If the user is just greeting or small‑talk, return route='end'.\n"
+        "- If upload_file_content is non‑empty, return route='answer' so the assistant "
+        "can answer directly from that content.\n"
+        "- Otherwise, if the question needs domain knowledge from the KB, return route='rag'.\n"
+        "- If RAG lookup is not enough, return route='web'.\n"
+        "- If you can answer without any external info, return route='answer'.\n\n"
+        f"Upload present? {'Yes' if has_file else 'No'}"
+    )
+    return [("system", system_prompt), ("user", truncate_to_tokens(query, settings.ROUTER_TOKEN_BUDGET))]
+
+def _router_update(state: AgentState, query: str, decision: RouteDecision) -> AgentState:
+    logger.info(f"Router decision: {decision.route}")
+
+    messages = state.get("messages", [])
+    # The turn's HumanMessage normally arrives with the input already.
+    new_msgs = []
+    if not (messages and isinstance(messages[-1], HumanMessage) and messages[-1].content == query):
+        new_msgs.append(HumanMessage(content=query))
+    if decision.route == "end":
+        new_msgs.append(AIMessage(content=decision.reply or "Hello!"))
+
+    # Context retrieved for an earlier turn must not leak into this one.
+    out: AgentState = {"route": decision.route, "rag": "", "web": ""}
+    if new_msgs:
+        out["messages"] = new_msgs
+    return out
+
+# When the model is unavailable (retries exhausted or circuit open) each node
+# degrades instead of failing the turn: the router defaults to the knowledge
+# base, the judge accepts the retrieved chunks and the answer apologises.
+ROUTER_FALLBACK = RouteDecision(route="rag")
+UNAVAILABLE_ANSWER = ("Sorry, I can't reach the language model right now. "
+                      "Please try again in a moment.")
 
-        decision: RouteDecision = router_llm.invoke([
-            ("system", system_prompt),
-            ("user", query)
-        ])
-        logger.info(f"Router decision: {decision.route}")
+def _router_degraded(e: LLMUnavailable) -> RouteDecision:
+    logger.warning(f"Router LLM unavailable, routing to RAG: {e}")
+    metrics.inc("router.degraded")
+    return ROUTER_FALLBACK
 
-        new_msgs = state.get("messages", []) + [HumanMessage(content=query)]
-        out: AgentState = {
-            **state,
-            "messages": new_msgs,
-            "route": decision.route
-        }
+def _judge_degraded(e: LLMUnavailable) -> RagJudge:
+    logger.warning(f"Judge LLM unavailable, answering from retrieved chunks: {e}")
+    metrics.inc("rag.judge_degraded")
+    return RagJudge(sufficient=True)
 
-        if decision.route == "end":
-            out["messages"] = new_msgs + [
-                AIMessage(content=decision.reply or "Hello!")
-            ]
+def _answer_degraded(e: LLMUnavailable) -> str:
+    logger.warning(f"Answer LLM unavailable: {e}")
+    metrics.inc("answer.degraded")
+    return UNAVAILABLE_ANSWER
 
+def router_node(state: AgentState) -> AgentState:
+    try:
+        logger.info("Entering router_node")
+        query, has_file = _router_query(state)
+        # Deterministic and easy turns are routed locally; router_llm only
+        # sees what the pre-router is not confident about.
+        decision = pre_route(query, has_file)
+        if decision is None:
+            try:
+                decision: RouteDecision = get_router_llm().invoke(_router_prompt(query, has_file))
+            except LLMUnavailable as e:
+                decision = _router_degraded(e)
+        out = _router_update(state, query, decision)
         logger.info("Exiting router_node")
         return out
     except Exception as e:
         logger.error(f"Error in router_node: {e}")
         raise
 
+async def arouter_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    try:
+        logger.info("Entering arouter_node")
+        query, has_file = _router_query(state)
+        decision = await asyncio.to_thread(pre_route, query, has_file)
+        if decision is None:
+            try:
+                decision: RouteDecision = await get_router_llm().ainvoke(_router_prompt(query, has_file), config=config)
+            except LLMUnavailable as e:
+                decision = _router_degraded(e)
+        out = _router_update(state, query, decision)
+        logger.info("Exiting arouter_node")
+        return out
+    except Exception as e:
+        logger.error(f"Error in arouter_node: {e}")
+        raise
+
 # ── Node 2: RAG lookup ───────────────────────────────────────────────
+def _judge_prompt(query: str, chunks: str):
+    chunks = truncate_to_tokens(chunks, settings.JUDGE_TOKEN_BUDGET)
+    return [
+        ("system", ("You are a judge evaluating if the retrieved information is sufficient "
+            "to answer the user's question. Consider both relevance and completeness."
+        )),
+        ("user", f"Question: {query}\n\nRetrieved info: {chunks}\n\nIs this sufficient to answer the question?")
+    ]
+
+def _maybe_audit(query: str, chunks: str, scores, decision) -> None:
+    # Judges a sample of fast-path turns in the background for calibration.
+    if sufficiency_gate.should_audit(decision):
+        sufficiency_gate.audit(
+            scores, decision, lambda: get_judge_llm().invoke(_judge_prompt(query, chunks)).sufficient
+        )
+
+def _rag_update(state: AgentState, chunks: str, verdict: RagJudge, web: str | None = None) -> AgentState:
+    logger.info(f"RAG judge verdict: {'sufficient' if verdict.sufficient else 'insufficient'}")
+    metrics.inc("rag.turns")
+    if not verdict.sufficient:
+        metrics.inc("rag.web_fallbacks")
+    if web is not None:
+        # A speculative web search already produced the fallback context, so
+        # the web_search node can be skipped.
+        return {"rag": chunks, "web": web, "route": "answer"}
+    return {
+        "rag": chunks,
+        "route": "answer" if verdict.sufficient else "web"
+    }
+
 def rag_node(state: AgentState) -> AgentState:
+    speculative = None
     try:
         logger.info("Entering rag_node")
-        query = next((m.content for m in reversed(state["messages"])
-                      if isinstance(m, HumanMessage)), "")
+        query = _latest_query(state)
         logger.info(f"RAG query: {query}")
+        speculative = maybe_speculate(query, "on_rag_route")
 
-        chunks = rag_search_tool.invoke({"query": query})
+        chunks, scores = rag_search_with_scores(query)
         logger.info(f"RAG retrieved {len(chunks)} chunks")
 
-        judge_messages = [
-            ("system", ("You are a judge evaluating if the retrieved information is sufficient "
-                "to answer the user's question. Consider both relevance and completeness."
-            )),
-            ("user", f"Question: {query}\n\nRetrieved info: {chunks}\n\nIs this sufficient to answer the question?")
-        ]
-
-        verdict: RagJudge = judge_llm.invoke(judge_messages)
-        logger.info(f"RAG judge verdict: {'sufficient' if verdict.sufficient else 'insufficient'}")
-
+        decision = sufficiency_gate.decide(scores)
+        if decision == "judge":
+            speculative = speculative or maybe_speculate(query, "with_judge")
+            try:
+                verdict: RagJudge = get_judge_llm().invoke(_judge_prompt(query, chunks))
+                sufficiency_gate.record(scores, verdict.sufficient)
+            except LLMUnavailable as e:
+                verdict = _judge_degraded(e)
+        else:
+            logger.info(f"Skipping RAG judge: retrieval scores decide '{decision}'")
+            verdict = RagJudge(sufficient=decision == "answer")
+            _maybe_audit(query, chunks, scores, decision)
+        web = speculative.resolve(not verdict.sufficient, time.perf_counter()) if speculative else None
+        out = _rag_update(state, chunks, verdict, web)
         logger.info("Exiting rag_node")
-        return {
-            **state,
-            "rag": chunks,
-            "route": "answer" if verdict.sufficient else "web"
-        }
+        return out
     except Exception as e:
         logger.error(f"Error in rag_node: {e}")
         raise
+    finally:
+        if speculative is not None:
+            speculative.release()
+
+async def arag_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    speculative = None
+    try:
+        logger.info("Entering arag_node")
+        query = _latest_query(state)
+        logger.info(f"RAG query: {query}")
+        speculative = maybe_speculate(query, "on_rag_route")
+
+        chunks, scores = await asyncio.to_thread(rag_search_with_scores, query)
+        logger.info(f"RAG retrieved {len(chunks)} chunks")
+
+        decision = sufficiency_gate.decide(scores)
+        if decision == "judge":
+            speculative = speculative or maybe_speculate(query, "with_judge")
+            try:
+                verdict: RagJudge = await get_judge_llm().ainvoke(_judge_prompt(query, chunks), config=config)
+                sufficiency_gate.record(scores, verdict.sufficient)
+            except LLMUnavailable as e:
+                verdict = _judge_degraded(e)
+        else:
+            logger.info(f"Skipping RAG judge: retrieval scores decide '{decision}'")
+            verdict = RagJudge(sufficient=decision == "answer")
+            _maybe_audit(query, chunks, scores, decision)
+        web = await speculative.aresolve(not verdict.sufficient, time.perf_counter()) if speculative else None
+        out = _rag_update(state, chunks, verdict, web)
+        logger.info("Exiting arag_node")
+        return out
+    except Exception as e:
+        logger.error(f"Error in arag_node: {e}")
+        raise
+    finally:
+        if speculative is not None:
+            speculative.release()
 
 # ── Node 3: web search ───────────────────────────────────────────────
 def web_node(state: AgentState) -> AgentState:
     try:
         logger.info("Entering web_node")
-        query = next((m.content for m in reversed(state["messages"])
-                      if isinstance(m, HumanMessage)), "")
+        query = _latest_query(state)
         logger.info(f"Web search query: {query}")
 
         snippets = web_search_tool.invoke({"query": query})
         logger.info(f"Web search retrieved {len(snippets)} snippets")
 
         logger.info("Exiting web_node")
-        return {**state, "web": snippets, "route": "answer"}
+        return {"web": snippets, "route": "answer"}
     except Exception as e:
         logger.error(f"Error in web_node: {e}")
         raise
 
+async def aweb_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    try:
+        logger.info("Entering aweb_node")
+        query = _latest_query(state)
+        logger.info(f"Web search query: {query}")
+
+        snippets = await web_search_tool.ainvoke({"query": query}, config=config)
+        logger.info(f"Web search retrieved {len(snippets)} snippets")
+
+        logger.info("Exiting aweb_node")
+        return {"web": snippets, "route": "answer"}
+    except Exception as e:
+        logger.error(f"Error in aweb_node: {e}")
+        raise
+
 # ── Node 4: final answer ─────────────────────────────────────────────
-def answer_node(state: AgentState) -> AgentState:
+def _upload_context(state: AgentState) -> str:
+    """Chunks of the session's uploaded documents relevant to the latest query."""
+    session = state.get("upload_session")
+    if not session:
+        return ""
     try:
-        logger.info("Entering answer_node")
-        user_q = next(
-            (m.content for m in reversed(state["messages"])
-             if isinstance(m, HumanMessage)),
-            ""
-        )
-        logger.info(f"Answer node query: {user_q}")
+        return upload_store.search(session, _latest_query(state))
+    except Exception as e:
+        logger.error(f"Upload search failed: {e}")
+        return ""
 
-        chat_history = "\n".join(
-            f"{'User' if isinstance(m, HumanMessage) else 'AI'}: {m.content}"
-            for m in state["messages"]
-        )
+def _answer_prompt(state: AgentState, window: HistoryWindow, upload_ctx: str = "") -> str:
+    user_q = _latest_query(state)
+    logger.info(f"Answer node query: {user_q}")
 
-        file_ctx = state.get("upload_file_content", "").strip()
-        rag_ctx = state.get("rag", "").strip()
-        web_ctx = state.get("web", "").strip()
+    chat_history = window.render()
 
-        if file_ctx:
-            context = f"Uploaded PDF (first ≤2 pages):\n{file_ctx}"
-        else:
-            parts = []
-            if rag_ctx:
-                parts.append("Knowledge Base:\n" + rag_ctx)
-            if web_ctx:
-                parts.append("Web Search:\n" + web_ctx)
-            context = "\n\n".join(parts) if parts else "No external context available."
-        logger.info(f"Answer node context: {context}")
-
-        prompt = f"""
+    file_ctx = "\n\n".join(
+        part for part in (upload_ctx.strip(), resolve(state.get("upload_file_content")).strip()) if part
+    )
+    rag_ctx = resolve(state.get("rag")).strip()
+    web_ctx = resolve(state.get("web")).strip()
+
+    parts = []
+    if file_ctx:
+        parts.append("Uploaded PDF excerpts:\n" + file_ctx)
+    if rag_ctx:
+        parts.append("Knowledge Base:\n" + rag_ctx)
+    if web_ctx:
+        parts.append("Web Search:\n" + web_ctx)
+    context = "\n\n".join(parts) if parts else "No external context available."
+    context = truncate_to_tokens(context, settings.ANSWER_CONTEXT_TOKEN_BUDGET)
+    logger.debug("Answer node context: %s", context)
+
+    return f"""
 You are a helpful assistant. Use the information below to answer the user's latest question.
 
 Conversation so far:
@@ -146,14 +305,173 @@ Now answer clearly and concisely:
 Question: {user_q}
 """
 
-        answer = answer_llm.invoke([HumanMessage(content=prompt)]).content
-        logger.info(f"Generated answer: {answer}")
+def _history_update(state: AgentState, window: HistoryWindow, new_messages: list) -> AgentState:
+    # Turns folded into the summary (and repeats) are removed from the state
+    # as well, so the checkpoint doesn't grow with the conversation either.
+    kept = {m.id for m in window.recent}
+    dropped = [RemoveMessage(id=m.id) for m in state.get("messages", []) if m.id not in kept]
+    return {
+        "messages": dropped + new_messages,
+        "summary": window.summary,
+    }
 
+def _answer_update(state: AgentState, window: HistoryWindow, answer: str) -> AgentState:
+    logger.debug("Generated answer: %s", answer)
+    return _history_update(state, window, [AIMessage(content=answer)])
+
+def answer_node(state: AgentState) -> AgentState:
+    try:
+        logger.info("Entering answer_node")
+        window = HistoryWindow(state.get("messages", []), state.get("summary", ""))
+        fold_history(window, get_summary_llm())
+        prompt = _answer_prompt(state, window, _upload_context(state))
+        try:
+            answer = get_answer_llm().invoke([HumanMessage(content=prompt)]).content
+        except LLMUnavailable as e:
+            answer = _answer_degraded(e)
+        out = _answer_update(state, window, answer)
         logger.info("Exiting answer_node")
-        return {
-            **state,
-            "messages": state["messages"] + [AIMessage(content=answer)]
-        }
+        return out
     except Exception as e:
         logger.error(f"Error in answer_node: {e}")
         raise
+
+async def aanswer_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    try:
+        logger.info("Entering aanswer_node")
+        window = HistoryWindow(state.get("messages", []), state.get("summary", ""))
+        await afold_history(window, get_summary_llm())
+        upload_ctx = await asyncio.to_thread(_upload_context, state)
+        prompt = _answer_prompt(state, window, upload_ctx)
+        # Passing the config through lets astream_events pick up the token
+        # stream of this call.
+        try:
+            answer = (await get_answer_llm().ainvoke([HumanMessage(content=prompt)], config=config)).content
+        except LLMUnavailable as e:
+            answer = _answer_degraded(e)
+        out = _answer_update(state, window, answer)
+        logger.info("Exiting aanswer_node")
+        return out
+    except Exception as e:
+        logger.error(f"Error in aanswer_node: {e}")
+        raise
+
+# ── Fused topology (GRAPH_TOPOLOGY=fused) ────────────────────────────
+# retrieve runs the pre-router and the KB search without any LLM call; only
+# retrieval scores in the sufficiency gate's ambiguous band reach
+# fused_answer, whose single call answers or flags the context insufficient.
+FUSED_INSTRUCTIONS = (
+    "Answer the user's latest question. If the knowledge base context, the conversation and "
+    "general knowledge are not enough to answer it correctly (for example it asks about recent "
+    "events, live data or facts missing from the context), set sufficient=false and leave the "
+    "answer empty; a web search will be run instead. Otherwise set sufficient=true."
+)
+
+def _retrieve_update(state: AgentState, query: str, chunks: str, scores) -> AgentState:
+    logger.info(f"RAG retrieved {len(chunks)} chunks")
+    decision = sufficiency_gate.decide(scores)
+    _maybe_audit(query, chunks, scores, decision)
+    metrics.inc("rag.turns")
+    if decision == "web":
+        metrics.inc("rag.web_fallbacks")
+    # Appends the turn's HumanMessage if the input didn't carry it.
+    out = _router_update(state, query, RouteDecision(route="rag"))
+    return {**out, "rag": chunks, "route": "fused" if decision == "judge" else decision}
+
+def retrieve_node(state: AgentState) -> AgentState:
+    try:
+        logger.info("Entering retrieve_node")
+        query, has_file = _router_query(state)
+        decision = pre_route(query, has_file)
+        if decision is not None and decision.route != "rag":
+            out = _router_update(state, query, decision)
+        else:
+            chunks, scores = rag_search_with_scores(query)
+            out = _retrieve_update(state, query, chunks, scores)
+        logger.info("Exiting retrieve_node")
+        return out
+    except Exception as e:
+        logger.error(f"Error in retrieve_node: {e}")
+        raise
+
+async def aretrieve_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    try:
+        logger.info("Entering aretrieve_node")
+        query, has_file = _router_query(state)
+        decision = await asyncio.to_thread(pre_route, query, has_file)
+        if decision is not None and decision.route != "rag":
+            out = _router_update(state, query, decision)
+        else:
+            chunks, scores = await asyncio.to_thread(rag_search_with_scores, query)
+            out = _retrieve_update(state, query, chunks, scores)
+        logger.info("Exiting aretrieve_node")
+        return out
+    except Exception as e:
+        logger.error(f"Error in aretrieve_node: {e}")
+        raise
+
+def _fused_prompt(state: AgentState, window: HistoryWindow, upload_ctx: str = ""):
+    return [("system", FUSED_INSTRUCTIONS), ("user", _answer_prompt(state, window, upload_ctx))]
+
+def _fused_update(state: AgentState, window: HistoryWindow, result: FusedAnswer,
+                  web: str | None = None) -> AgentState:
+    if result.sufficient and result.answer.strip():
+        metrics.inc("fused.answered")
+        return {**_answer_update(state, window, result.answer), "route": "end"}
+    logger.info("Fused call flagged the context as insufficient, falling back to web search")
+    metrics.inc("fused.web_fallbacks")
+    metrics.inc("rag.web_fallbacks")
+    # The history is already folded, so the answer node won't summarise again.
+    out = _history_update(state, window, [])
+    if web is not None:
+        return {**out, "web": web, "route": "answer"}
+    return {**out, "route": "web"}
+
+def fused_answer_node(state: AgentState) -> AgentState:
+    speculative = None
+    try:
+        logger.info("Entering fused_answer_node")
+        query = _latest_query(state)
+        speculative = maybe_speculate(query, "on_rag_route") or maybe_speculate(query, "with_judge")
+        window = HistoryWindow(state.get("messages", []), state.get("summary", ""))
+        fold_history(window, get_summary_llm())
+        prompt = _fused_prompt(state, window, _upload_context(state))
+        try:
+            result: FusedAnswer = get_fused_llm().invoke(prompt)
+        except LLMUnavailable as e:
+            return {**_answer_update(state, window, _answer_degraded(e)), "route": "end"}
+        web = speculative.resolve(not result.sufficient, time.perf_counter()) if speculative else None
+        out = _fused_update(state, window, result, web)
+        logger.info("Exiting fused_answer_node")
+        return out
+    except Exception as e:
+        logger.error(f"Error in fused_answer_node: {e}")
+        raise
+    finally:
+        if speculative is not None:
+            speculative.release()
+
+async def afused_answer_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    speculative = None
+    try:
+        logger.info("Entering afused_answer_node")
+        query = _latest_query(state)
+        speculative = maybe_speculate(query, "on_rag_route") or maybe_speculate(query, "with_judge")
+        window = HistoryWindow(state.get("messages", []), state.get("summary", ""))
+        await afold_history(window, get_summary_llm())
+        upload_ctx = await asyncio.to_thread(_upload_context, state)
+        prompt = _fused_prompt(state, window, upload_ctx)
+        try:
+            result: FusedAnswer = await get_fused_llm().ainvoke(prompt, config=config)
+        except LLMUnavailable as e:
+            return {**_answer_update(state, window, _answer_degraded(e)), "route": "end"}
+        web = await speculative.aresolve(not result.sufficient, time.perf_counter()) if speculative else None
+        out = _fused_update(state, window, result, web)
+        logger.info("Exiting afused_answer_node")
+        return out
+    except Exception as e:
+        logger.error(f"Error in afused_answer_node: {e}")
+        raise
+    finally:
+        if speculative is not None:
+            speculative.release()
@@ -0,0 +1,223 @@
+import re
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core import config
+from src.core.lazy import Lazy
+from src.core.metrics import metrics
+from src.core.state import RouteDecision
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Tier 1: deterministic rules ─────────────────────────────────────
+_GREETING = re.compile(
+    r"^(hi|hii+|hello|hey|hey there|hi there|hello there|yo|hiya|greetings|"
+    r"good (morning|afternoon|evening|day))[\s!.,:)]*$",
+    re.IGNORECASE,
+)
+_THANKS = re.compile(r"^(thanks|thank you|thx|ty|cheers)( (so|very) much)?[\s!.,:)]*$", re.IGNORECASE)
+_GOODBYE = re.compile(r"^(bye|goodbye|see you|see ya|cya)[\s!.,:)]*$", re.IGNORECASE)
+
+END_REPLIES: Dict[str, str] = {
+    "greeting": "Hello! How can I help you today?",
+    "thanks": "You're welcome! Let me know if there's anything else I can help with.",
+    "goodbye": "Goodbye! Feel free to come back any time.",
+}
+
+_RULE_REPLIES = [
+    (_GREETING, END_REPLIES["greeting"]),
+    (_THANKS, END_REPLIES["thanks"]),
+    (_GOODBYE, END_REPLIES["goodbye"]),
+]
+
+
+def route_by_rules(query: str, has_file: bool) -> Optional[RouteDecision]:
+    """The cases the router prompt already treats as deterministic."""
+    if has_file:
+        return RouteDecision(route="answer")
+    text = query.strip()
+    for pattern, reply in _RULE_REPLIES:
+        if pattern.match(text):
+            return RouteDecision(route="end", reply=reply)
+    return None
+
+
+# ── Tier 2: nearest-centroid classifier ─────────────────────────────
+# Labelled examples for each route. They are embedded once (the embedding
+# cache keeps them across restarts) and averaged into one centroid per route.
+# The "end" examples are grouped by the kind of reply they get; an "end"
+# turn is answered with the reply of its nearest example.
+DEFAULT_END_EXAMPLES: Dict[str, List[str]] = {
+    "greeting": ["hi", "hello there, how are you?", "good morning!", "nice to meet you"],
+    "thanks": ["thanks a lot", "thank you, that was helpful"],
+    "goodbye": ["ok, bye", "that's all for now, goodbye"],
+}
+
+DEFAULT_EXAMPLES: Dict[str, List[str]] = {
+    "rag": [
+        "What is the aim of the Starx AI technology?",
+        "Who is the CEO of Starx AI technology?",
+        "Who founded Starx AI?",
+        "What products does Starx AI offer?",
+        "Where is Starx AI headquartered?",
+        "What does the Starx AI research report say about the company?",
+        "Tell me about Starx AI's mission and vision.",
+        "What services does the company provide?",
+    ],
+    "answer": [
+        "Explain what a neural network is.",
+        "Write a short poem about the sea.",
+        "What is 15 times 12?",
+        "Translate 'good morning' into French.",
+        "Summarize our conversation so far.",
+        "Can you rephrase your last answer more simply?",
+        "What is the difference between a list and a tuple in Python?",
+    ],
+    "end": [text for texts in DEFAULT_END_EXAMPLES.values() for text in texts],
+}
+
+
+class CentroidRouter:
+    """
+    Classifies a query by cosine similarity to the centroid of each route's
+    labelled examples. A prediction is only trusted when the best similarity
+    is at least `min_similarity` and beats the runner-up by `min_margin`.
+    An "end" prediction takes the reply of the nearest of `end_examples`
+    ({reply kind: texts}, kinds from END_REPLIES); without any it is left to
+    the router LLM.
+    """
+
+    def __init__(self, embed_query: Callable[[str], List[float]],
+                 embed_documents: Callable[[List[str]], List[List[float]]],
+                 examples: Dict[str, List[str]], min_similarity: float, min_margin: float,
+                 end_examples: Optional[Dict[str, List[str]]] = None):
+        self._embed_query = embed_query
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.labels = [label for label, texts in examples.items() if texts]
+        centroids = []
+        for label in self.labels:
+            vectors = self._embed_unit(embed_documents, examples[label])
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        self._centroids = np.stack(centroids)
+        end_pairs = [(kind, text) for kind, texts in (end_examples or {}).items()
+                     if kind in END_REPLIES for text in texts]
+        self._end_kinds = [kind for kind, _ in end_pairs]
+        self._end_vectors = (self._embed_unit(embed_documents, [text for _, text in end_pairs])
+                             if end_pairs else None)
+
+    @staticmethod
+    def _embed_unit(embed_documents, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(embed_documents(texts), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def _query_vector(self, query: str) -> np.ndarray:
+        vector = np.asarray(self._embed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def predict(self, query: str) -> Tuple[str, float, float]:
+        """Returns (label, similarity, margin over the runner-up)."""
+        return self._classify(self._query_vector(query))
+
+    def _classify(self, vector: np.ndarray) -> Tuple[str, float, float]:
+        scores = self._centroids @ vector
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        margin = best - float(scores[order[1]]) if len(order) > 1 else best
+        return self.labels[order[0]], best, margin
+
+    def end_reply(self, vector: np.ndarray) -> Optional[str]:
+        """The reply of the "end" example nearest to a (unit) query vector."""
+        if self._end_vectors is None:
+            return None
+        kind = self._end_kinds[int(np.argmax(self._end_vectors @ vector))]
+        return END_REPLIES[kind]
+
+    def route(self, query: str) -> Optional[RouteDecision]:
+        vector = self._query_vector(query)
+        label, similarity, margin = self._classify(vector)
+        if similarity < self.min_similarity or margin < self.min_margin:
+            logger.info(f"Pre-router not confident (label={label}, sim={similarity:.3f}, margin={margin:.3f})")
+            return None
+        logger.info(f"Pre-router classified query as '{label}' (sim={similarity:.3f}, margin={margin:.3f})")
+        if label == "end":
+            reply = self.end_reply(vector)
+            return RouteDecision(route="end", reply=reply) if reply is not None else None
+        return RouteDecision(route=label)
+
+
+def _load_examples() -> Dict[str, List[str]]:
+    examples = {label: list(texts) for label, texts in DEFAULT_EXAMPLES.items()}
+    path = config.PREROUTER_EXAMPLES_PATH
+    if path:
+        # One {"text": ..., "route": ...} object per line.
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        examples.setdefault(record["route"], []).append(record["text"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring pre-router examples file {path}: {e}")
+    return examples
+
+
+def _build_classifier() -> CentroidRouter:
+    from src.tools.rag import get_embeddings
+    embeddings = get_embeddings()
+    return CentroidRouter(
+        embed_query=embeddings.embed_query,
+        embed_documents=embeddings.embed_documents,
+        examples=_load_examples(),
+        min_similarity=config.PREROUTER_MIN_SIMILARITY,
+        min_margin=config.PREROUTER_MIN_MARGIN,
+        end_examples=DEFAULT_END_EXAMPLES,
+    )
+
+
+_classifier: Lazy[CentroidRouter] = Lazy("router_classifier", _build_classifier)
+
+
+# ── Tiered entry point ──────────────────────────────────────────────
+def pre_route(query: str, has_file: bool) -> Optional[RouteDecision]:
+    """
+    Tries the local tiers in order and returns a decision, or None when the
+    turn should go to router_llm. Counts which tier decided under
+    "router.tier.<rules|classifier|llm>".
+    """
+    if not config.PREROUTER_ENABLED:
+        metrics.inc("router.tier.llm")
+        return None
+
+    decision = route_by_rules(query, has_file)
+    if decision is not None:
+        metrics.inc("router.tier.rules")
+        return decision
+
+    if config.PREROUTER_CLASSIFIER and query.strip():
+        try:
+            decision = _classifier.get().route(query)
+        except Exception as e:
+            logger.warning(f"Pre-router classifier failed, falling back to router_llm: {e}")
+            decision = None
+        if decision is not None:
+            metrics.inc("router.tier.classifier")
+            return decision
+
+    metrics.inc("router.tier.llm")
+    return None
+
+
+def routing_mix() -> dict:
+    counts = {tier: metrics.get(f"router.tier.{tier}") for tier in ("rules", "classifier", "llm")}
+    total = sum(counts.values())
+    return {
+        **counts,
+        "total": total,
+        "llm_calls_avoided_ratio": (total - counts["llm"]) / total if total else 0.0,
+    }
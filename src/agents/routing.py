@@ -19,3 +19,13 @@ def after_rag(st: AgentState) -> Literal["answer", "web"]:
 def after_web(_) -> Literal["answer"]:
     logger.info("Routing after web search to answer")
     return "answer"
+
+def after_retrieve(st: AgentState) -> Literal["fused", "answer", "web", "end"]:
+    route = st["route"]
+    logger.info(f"Routing after retrieval: {route}")
+    return route
+
+def after_fused(st: AgentState) -> Literal["end", "web", "answer"]:
+    route = st["route"]
+    logger.info(f"Routing after fused answer: {route}")
+    return route
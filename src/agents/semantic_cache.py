@@ -0,0 +1,354 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.messages import HumanMessage, AIMessage
+
+from src.core.blobs import resolve
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+@dataclass
+class _Entry:
+    query: str
+    vector: np.ndarray
+    answer: str
+    created_at: float
+
+
+# ── Semantic answer cache ───────────────────────────────────────────
+class SemanticAnswerCache:
+    """
+    Caches final answers keyed on the query embedding. A lookup returns the
+    answer of the most similar cached question if its cosine similarity is at
+    least `threshold`. Entries are tagged with the KB version they were produced
+    against and the whole cache is dropped as soon as that version changes.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        version_fn: Callable[[], str],
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+    ):
+        self._embed_fn = embed_fn
+        self._version_fn = version_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_text: dict = {}
+        self._next_id = 0
+        self._version: Optional[str] = None
+        # Stacked, L2-normalised vectors; rebuilt lazily after mutations.
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+    # -- internal helpers (caller holds the lock) -----------------------
+    def _check_version(self) -> None:
+        current = self._version_fn()
+        if self._version is not None and current != self._version:
+            logger.info(f"KB version changed ({self._version} -> {current}); clearing semantic cache")
+            metrics.inc("semantic_cache.invalidations")
+            self._clear()
+        self._version = current
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._by_text.clear()
+        self._matrix = None
+        self._matrix_ids = []
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._by_text.pop(_normalize(entry.query), None)
+            self._matrix = None
+
+    def _expire(self, now: float) -> None:
+        # Entries are kept in recency order, but TTL is measured from insertion,
+        # so a full scan is required. The cache is small enough for this.
+        expired = [k for k, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+        for key in expired:
+            self._remove(key)
+        if expired:
+            metrics.inc("semantic_cache.expired", len(expired))
+
+    def _best_match(self, vector: np.ndarray) -> Tuple[Optional[int], float]:
+        if not self._entries:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[k].vector for k in self._matrix_ids])
+        scores = self._matrix @ vector
+        idx = int(np.argmax(scores))
+        return self._matrix_ids[idx], float(scores[idx])
+
+    @staticmethod
+    def _to_unit(vector: List[float]) -> np.ndarray:
+        arr = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(arr)
+        return arr / norm if norm else arr
+
+    # -- public API -----------------------------------------------------
+    def lookup(self, query: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Returns (answer, query_vector). `answer` is None on a miss; the vector is
+        handed back so that `store` does not have to embed the query again.
+        """
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._expire(now)
+            key = self._by_text.get(_normalize(query))
+            if key is not None:
+                self._entries.move_to_end(key)
+                metrics.inc("semantic_cache.hits")
+                metrics.inc("semantic_cache.exact_hits")
+                return self._entries[key].answer, None
+
+        vector = self._to_unit(self._embed_fn(query))
+
+        with self._lock:
+            key, score = self._best_match(vector)
+            if key is not None and score >= self.threshold:
+                self._entries.move_to_end(key)
+                metrics.inc("semantic_cache.hits")
+                logger.info(f"Semantic cache hit (similarity={score:.3f}) for query: {query}")
+                return self._entries[key].answer, vector
+        metrics.inc("semantic_cache.misses")
+        return None, vector
+
+    def store(self, query: str, answer: str, vector: Optional[np.ndarray] = None) -> None:
+        if vector is None:
+            vector = self._to_unit(self._embed_fn(query))
+        with self._lock:
+            self._check_version()
+            existing = self._by_text.get(_normalize(query))
+            if existing is not None:
+                self._remove(existing)
+            key = self._next_id
+            self._next_id += 1
+            self._entries[key] = _Entry(query=query, vector=vector, answer=answer, created_at=time.time())
+            self._by_text[_normalize(query)] = key
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                metrics.inc("semantic_cache.evictions")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        hits = metrics.get("semantic_cache.hits")
+        misses = metrics.get("semantic_cache.misses")
+        total = hits + misses
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "size": size,
+            "hits": hits,
+            "misses": misses,
+            "bypassed": metrics.get("semantic_cache.bypassed"),
+            "evictions": metrics.get("semantic_cache.evictions"),
+            "expired": metrics.get("semantic_cache.expired"),
+            "invalidations": metrics.get("semantic_cache.invalidations"),
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+# ── Graph wrapper ───────────────────────────────────────────────────
+class CachedGraphAgent:
+    """
+    Sits in front of the compiled graph. `invoke`, `ainvoke`, `stream`,
+    `astream` and `astream_events` answer from the semantic cache when they
+    can and otherwise run the graph and cache the grounded answer. Only the
+    first turn of a thread uses the cache, since later turns may depend on the
+    conversation. Every other attribute is delegated to the wrapped graph.
+    """
+
+    def __init__(self, graph, cache: Optional[SemanticAnswerCache]):
+        self._graph = graph
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._graph, name)
+
+    @staticmethod
+    def _latest_query(inputs: dict) -> str:
+        return next((m.content for m in reversed(inputs.get("messages", []))
+                     if isinstance(m, HumanMessage)), "")
+
+    def _thread_values(self, config: Optional[dict]) -> dict:
+        if not config or "thread_id" not in config.get("configurable", {}):
+            return {}
+        try:
+            return dict(self._graph.get_state(config).values or {})
+        except Exception as e:
+            logger.warning(f"Could not read checkpoint state: {e}")
+            return {}
+
+    def _record_cached_turn(self, config: Optional[dict], query: str, answer: str, values: dict) -> dict:
+        """Appends the cached turn to the thread checkpoint (currently `values`) so history stays consistent."""
+        turn = [HumanMessage(content=query), AIMessage(content=answer)]
+        messages = list(values.get("messages", [])) + turn
+        if config and "thread_id" in config.get("configurable", {}):
+            try:
+                # `messages` is appended to by its reducer, so only the new turn is written.
+                self._graph.update_state(config, {"messages": turn, "route": "answer"}, as_node="answer")
+            except Exception as e:
+                logger.warning(f"Could not record cached turn in checkpoint: {e}")
+        return {**values, "messages": messages, "route": "answer"}
+
+    def _lookup(self, inputs: dict, config: Optional[dict]):
+        """
+        Returns (query, cached_answer, vector, thread_values); query is None when
+        the cache is bypassed. Only a thread's first turn is looked up: a
+        follow-up like "who is its CEO?" means something else in another thread.
+        """
+        query = self._latest_query(inputs)
+        if self.cache is None or not query:
+            return None, None, None, {}
+        if (inputs.get("upload_file_content") or "").strip() or inputs.get("upload_session"):
+            metrics.inc("semantic_cache.bypassed")
+            return None, None, None, {}
+        values = self._thread_values(config)
+        asked = sum(isinstance(m, HumanMessage) for m in inputs.get("messages", []))
+        if values.get("messages") or asked > 1:
+            metrics.inc("semantic_cache.bypassed")
+            return None, None, None, values
+        try:
+            answer, vector = self.cache.lookup(query)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed, running graph: {e}")
+            answer, vector = None, None
+        return query, answer, vector, values
+
+    def _maybe_store(self, query: str, vector, before: dict, result: dict) -> None:
+        # Only cache answers grounded in fresh KB/web context; follow-ups answered
+        # from the conversation alone are specific to this thread.
+        # rag / web hold blob references, which are equal exactly when the content is.
+        grounded = any(
+            result.get(k) and result.get(k) != before.get(k) and "_ERROR::" not in resolve(result.get(k))
+            for k in ("rag", "web")
+        )
+        ai_msg = next((m for m in reversed(result.get("messages", [])) if isinstance(m, AIMessage)), None)
+        if grounded and ai_msg is not None:
+            try:
+                self.cache.store(query, ai_msg.content, vector)
+            except Exception as e:
+                logger.warning(f"Semantic cache store failed: {e}")
+
+    def invoke(self, inputs: dict, config: Optional[dict] = None, **kwargs):
+        query, answer, vector, before = self._lookup(inputs, config)
+        if query is None:
+            return self._graph.invoke(inputs, config=config, **kwargs)
+        if answer is not None:
+            return self._record_cached_turn(config, query, answer, before)
+
+        result = self._graph.invoke(inputs, config=config, **kwargs)
+        self._maybe_store(query, vector, before, result)
+        return result
+
+    async def ainvoke(self, inputs: dict, config: Optional[dict] = None, **kwargs):
+        query, answer, vector, before = await asyncio.to_thread(self._lookup, inputs, config)
+        if query is None:
+            return await self._graph.ainvoke(inputs, config=config, **kwargs)
+        if answer is not None:
+            return await asyncio.to_thread(self._record_cached_turn, config, query, answer, before)
+
+        result = await self._graph.ainvoke(inputs, config=config, **kwargs)
+        await asyncio.to_thread(self._maybe_store, query, vector, before, result)
+        return result
+
+    def _stream_mode(self, kwargs: dict) -> Optional[str]:
+        """The stream mode if a cache hit can be expressed in it, else None (the cache is skipped)."""
+        if kwargs.get("subgraphs"):
+            return None
+        mode = kwargs.get("stream_mode") or getattr(self._graph, "stream_mode", "values")
+        return mode if mode in ("values", "updates") else None
+
+    @staticmethod
+    def _hit_chunk(mode: str, answer: str, result: dict):
+        if mode == "values":
+            return result
+        return {"answer": {"messages": [AIMessage(content=answer)], "route": "answer"}}
+
+    def stream(self, inputs: dict, config: Optional[dict] = None, **kwargs):
+        """
+        Streams the graph (see CompiledGraph.stream). In "values" and "updates"
+        mode a cache hit is a single chunk: the resulting state, or the answer
+        node's update.
+        """
+        mode = self._stream_mode(kwargs)
+        query, answer, vector, before = self._lookup(inputs, config) if mode else (None, None, None, {})
+        if answer is not None:
+            yield self._hit_chunk(mode, answer, self._record_cached_turn(config, query, answer, before))
+            return
+
+        yield from self._graph.stream(inputs, config=config, **kwargs)
+        if query is not None:
+            # The final state, as checkpointed (empty without a thread_id).
+            self._maybe_store(query, vector, before, self._thread_values(config))
+
+    async def astream(self, inputs: dict, config: Optional[dict] = None, **kwargs):
+        """Async `stream`."""
+        mode = self._stream_mode(kwargs)
+        query, answer, vector, before = ((await asyncio.to_thread(self._lookup, inputs, config)) if mode
+                                         else (None, None, None, {}))
+        if answer is not None:
+            result = await asyncio.to_thread(self._record_cached_turn, config, query, answer, before)
+            yield self._hit_chunk(mode, answer, result)
+            return
+
+        async for chunk in self._graph.astream(inputs, config=config, **kwargs):
+            yield chunk
+        if query is not None:
+            result = await asyncio.to_thread(self._thread_values, config)
+            await asyncio.to_thread(self._maybe_store, query, vector, before, result)
+
+    async def astream_events(self, inputs: dict, config: Optional[dict] = None, **kwargs):
+        """
+        Async event stream of the graph (see CompiledGraph.astream_events). A
+        cache hit is reported as a single custom event named "semantic_cache_hit"
+        whose data carries the answer and the resulting state.
+        """
+        query, answer, vector, before = await asyncio.to_thread(self._lookup, inputs, config)
+        if answer is not None:
+            result = await asyncio.to_thread(self._record_cached_turn, config, query, answer, before)
+            yield {
+                "event": "on_custom_event",
+                "name": "semantic_cache_hit",
+                "run_id": "",
+                "tags": [],
+                "metadata": {},
+                "parent_ids": [],
+                "data": {"answer": answer, "output": result},
+            }
+            return
+
+        result = None
+        async for event in self._graph.astream_events(inputs, config=config, **kwargs):
+            if event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                result = event["data"].get("output")
+            yield event
+        if query is not None and isinstance(result, dict):
+            await asyncio.to_thread(self._maybe_store, query, vector, before, result)
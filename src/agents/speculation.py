@@ -0,0 +1,133 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src.core import config
+from src.core.metrics import metrics
+from src.tools.web_search import web_search_tool
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Speculative searches run on their own small pool so that a burst of them
+# can never starve other work of threads.
+_executor = ThreadPoolExecutor(
+    max_workers=config.SPECULATIVE_WEB_MAX_WORKERS, thread_name_prefix="speculative-web"
+)
+
+MODES = ("off", "with_judge", "on_rag_route")
+if config.SPECULATIVE_WEB_MODE not in MODES:
+    logger.warning(f"Unknown SPECULATIVE_WEB_MODE={config.SPECULATIVE_WEB_MODE!r}; expected one of {MODES}")
+
+
+# ── Speculative web search ──────────────────────────────────────────
+class SpeculativeWebSearch:
+    """
+    A web search started before we know whether it is needed. `resolve` (or
+    `aresolve`) either returns its result, when the RAG judge found the KB
+    insufficient, or cancels / discards it. `release` discards it unless it
+    was already resolved, for callers that fail before deciding.
+
+    Metrics (prefix "speculative_web."):
+      launched, used, wasted, cancelled   - counts
+      saved_seconds                       - web latency hidden behind the judge / retrieval
+      wasted_seconds                      - Tavily time spent on discarded searches
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._discarded = False
+        self._accounted = False
+        self.resolved = False
+        self._lock = threading.Lock()
+        self._future = _executor.submit(self._run)
+        self._future.add_done_callback(self._on_done)
+        metrics.inc("speculative_web.launched")
+        logger.info(f"Speculative web search launched for query: {query}")
+
+    def _run(self) -> str:
+        try:
+            return web_search_tool.invoke({"query": self.query})
+        finally:
+            self.finished = time.perf_counter()
+
+    def _account_waste(self) -> None:
+        # Called from both the done-callback and _discard; whichever sees the
+        # search both discarded and finished records its cost, exactly once.
+        with self._lock:
+            if self._discarded and self.finished is not None and not self._accounted:
+                self._accounted = True
+                metrics.inc("speculative_web.wasted_seconds", self.finished - self.started)
+
+    def _on_done(self, future) -> None:
+        if not future.cancelled():
+            self._account_waste()
+
+    def _record_use(self, decided_at: float) -> None:
+        # Without speculation the search would only have started at `decided_at`.
+        finished = self.finished if self.finished is not None else decided_at
+        saved = max(0.0, min(finished, decided_at) - self.started)
+        metrics.inc("speculative_web.used")
+        metrics.inc("speculative_web.saved_seconds", saved)
+        logger.info(f"Speculative web search used; {saved:.2f}s of latency saved")
+
+    def _discard(self) -> None:
+        with self._lock:
+            self._discarded = True
+        if self._future.cancel():
+            metrics.inc("speculative_web.cancelled")
+        else:
+            metrics.inc("speculative_web.wasted")
+            self._account_waste()
+        logger.info("Speculative web search discarded (KB was sufficient)")
+
+    def resolve(self, needed: bool, decided_at: Optional[float] = None) -> Optional[str]:
+        self.resolved = True
+        decided_at = decided_at or time.perf_counter()
+        if not needed:
+            self._discard()
+            return None
+        result = self._future.result()
+        self._record_use(decided_at)
+        return result
+
+    async def aresolve(self, needed: bool, decided_at: Optional[float] = None) -> Optional[str]:
+        self.resolved = True
+        decided_at = decided_at or time.perf_counter()
+        if not needed:
+            self._discard()
+            return None
+        result = await asyncio.wrap_future(self._future)
+        self._record_use(decided_at)
+        return result
+
+    def release(self) -> None:
+        if not self.resolved:
+            self.resolve(False)
+
+
+def maybe_speculate(query: str, stage: str) -> Optional[SpeculativeWebSearch]:
+    """Starts a speculative search if SPECULATIVE_WEB_MODE asks for one at `stage`."""
+    if config.SPECULATIVE_WEB_MODE == stage and query:
+        return SpeculativeWebSearch(query)
+    return None
+
+
+def speculation_stats() -> dict:
+    launched = metrics.get("speculative_web.launched")
+    used = metrics.get("speculative_web.used")
+    return {
+        "mode": config.SPECULATIVE_WEB_MODE,
+        "launched": launched,
+        "used": used,
+        "wasted": metrics.get("speculative_web.wasted"),
+        "cancelled": metrics.get("speculative_web.cancelled"),
+        "waste_rate": 1 - used / launched if launched else 0.0,
+        "saved_seconds": metrics.get("speculative_web.saved_seconds"),
+        "wasted_seconds": metrics.get("speculative_web.wasted_seconds"),
+    }
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Literal, Optional, Sequence, Tuple
+
+from src.core import config
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+Decision = Literal["answer", "web", "judge"]
+# (top score, sufficient, weight); sampled audit verdicts weigh 1/rate.
+Verdict = Tuple[float, bool, float]
+
+
+# ── Score-based sufficiency gate ────────────────────────────────────
+class SufficiencyGate:
+    """
+    Decides from retrieval similarity scores whether the judge LLM is needed:
+      top score >= high  → KB is sufficient, go straight to answer
+      top score <  low   → KB is insufficient, go straight to web
+      otherwise          → ask judge_llm
+    Every judge verdict is appended to a JSONL log together with the scores,
+    which `calibrate` uses to learn the two thresholds. Verdicts from the band
+    alone can only ever move the thresholds inwards, so a fraction
+    `audit_rate` of the fast decisions is also judged in the background and
+    logged as a sampled verdict; the route of those turns is not changed.
+    """
+
+    def __init__(self, low: float, high: float, log_path: Optional[str] = None, enabled: bool = True,
+                 audit_rate: float = 0.0):
+        self.low = low
+        self.high = high
+        self.log_path = log_path
+        self.enabled = enabled
+        self.audit_rate = min(max(audit_rate, 0.0), 1.0)
+        self._lock = threading.Lock()
+        self._auditor: Optional[ThreadPoolExecutor] = None
+
+    def decide(self, scores: List[float]) -> Decision:
+        if not self.enabled:
+            metrics.inc("sufficiency.judge_calls")
+            return "judge"
+        if not scores:
+            metrics.inc("sufficiency.fast_insufficient")
+            return "web"
+        top = max(scores)
+        if top >= self.high:
+            metrics.inc("sufficiency.fast_sufficient")
+            return "answer"
+        if top < self.low:
+            metrics.inc("sufficiency.fast_insufficient")
+            return "web"
+        metrics.inc("sufficiency.judge_calls")
+        return "judge"
+
+    def should_audit(self, decision: Decision) -> bool:
+        """Whether a fast decision should also be judged for calibration."""
+        return (decision != "judge" and self.enabled and bool(self.log_path)
+                and self.audit_rate > 0 and random.random() < self.audit_rate)
+
+    def audit(self, scores: List[float], decision: Decision, judge: Callable[[], bool]) -> None:
+        """
+        Runs `judge` off the request path and records its verdict as a sampled
+        one. Failures are only logged: an audit never affects the turn.
+        """
+        metrics.inc("sufficiency.audits")
+
+        def run():
+            try:
+                sufficient = judge()
+            except Exception as e:
+                logger.warning(f"Sufficiency audit judge failed: {e}")
+                return
+            if sufficient != (decision == "answer"):
+                metrics.inc("sufficiency.audit_disagreements")
+            self.record(scores, sufficient, sampled=True)
+
+        with self._lock:
+            if self._auditor is None:
+                self._auditor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sufficiency-audit")
+            auditor = self._auditor
+        auditor.submit(run)
+
+    def record(self, scores: List[float], sufficient: bool, sampled: bool = False) -> None:
+        """Logs a judge verdict for later threshold calibration."""
+        if not self.log_path or not scores:
+            return
+        entry = {"ts": time.time(), "scores": scores, "sufficient": sufficient}
+        if sampled:
+            entry.update(sampled=True, rate=self.audit_rate)
+        line = json.dumps(entry)
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not log judge verdict to {self.log_path}: {e}")
+
+
+def load_verdicts(log_path: str) -> List[Verdict]:
+    """
+    Reads (top score, sufficient, weight) triples from a verdict log. Sampled
+    audit verdicts stand for 1/rate fast decisions each.
+    """
+    verdicts = []
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                weight = 1.0
+                if record.get("sampled"):
+                    weight = 1.0 / float(record["rate"])
+                verdicts.append((max(record["scores"]), bool(record["sufficient"]), weight))
+            except (ValueError, KeyError, TypeError, ZeroDivisionError):
+                continue
+    return verdicts
+
+
+def calibrate(verdicts: Sequence[Tuple], target_precision: float = 0.95,
+              min_samples: int = 20) -> Optional[Tuple[float, float]]:
+    """
+    Learns (low, high) from logged judge verdicts, given as (score, sufficient)
+    pairs or (score, sufficient, weight) triples. `high` is the lowest score
+    such that at least `target_precision` of the weighted verdicts at or above
+    it were "sufficient"; `low` is the highest score such that at least
+    `target_precision` of the weighted verdicts below it were "insufficient".
+    Each side needs `min_samples` verdicts to be trusted. Returns None when
+    there is not enough data.
+    """
+    if len(verdicts) < min_samples:
+        return None
+    ordered = sorted((v[0], bool(v[1]), v[2] if len(v) > 2 else 1.0) for v in verdicts)
+    n = len(ordered)
+
+    high = None
+    sufficient_above = weight_above = 0.0
+    for i in range(n - 1, -1, -1):
+        score, sufficient, weight = ordered[i]
+        sufficient_above += weight * sufficient
+        weight_above += weight
+        if n - i >= min_samples and sufficient_above / weight_above >= target_precision:
+            high = score
+
+    low = None
+    insufficient_below = weight_below = 0.0
+    for i in range(n):
+        score, sufficient, weight = ordered[i]
+        insufficient_below += weight * (not sufficient)
+        weight_below += weight
+        if i + 1 >= min_samples and insufficient_below / weight_below >= target_precision:
+            # Strictly above the highest insufficient-side score seen so far.
+            low = score + 1e-6
+
+    if high is None and low is None:
+        return None
+    # A side without enough evidence is disabled.
+    low = low if low is not None else float("-inf")
+    high = high if high is not None else float("inf")
+    if low > high:
+        low = high
+    return low, high
+
+
+def _load_thresholds() -> Tuple[float, float]:
+    low, high = config.SUFFICIENCY_LOW_THRESHOLD, config.SUFFICIENCY_HIGH_THRESHOLD
+    path = config.SUFFICIENCY_THRESHOLDS_PATH
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                learned = json.load(f)
+            low, high = float(learned["low"]), float(learned["high"])
+            logger.info(f"Loaded calibrated sufficiency thresholds from {path}: low={low:.3f}, high={high:.3f}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable thresholds file {path}: {e}")
+    return low, high
+
+
+def sufficiency_report() -> dict:
+    fast_yes = metrics.get("sufficiency.fast_sufficient")
+    fast_no = metrics.get("sufficiency.fast_insufficient")
+    judged = metrics.get("sufficiency.judge_calls")
+    total = fast_yes + fast_no + judged
+    return {
+        "rag_turns": total,
+        "fast_sufficient": fast_yes,
+        "fast_insufficient": fast_no,
+        "judge_calls": judged,
+        "judge_calls_avoided": fast_yes + fast_no,
+        "avoided_ratio": (fast_yes + fast_no) / total if total else 0.0,
+        "audits": metrics.get("sufficiency.audits"),
+        "audit_disagreements": metrics.get("sufficiency.audit_disagreements"),
+        "low": sufficiency_gate.low,
+        "high": sufficiency_gate.high,
+    }
+
+
+_low, _high = _load_thresholds()
+sufficiency_gate = SufficiencyGate(
+    low=_low,
+    high=_high,
+    log_path=config.SUFFICIENCY_VERDICT_LOG_PATH,
+    enabled=config.SUFFICIENCY_FAST_PATH,
+    audit_rate=config.SUFFICIENCY_AUDIT_RATE,
+)
+
+
+# ── CLI: python -m src.agents.sufficiency calibrate ─────────────────
+def main(argv: List[str]) -> int:
+    if argv[:1] != ["calibrate"]:
+        print("usage: python -m src.agents.sufficiency calibrate [target_precision] [min_samples]")
+        return 2
+    target = float(argv[1]) if len(argv) > 1 else 0.95
+    min_samples = int(argv[2]) if len(argv) > 2 else 20
+    verdicts = load_verdicts(config.SUFFICIENCY_VERDICT_LOG_PATH)
+    result = calibrate(verdicts, target_precision=target, min_samples=min_samples)
+    if result is None:
+        print(f"Not enough verdicts to calibrate ({len(verdicts)} logged, need {min_samples}).")
+        return 1
+    low, high = result
+    with open(config.SUFFICIENCY_THRESHOLDS_PATH, "w", encoding="utf-8") as f:
+        json.dump({"low": low, "high": high, "samples": len(verdicts), "target_precision": target}, f, indent=2)
+    print(f"Calibrated on {len(verdicts)} verdicts: low={low:.3f}, high={high:.3f} "
+          f"→ {config.SUFFICIENCY_THRESHOLDS_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,342 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Type
+
+import numpy as np
+from pydantic import BaseModel
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+
+from src.core import config
+from src.core.llm_config import CHAT_MODEL
+from src.core.telemetry import LLMUsageHandler, record_llm_call
+from src.core.state import FusedAnswer, RagJudge, RouteDecision
+from src.tools.faiss_index import build_index, configure_search
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Local stand-ins for OpenAI, Tavily and LangSmith, so the real graph can be
+# benchmarked offline. Every output is a pure function of its input; only the
+# simulated latencies involve the clock.
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+# Length of generated answers, in tokens
+ANSWER_TOKENS = 60
+
+
+def _stable_unit(text: str) -> float:
+    """A deterministic number in [0, 1) derived from `text`."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big") / 2 ** 64
+
+
+class Latency:
+    """`mean` seconds, spread ±`jitter`·mean deterministically by input."""
+
+    def __init__(self, mean: float = 0.0, jitter: float = 0.25):
+        self.mean = mean
+        self.jitter = jitter
+
+    def seconds(self, key: str) -> float:
+        if self.mean <= 0:
+            return 0.0
+        return self.mean * (1 + self.jitter * (2 * _stable_unit(key) - 1))
+
+    def sleep(self, key: str) -> None:
+        seconds = self.seconds(key)
+        if seconds:
+            time.sleep(seconds)
+
+    async def asleep(self, key: str) -> None:
+        seconds = self.seconds(key)
+        if seconds:
+            await asyncio.sleep(seconds)
+
+
+def _prompt_text(prompt: Any) -> str:
+    if isinstance(prompt, str):
+        return prompt
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    parts = []
+    for item in prompt:
+        content = item[1] if isinstance(item, tuple) else getattr(item, "content", item)
+        parts.append(content if isinstance(content, str) else str(content))
+    return "\n".join(parts)
+
+
+# ── Embeddings ──────────────────────────────────────────────────────
+class HashEmbeddings(Embeddings):
+    """
+    Bag-of-words feature hashing into `dim` dimensions, L2-normalised: texts
+    sharing words land close together, so retrieval behaves plausibly.
+    `latency` is paid once per call, like one API round trip.
+    """
+
+    def __init__(self, dim: int = 256, latency: Optional[Latency] = None):
+        self.dim = dim
+        self.latency = latency or Latency()
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN.findall(text.lower()):
+            bucket = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[bucket % self.dim] += 1.0 if bucket & (1 << 63) else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.latency.sleep(texts[0] if texts else "")
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.latency.sleep(text)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await self.latency.asleep(texts[0] if texts else "")
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await self.latency.asleep(text)
+        return self._vector(text)
+
+
+# ── Structured-output LLMs ──────────────────────────────────────────
+class ScriptedStructuredLLM(Runnable):
+    """
+    Replaces `ChatOpenAI(...).with_structured_output(schema)`. The first
+    `script` key (a query) found in the prompt decides the fields of the
+    returned `schema` instance; otherwise `default` is used. With `last`, the
+    key found last in the prompt wins instead: answer-style prompts quote the
+    history first and end with the current question. Each call is
+    counted as `output_tokens` completion tokens of `role`, like the usage
+    handler of a real model.
+    """
+
+    def __init__(self, schema: Type[BaseModel], script: Dict[str, dict], default: dict,
+                 latency: Optional[Latency] = None, role: Optional[str] = None, output_tokens: int = 10,
+                 last: bool = False):
+        self.schema = schema
+        # Longest first, so "what is x exactly" wins over "what is x".
+        self.script = sorted(((k.lower(), v) for k, v in script.items()), key=lambda kv: -len(kv[0]))
+        self.last = last
+        self.default = default
+        self.latency = latency or Latency()
+        self.role = role
+        self.output_tokens = output_tokens
+
+    def _decide(self, prompt: Any, started: float) -> BaseModel:
+        text = _prompt_text(prompt)
+        if self.role:
+            record_llm_call(self.role, CHAT_MODEL, len(text) // 4, self.output_tokens,
+                            seconds=time.perf_counter() - started)
+        lowered = text.lower()
+        found = [(i, v) for i, (k, v) in enumerate(self.script) if k and k in lowered]
+        if self.last and found:
+            # Latest position first, then the longest key at that position.
+            found.sort(key=lambda iv: (-lowered.rfind(self.script[iv[0]][0]), iv[0]))
+        fields = found[0][1] if found else self.default
+        return self.schema(**fields)
+
+    def invoke(self, input, config=None, **kwargs):
+        started = time.perf_counter()
+        self.latency.sleep(_prompt_text(input))
+        return self._decide(input, started)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        started = time.perf_counter()
+        await self.latency.asleep(_prompt_text(input))
+        return self._decide(input, started)
+
+
+def scripted_router(script: Dict[str, dict], latency: Optional[Latency] = None) -> ScriptedStructuredLLM:
+    return ScriptedStructuredLLM(RouteDecision, script, {"route": "rag"}, latency, role="router")
+
+
+def scripted_judge(script: Dict[str, dict], latency: Optional[Latency] = None) -> ScriptedStructuredLLM:
+    return ScriptedStructuredLLM(RagJudge, script, {"sufficient": True}, latency, role="judge")
+
+
+def scripted_fused(judge_script: Dict[str, dict], latency: Optional[Latency] = None,
+                   answer_tokens: int = ANSWER_TOKENS) -> ScriptedStructuredLLM:
+    """The fused call: the judge's verdict plus a whole (not streamed) answer."""
+    answer = " ".join(["answer"] * answer_tokens)
+    script = {q: {"sufficient": v["sufficient"], "answer": answer if v["sufficient"] else ""}
+              for q, v in judge_script.items()}
+    return ScriptedStructuredLLM(FusedAnswer, script, {"sufficient": True, "answer": answer}, latency,
+                                 role="fused", output_tokens=answer_tokens, last=True)
+
+
+# ── Chat model ──────────────────────────────────────────────────────
+class FakeChatModel(BaseChatModel):
+    """
+    Streams a deterministic answer of `answer_tokens` words: waits
+    `first_token_seconds` before the first token and `token_seconds` between
+    tokens, like a hosted model.
+    """
+
+    answer_tokens: int = ANSWER_TOKENS
+    first_token_seconds: float = 0.0
+    token_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "bench-fake-chat"
+
+    def _tokens(self, messages: Sequence[BaseMessage]) -> List[str]:
+        words = _TOKEN.findall(_prompt_text(messages)) or ["ok"]
+        seed = _stable_unit(_prompt_text(messages))
+        start = int(seed * len(words))
+        return [words[(start + i) % len(words)] + " " for i in range(self.answer_tokens)]
+
+    def _usage(self, messages) -> dict:
+        prompt_tokens = len(_prompt_text(messages)) // 4
+        return {"input_tokens": prompt_tokens, "output_tokens": self.answer_tokens,
+                "total_tokens": prompt_tokens + self.answer_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = "".join(self._stream_text(messages))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = "".join([t async for t in self._astream_text(messages)])
+        message = AIMessage(content=text, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream_text(self, messages) -> Iterator[str]:
+        time.sleep(self.first_token_seconds)
+        for i, token in enumerate(self._tokens(messages)):
+            if i and self.token_seconds:
+                time.sleep(self.token_seconds)
+            yield token
+
+    async def _astream_text(self, messages) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token_seconds)
+        for i, token in enumerate(self._tokens(messages)):
+            if i and self.token_seconds:
+                await asyncio.sleep(self.token_seconds)
+            yield token
+
+    def _chunk(self, messages, token: str, last: bool) -> ChatGenerationChunk:
+        # Like OpenAI with stream_usage, the usage report rides on the last chunk.
+        usage = self._usage(messages) if last else None
+        return ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._stream_text(messages), start=1):
+            chunk = self._chunk(messages, token, i == self.answer_tokens)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        i = 0
+        async for token in self._astream_text(messages):
+            i += 1
+            chunk = self._chunk(messages, token, i == self.answer_tokens)
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+# ── Web search ──────────────────────────────────────────────────────
+class CannedTavily:
+    """Answers `invoke({"query": ...})` with `results` Tavily-shaped results."""
+
+    def __init__(self, results: int = 3, latency: Optional[Latency] = None):
+        self.results = results
+        self.latency = latency or Latency()
+
+    def invoke(self, input: dict, config=None, **kwargs) -> dict:
+        query = input["query"]
+        self.latency.sleep(query)
+        return {"query": query, "results": [
+            {"title": f"Result {i + 1} for {query}",
+             "content": f"Canned web content {i + 1} about {query}.",
+             "url": f"https://example.com/{hashlib.sha1(query.encode()).hexdigest()[:8]}/{i + 1}"}
+            for i in range(self.results)
+        ]}
+
+
+# ── Knowledge base ──────────────────────────────────────────────────
+def synthetic_kb(chunks: int, topics: Sequence[str] = (), seed: int = 0) -> List[Document]:
+    """
+    `chunks` filler documents of ~150 words, plus one document per topic
+    (e.g. the corpus's RAG questions) so those queries have a real match.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    docs = [Document(page_content=f"{topic}. " + " ".join(rng.choice(vocabulary, 120)),
+                     metadata={"source": "bench/topics.pdf", "page": i})
+            for i, topic in enumerate(topics)]
+    docs += [Document(page_content=" ".join(rng.choice(vocabulary, 150)),
+                      metadata={"source": "bench/filler.pdf", "page": i})
+             for i in range(chunks)]
+    return docs
+
+
+def build_kb_store(docs: List[Document], embeddings: Embeddings, kind: Optional[str] = None) -> FAISS:
+    """An in-memory FAISS store of the configured index type over `docs`."""
+    kind = kind or config.FAISS_INDEX_TYPE
+    vectors = np.asarray(embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+    index = build_index(kind, vectors)
+    configure_search(index, kind)
+    ids = [str(i) for i in range(len(docs))]
+    return FAISS(embeddings, index, InMemoryDocstore(dict(zip(ids, docs))), dict(enumerate(ids)))
+
+
+# ── Installation ────────────────────────────────────────────────────
+def install(router_script: Dict[str, dict], judge_script: Dict[str, dict], kb_docs: List[Document],
+            llm_latency: float = 0.0, first_token_seconds: float = 0.0, token_seconds: float = 0.0,
+            embed_latency: float = 0.0, search_latency: float = 0.0) -> None:
+    """
+    Puts the fakes behind every lazy singleton the graph reaches for, so
+    nothing leaves the process. Must run before the first request.
+    """
+    os.environ["LANGSMITH_TRACING"] = "false"
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+    from src.agents.sufficiency import sufficiency_gate
+    from src.core import llm_config
+    from src.tools import rag, web_search
+
+    # Scripted verdicts must never reach the log `calibrate` learns thresholds from.
+    sufficiency_gate.log_path = None
+
+    # The production batching / caching stack, over a throwaway cache so the
+    # real embedding cache never sees hash vectors.
+    embeddings = rag.wrap_embeddings(HashEmbeddings(latency=Latency(embed_latency)), cache_path=":memory:")
+    rag._embeddings.set(embeddings)
+    # Wrapped like the real models, so the pool's limits and retries are in the measurement.
+    llm_config._router_llm.set(llm_config._resilient(
+        scripted_router(router_script, Latency(llm_latency)), "router", hedge=True))
+    llm_config._judge_llm.set(llm_config._resilient(
+        scripted_judge(judge_script, Latency(llm_latency)), "judge", hedge=True))
+    # Structured output arrives in one piece: the whole answer's generation time.
+    fused_seconds = first_token_seconds + ANSWER_TOKENS * token_seconds
+    llm_config._fused_llm.set(llm_config._resilient(
+        scripted_fused(judge_script, Latency(fused_seconds)), "fused"))
+    answer = FakeChatModel(first_token_seconds=first_token_seconds, token_seconds=token_seconds,
+                           callbacks=[LLMUsageHandler("answer", CHAT_MODEL)])
+    llm_config._answer_llm.set(llm_config._resilient(answer, "answer"))
+    llm_config._summary_llm.set(llm_config._resilient(
+        FakeChatModel(answer_tokens=40, first_token_seconds=first_token_seconds,
+                      callbacks=[LLMUsageHandler("summary", CHAT_MODEL)]), "summary"))
+    web_search._tavily.set(CannedTavily(latency=Latency(search_latency)))
+
+    rag.install_collection(rag.DEFAULT_COLLECTION, "bench", build_kb_store(kb_docs, embeddings))
+    logger.info(f"Benchmark fakes installed ({len(kb_docs)} KB chunks, {config.FAISS_INDEX_TYPE} index)")
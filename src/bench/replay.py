@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import resource
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+NODES = ("router", "rag_lookup", "retrieve", "fused_answer", "web_search", "answer")
+
+# Used when no --corpus is given: a mix of every path through the graph.
+# "route" and "sufficient" script the router and judge fakes for that query;
+# queries sharing a "thread" are replayed in order as one conversation.
+DEFAULT_CORPUS = [
+    {"query": "hi", "route": "end"},
+    {"query": "thanks!", "route": "end"},
+    {"query": "What is the aim of the Starx AI technology?", "route": "rag", "sufficient": True},
+    {"query": "Who is the CEO of Starx AI technology?", "route": "rag", "sufficient": True},
+    {"query": "Which products does Starx AI sell?", "route": "rag", "sufficient": True, "thread": "t1"},
+    {"query": "And how much do they cost?", "route": "rag", "sufficient": False, "thread": "t1"},
+    {"query": "Who won the latest F1 race?", "route": "rag", "sufficient": False},
+    {"query": "What is the weather in Paris today?", "route": "rag", "sufficient": False},
+    {"query": "Explain recursion in one paragraph.", "route": "answer"},
+    {"query": "Write a haiku about the sea.", "route": "answer"},
+]
+
+
+def load_corpus(path: Optional[str]) -> List[dict]:
+    """One JSON object per line: {"query", "route"?, "sufficient"?, "thread"?}."""
+    if not path:
+        return [dict(r) for r in DEFAULT_CORPUS]
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ── Measurement ─────────────────────────────────────────────────────
+class NodeTimer(BaseCallbackHandler):
+    """Collects the wall time of every graph node run, by node name."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.started: Dict[uuid.UUID, tuple] = {}
+        self.seconds: Dict[str, List[float]] = defaultdict(list)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name")
+        # The node's own RunnableLambda runs nested under a run of the same name.
+        if (name in NODES and (metadata or {}).get("langgraph_node") == name
+                and parent_run_id not in self.started):
+            self.started[run_id] = (name, time.perf_counter())
+
+    def _finish(self, run_id) -> None:
+        entry = self.started.pop(run_id, None)
+        if entry is not None:
+            self.seconds[entry[0]].append(time.perf_counter() - entry[1])
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def percentiles(samples: Sequence[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# ── Replay ──────────────────────────────────────────────────────────
+def _conversations(corpus: List[dict], repeat: int) -> List[List[str]]:
+    """Groups the corpus into conversations; each repetition gets fresh threads."""
+    conversations = []
+    for _ in range(repeat):
+        threads: Dict[str, List[str]] = {}
+        for i, record in enumerate(corpus):
+            threads.setdefault(record.get("thread") or f"q{i}", []).append(record["query"])
+        conversations.extend(threads.values())
+    return conversations
+
+
+async def replay(agent, corpus: List[dict], concurrency: int, repeat: int = 1) -> dict:
+    """
+    Runs every conversation of the corpus through `agent` with at most
+    `concurrency` turns in flight and returns the latency report.
+    """
+    timer = NodeTimer()
+    turn_seconds: List[float] = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def converse(queries: List[str]) -> None:
+        nonlocal errors
+        run_config = {"configurable": {"thread_id": str(uuid.uuid4())}, "callbacks": [timer]}
+        for query in queries:
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    await agent.ainvoke({"messages": [HumanMessage(content=query)],
+                                         "upload_file_content": ""}, config=run_config)
+                except Exception as e:
+                    logger.error(f"Turn failed for query '{query}': {e}")
+                    errors += 1
+                    continue
+                turn_seconds.append(time.perf_counter() - started)
+
+    conversations = _conversations(corpus, repeat)
+    started = time.perf_counter()
+    await asyncio.gather(*(converse(c) for c in conversations))
+    wall = time.perf_counter() - started
+    return {
+        "turns": len(turn_seconds),
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(turn_seconds) / wall, 2) if wall else 0.0,
+        "end_to_end": percentiles(turn_seconds),
+        "nodes": {node: percentiles(timer.seconds[node]) for node in NODES},
+    }
+
+
+def llm_summary(turns: int) -> dict:
+    """LLM round trips, tokens and estimated cost per turn, by role and in total."""
+    from src.core.telemetry import cost_report
+
+    usage = cost_report()
+    per_turn = lambda field: round(sum(r.get(field, 0) for r in usage.values()) / turns, 4) if turns else 0.0
+    return {
+        "calls_per_turn": per_turn("calls"),
+        "prompt_tokens_per_turn": per_turn("prompt_tokens"),
+        "completion_tokens_per_turn": per_turn("completion_tokens"),
+        "cost_usd_per_turn": round(sum(r.get("cost_usd", 0) for r in usage.values()) / turns, 7) if turns else 0.0,
+        "calls_by_role": {role: r.get("calls", 0) for role, r in usage.items() if r.get("calls")},
+    }
+
+
+# ── Regression gate ─────────────────────────────────────────────────
+def regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """p95 latencies (end to end and per node) and throughput worse than baseline by more than `tolerance`."""
+    found = []
+    pairs = [("end_to_end", report["end_to_end"], baseline.get("end_to_end", {}))]
+    pairs += [(f"nodes.{n}", report["nodes"].get(n, {}), baseline.get("nodes", {}).get(n, {})) for n in NODES]
+    for name, now, before in pairs:
+        if now.get("p95_ms") and before.get("p95_ms") and now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{name} p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+    before = baseline.get("throughput_per_second")
+    if before and report["throughput_per_second"] < before * (1 - tolerance):
+        found.append(f"throughput {before}/s -> {report['throughput_per_second']}/s")
+    before = baseline.get("llm", {}).get("cost_usd_per_turn")
+    now = report.get("llm", {}).get("cost_usd_per_turn")
+    if before and now and now > before * (1 + tolerance):
+        found.append(f"LLM cost per turn ${before} -> ${now}")
+    return found
+
+
+def main(argv: List[str]) -> int:
+    from src.core import config
+
+    parser = argparse.ArgumentParser(
+        description="Replay a query corpus through graph_agent against local fakes (no network)."
+    )
+    parser.add_argument("--corpus", help="JSONL file of {query, route?, sufficient?, thread?}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=10, help="Times the corpus is replayed")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured replays before the run")
+    parser.add_argument("--kb-chunks", type=int, default=2000, help="Filler chunks in the synthetic KB")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Router / judge call seconds")
+    parser.add_argument("--first-token", type=float, default=0.4, help="Answer time to first token, seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between answer tokens")
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="Embedding call seconds")
+    parser.add_argument("--search-latency", type=float, default=0.8, help="Web search seconds")
+    parser.add_argument("--topology", choices=("staged", "fused"), default=config.GRAPH_TOPOLOGY,
+                        help="Graph topology to replay (default: GRAPH_TOPOLOGY)")
+    parser.add_argument("--no-semantic-cache", action="store_true", help="Bypass the semantic answer cache")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python heap peak (slower)")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--baseline", help="Report JSON to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression, fraction")
+    args = parser.parse_args(argv)
+
+    from src.bench import fakes
+
+    corpus = load_corpus(args.corpus)
+    router_script = {r["query"]: {"route": r["route"]} for r in corpus if r.get("route")}
+    judge_script = {r["query"]: {"sufficient": r["sufficient"]} for r in corpus if "sufficient" in r}
+    topics = [r["query"] for r in corpus if r.get("sufficient")]
+    fakes.install(
+        router_script, judge_script, fakes.synthetic_kb(args.kb_chunks, topics),
+        llm_latency=args.llm_latency, first_token_seconds=args.first_token,
+        token_seconds=args.token_latency, embed_latency=args.embed_latency,
+        search_latency=args.search_latency,
+    )
+
+    # The graph is built on import, from this setting.
+    config.GRAPH_TOPOLOGY = args.topology
+    from src.agents.graph import graph_agent, compiled_graph, checkpointer, answer_cache
+    from src.core.metrics import metrics
+    from src.tools.web_search import web_cache
+    from src.warmup import warmup
+
+    agent = compiled_graph if args.no_semantic_cache else graph_agent
+    warmup()
+    for _ in range(args.warmup):
+        asyncio.run(replay(agent, corpus, args.concurrency))
+    # Warm singletons, but cold caches: the measured run fills them itself.
+    web_cache.clear()
+    if answer_cache is not None:
+        answer_cache.clear()
+    metrics.reset()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    report = asyncio.run(replay(agent, corpus, args.concurrency, args.repeat))
+    report["memory"] = {
+        "max_rss_mb": round(_max_rss_mb(), 1),
+        "checkpointer": checkpointer.memory_usage(),
+    }
+    if args.tracemalloc:
+        report["memory"]["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    report["topology"] = args.topology
+    report["llm"] = llm_summary(report["turns"])
+    # agent.ainvoke goes through the semantic cache unless --no-semantic-cache.
+    report["semantic_cache"] = answer_cache.stats() if agent is graph_agent and answer_cache is not None else None
+    report["metrics"] = metrics.snapshot()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from src.core import config
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = "blob:sha256:"
+
+
+class MissingBlob(LookupError):
+    """A state value refers to a blob that is neither in memory nor in the spill file."""
+
+
+# ── Content-addressed store for large state values ──────────────────
+class BlobStore:
+    """
+    Keeps large strings (retrieved chunks, web snippets, uploaded text) out of
+    the graph state: the state holds "blob:sha256:<digest>" and the text lives
+    here once, however many checkpoints refer to it. Strings shorter than
+    `min_chars` stay inline.
+
+    Bounded to `max_bytes`, least recently used first. A checkpointer that
+    outlives the process (see BoundedCheckpointSaver's spill file) stores the
+    blobs of the checkpoints it writes, puts them back with `restore` when it
+    reloads a thread and sets `loader` to fetch any other blob missing from
+    memory. A reference nothing can resolve raises MissingBlob rather than
+    silently dropping the context.
+    """
+
+    def __init__(self, max_bytes: int, min_chars: int):
+        self.max_bytes = max_bytes
+        self.min_chars = min_chars
+        self.loader: Optional[Callable[[str], Optional[str]]] = None
+        self._lock = threading.Lock()
+        self._blobs: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+
+    def put(self, text: str) -> str:
+        """Stores `text` and returns its reference (or `text` itself when short)."""
+        if len(text) < self.min_chars or text.startswith(BLOB_PREFIX):
+            return text
+        ref = BLOB_PREFIX + hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+        if self._add(ref, text):
+            metrics.inc("state_blobs.stored")
+        return ref
+
+    def restore(self, ref: str, text: str) -> None:
+        """Puts back a blob read from durable storage."""
+        self._add(ref, text)
+
+    def peek(self, ref: str) -> Optional[str]:
+        """The text behind a reference if it is in memory, without touching its recency."""
+        with self._lock:
+            return self._blobs.get(ref)
+
+    def _add(self, ref: str, text: str) -> bool:
+        with self._lock:
+            if ref in self._blobs:
+                self._blobs.move_to_end(ref)
+                return False
+            self._blobs[ref] = text
+            self._bytes += len(text)
+            while self._bytes > self.max_bytes and len(self._blobs) > 1:
+                _, evicted = self._blobs.popitem(last=False)
+                self._bytes -= len(evicted)
+                metrics.inc("state_blobs.evictions")
+        return True
+
+    def get(self, value: Optional[str]) -> str:
+        """The text behind a reference; any other value is returned as is."""
+        if not value or not value.startswith(BLOB_PREFIX):
+            return value or ""
+        with self._lock:
+            text = self._blobs.get(value)
+            if text is not None:
+                self._blobs.move_to_end(value)
+                return text
+        metrics.inc("state_blobs.misses")
+        text = self.loader(value) if self.loader is not None else None
+        if text is None:
+            logger.error(f"State blob {value} is neither in memory nor in the spill file")
+            raise MissingBlob(value)
+        metrics.inc("state_blobs.loaded")
+        self._add(value, text)
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"blobs": len(self._blobs), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "durable": self.loader is not None}
+
+
+blobs = BlobStore(config.STATE_BLOB_MAX_BYTES, config.STATE_BLOB_MIN_CHARS)
+
+
+def store_blob(current: Optional[str], new: Optional[str]) -> Optional[str]:
+    """State reducer: keeps the latest value, large strings by reference."""
+    return blobs.put(new) if isinstance(new, str) else new
+
+
+def resolve(value: Optional[str]) -> str:
+    return blobs.get(value)
@@ -0,0 +1,364 @@
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.core.blobs import BLOB_PREFIX, blobs as state_blobs
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+
+# ── Bounded in-memory checkpointer ──────────────────────────────────
+class BoundedCheckpointSaver(InMemorySaver):
+    """
+    InMemorySaver with a memory budget.
+
+    - Only the last `max_history` checkpoints of a thread are kept (0 keeps all).
+    - Threads idle for longer than `ttl_seconds` are dropped.
+    - When there are more than `max_threads` threads or they use more than
+      `max_bytes` of serialized state, the least recently used threads are
+      evicted.
+    - With `spill_path`, the latest checkpoint of every thread is also written
+      to a SQLite file and is transparently reloaded when an evicted thread or
+      a thread from before a restart is accessed again (until its TTL expires).
+      Worker processes sharing one spill file pick up each other's newer
+      checkpoints, so a conversation can move between them. The state blobs
+      (src.core.blobs) a spilled checkpoint refers to are stored with it. SQLite is only
+      queried for thread ids known to be in the file: those present at start
+      up, spilled by this process, or found by the periodic sweep.
+    - With spilling enabled the async methods run in a worker thread, so
+      SQLite I/O never blocks the event loop.
+
+    Sizes are measured on the serialized checkpoints, blobs and pending
+    writes the saver actually holds.
+    """
+
+    def __init__(self, *, max_threads: int = 1000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: float = 600, max_history: int = 4, spill_path: Optional[str] = None,
+                 sweep_interval: float = 30, serde=None):
+        super().__init__(serde=serde)
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+        self.sweep_interval = sweep_interval
+        self._lock = threading.RLock()
+        # thread_id -> last access time, least recently used first
+        self._access: "OrderedDict[str, float]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        # thread_id -> keys into self.blobs / self.writes owned by that thread
+        self._blob_keys: Dict[str, Set[tuple]] = {}
+        self._write_keys: Dict[str, Set[tuple]] = {}
+        self._last_sweep = 0.0
+        # thread_id -> updated_at of the spill row this process last wrote or read
+        self._spilled_at: Dict[str, float] = {}
+        # thread ids with a row in the spill file, as far as this process knows
+        self._spilled: Set[str] = set()
+        self._spilled_seen = 0.0
+
+        self._spill: Optional[sqlite3.Connection] = None
+        if spill_path:
+            os.makedirs(os.path.dirname(spill_path) or ".", exist_ok=True)
+            self._spill = sqlite3.connect(spill_path, check_same_thread=False)
+            self._spill.execute(
+                "CREATE TABLE IF NOT EXISTS threads ("
+                " thread_id TEXT PRIMARY KEY, checkpoint_type TEXT, checkpoint BLOB,"
+                " metadata_type TEXT, metadata BLOB, updated_at REAL)"
+            )
+            self._spill.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " thread_id TEXT, ref TEXT, text TEXT, PRIMARY KEY (thread_id, ref))"
+            )
+            self._spill.execute("CREATE INDEX IF NOT EXISTS blobs_ref ON blobs (ref)")
+            self._spill.commit()
+            state_blobs.loader = self._load_blob
+            self._refresh_spilled()
+
+    # -- bookkeeping ----------------------------------------------------
+    def _touch(self, thread_id: str) -> None:
+        self._access[thread_id] = time.time()
+        self._access.move_to_end(thread_id)
+
+    def _measure(self, thread_id: str) -> int:
+        size = 0
+        for checkpoints in self.storage.get(thread_id, {}).values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+        for key in self._blob_keys.get(thread_id, ()):
+            blob = self.blobs.get(key)
+            if blob is not None:
+                size += len(blob[1])
+        for key in self._write_keys.get(thread_id, ()):
+            for write in self.writes.get(key, {}).values():
+                size += len(write[2][1])
+        self._sizes[thread_id] = size
+        return size
+
+    def _prune_history(self, thread_id: str, checkpoint_ns: str) -> None:
+        if self.max_history <= 0:
+            return
+        checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns)
+        if not checkpoints or len(checkpoints) <= self.max_history:
+            return
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[:-self.max_history]:
+            del checkpoints[checkpoint_id]
+            write_key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(write_key, None)
+            self._write_keys.get(thread_id, set()).discard(write_key)
+        # Drop channel blobs no retained checkpoint refers to any more.
+        live = set()
+        for checkpoint, _, _ in checkpoints.values():
+            versions = self.serde.loads_typed(checkpoint).get("channel_versions", {})
+            live.update((thread_id, checkpoint_ns, ch, v) for ch, v in versions.items())
+        keys = self._blob_keys.get(thread_id, set())
+        for key in [k for k in keys if k[1] == checkpoint_ns and k not in live]:
+            self.blobs.pop(key, None)
+            keys.discard(key)
+
+    def _drop(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+        for key in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        self._access.pop(thread_id, None)
+        self._sizes.pop(thread_id, None)
+        self._spilled_at.pop(thread_id, None)
+
+    def _enforce_budget(self) -> None:
+        now = time.time()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            expired = [t for t, seen in self._access.items() if now - seen > self.ttl_seconds]
+            for thread_id in expired:
+                self._drop(thread_id)
+                self._unspill(thread_id)
+            if expired:
+                metrics.inc("checkpointer.expired", len(expired))
+                logger.info(f"Expired {len(expired)} idle checkpoint threads")
+            if self._spill is not None:
+                self._spill.execute("DELETE FROM threads WHERE updated_at < ?", (now - self.ttl_seconds,))
+                self._spill.execute("DELETE FROM blobs WHERE thread_id NOT IN (SELECT thread_id FROM threads)")
+                self._spill.commit()
+                self._refresh_spilled()
+
+        total = sum(self._sizes.values())
+        while self._access and (len(self._access) > self.max_threads or total > self.max_bytes):
+            thread_id = next(iter(self._access))
+            total -= self._sizes.get(thread_id, 0)
+            # With spilling enabled the latest checkpoint stays in SQLite.
+            self._drop(thread_id)
+            metrics.inc("checkpointer.evictions")
+        metrics.set("checkpointer.threads", len(self._access))
+        metrics.set("checkpointer.bytes", total)
+
+    # -- SQLite spill ---------------------------------------------------
+    def _refresh_spilled(self) -> None:
+        """Learn about rows other processes spilled since the last refresh."""
+        now = time.time()
+        rows = self._spill.execute(
+            "SELECT thread_id FROM threads WHERE updated_at >= ?",
+            (max(self._spilled_seen, now - self.ttl_seconds),),
+        ).fetchall()
+        self._spilled.update(row[0] for row in rows)
+        self._spilled_seen = now
+
+    def _write_spill(self, config) -> None:
+        latest = super().get_tuple({"configurable": {
+            "thread_id": config["configurable"]["thread_id"],
+            "checkpoint_ns": "",
+        }})
+        if latest is None:
+            return
+        checkpoint_type, checkpoint = self.serde.dumps_typed(latest.checkpoint)
+        metadata_type, metadata = self.serde.dumps_typed(latest.metadata)
+        thread_id = config["configurable"]["thread_id"]
+        updated_at = time.time()
+        refs = [v for v in latest.checkpoint.get("channel_values", {}).values()
+                if isinstance(v, str) and v.startswith(BLOB_PREFIX)]
+        self._spill.execute(
+            "INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?, ?, ?)",
+            (thread_id, checkpoint_type, checkpoint, metadata_type, metadata, updated_at),
+        )
+        self._spill.execute("DELETE FROM blobs WHERE thread_id = ?", (thread_id,))
+        for ref in refs:
+            text = state_blobs.peek(ref)
+            if text is None:
+                # Evicted already; another thread's row may still hold it.
+                self._spill.execute(
+                    "INSERT OR IGNORE INTO blobs SELECT ?, ref, text FROM blobs WHERE ref = ? LIMIT 1",
+                    (thread_id, ref),
+                )
+            else:
+                self._spill.execute("INSERT INTO blobs VALUES (?, ?, ?)", (thread_id, ref, text))
+        self._spill.commit()
+        self._spilled_at[thread_id] = updated_at
+        self._spilled.add(thread_id)
+
+    def _unspill(self, thread_id: str) -> None:
+        if self._spill is not None:
+            self._spill.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+            self._spill.execute("DELETE FROM blobs WHERE thread_id = ?", (thread_id,))
+            self._spill.commit()
+            self._spilled.discard(thread_id)
+
+    def _restore(self, thread_id: str) -> bool:
+        if self._spill is None or thread_id not in self._spilled:
+            return False
+        # Compare timestamps first so a thread this process already holds
+        # doesn't read its checkpoint blob back on every access.
+        row = self._spill.execute("SELECT updated_at FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            self._spilled.discard(thread_id)
+            return False
+        # Several worker processes may share one spill file; a newer row
+        # means another process has taken the conversation further.
+        if self.storage.get(thread_id) and row[0] <= self._spilled_at.get(thread_id, 0):
+            return False
+        row = self._spill.execute(
+            "SELECT checkpoint_type, checkpoint, metadata_type, metadata, updated_at"
+            " FROM threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        if row is None:
+            self._spilled.discard(thread_id)
+            return False
+        self._drop(thread_id)
+        checkpoint = self.serde.loads_typed((row[0], row[1]))
+        metadata = self.serde.loads_typed((row[2], row[3]))
+        for ref, text in self._spill.execute("SELECT ref, text FROM blobs WHERE thread_id = ?", (thread_id,)):
+            state_blobs.restore(ref, text)
+        self._put_tracked(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}},
+            checkpoint, metadata, checkpoint.get("channel_versions", {}),
+        )
+        self._spilled_at[thread_id] = row[4]
+        metrics.inc("checkpointer.restored")
+        self._enforce_budget()
+        logger.info(f"Restored checkpoint thread {thread_id} from the spill file")
+        return True
+
+    def _load_blob(self, ref: str) -> Optional[str]:
+        # Only reached when a blob was evicted from memory while still referenced.
+        with self._lock:
+            row = self._spill.execute("SELECT text FROM blobs WHERE ref = ? LIMIT 1", (ref,)).fetchone()
+        return row[0] if row else None
+
+    # -- BaseCheckpointSaver API ------------------------------------------
+    def _put_tracked(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self._blob_keys.setdefault(thread_id, set()).update(
+            (thread_id, checkpoint_ns, ch, v) for ch, v in new_versions.items()
+        )
+        self._prune_history(thread_id, checkpoint_ns)
+        self._touch(thread_id)
+        self._measure(thread_id)
+        return result
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            result = self._put_tracked(config, checkpoint, metadata, new_versions)
+            if self._spill is not None and not config["configurable"].get("checkpoint_ns"):
+                try:
+                    self._write_spill(result)
+                except Exception as e:
+                    logger.warning(f"Could not spill checkpoint to SQLite: {e}")
+            self._enforce_budget()
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            thread_id = config["configurable"]["thread_id"]
+            self._write_keys.setdefault(thread_id, set()).add((
+                thread_id,
+                config["configurable"].get("checkpoint_ns", ""),
+                config["configurable"]["checkpoint_id"],
+            ))
+            self._touch(thread_id)
+            self._measure(thread_id)
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._restore(thread_id)
+            result = super().get_tuple(config)
+            if result is None:
+                # InMemorySaver's defaultdict creates an empty entry on a miss.
+                if not self.storage.get(thread_id):
+                    self.storage.pop(thread_id, None)
+            else:
+                self._touch(thread_id)
+            return result
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # Materialised under the lock so eviction can't mutate storage mid-iteration.
+        with self._lock:
+            if config is not None:
+                self._restore(config["configurable"]["thread_id"])
+            items = [t for t in super().list(config, filter=filter, before=before, limit=limit)]
+        yield from items
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+            self._unspill(thread_id)
+            metrics.set("checkpointer.threads", len(self._access))
+            metrics.set("checkpointer.bytes", sum(self._sizes.values()))
+
+    # -- async API ------------------------------------------------------
+    async def _run(self, fn, *args, **kwargs):
+        if self._spill is None:
+            return fn(*args, **kwargs)
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def aget_tuple(self, config):
+        return await self._run(self.get_tuple, config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await self._run(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        # No SQLite here, but the lock may be held by a thread that is in it.
+        return await self._run(self.put_writes, config, writes, task_id, task_path)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await self._run(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self._run(self.delete_thread, thread_id)
+
+    # -- introspection --------------------------------------------------
+    def memory_usage(self) -> dict:
+        with self._lock:
+            sizes = dict(self._sizes)
+            threads = len(self._access)
+        spilled = 0
+        if self._spill is not None:
+            with self._lock:
+                spilled = self._spill.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+        return {
+            "threads": threads,
+            "bytes": sum(sizes.values()),
+            "largest_thread_bytes": max(sizes.values(), default=0),
+            "max_threads": self.max_threads,
+            "max_bytes": self.max_bytes,
+            "spilled_threads": spilled,
+            "evictions": metrics.get("checkpointer.evictions"),
+            "expired": metrics.get("checkpointer.expired"),
+            "restored": metrics.get("checkpointer.restored"),
+        }
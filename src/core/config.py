@@ -0,0 +1,213 @@
+import os
+import logging
+from dotenv import load_dotenv
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# ── Env helpers ─────────────────────────────────────────────────────
+def _get_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def _get_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    try:
+        return int(value) if value not in (None, "") else default
+    except ValueError:
+        logger.warning(f"Invalid integer for {name}={value!r}; using default {default}")
+        return default
+
+def _get_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        logger.warning(f"Invalid float for {name}={value!r}; using default {default}")
+        return default
+
+# ── Semantic answer cache ───────────────────────────────────────────
+SEMANTIC_CACHE_ENABLED = _get_bool("SEMANTIC_CACHE_ENABLED", True)
+SEMANTIC_CACHE_THRESHOLD = _get_float("SEMANTIC_CACHE_THRESHOLD", 0.95)
+SEMANTIC_CACHE_MAX_ENTRIES = _get_int("SEMANTIC_CACHE_MAX_ENTRIES", 1000)
+SEMANTIC_CACHE_TTL_SECONDS = _get_float("SEMANTIC_CACHE_TTL_SECONDS", 3600)
+
+# ── Document ingestion pipeline ─────────────────────────────────────
+# 0 → pick a worker count from the number of CPUs.
+INGEST_WORKERS = _get_int("INGEST_WORKERS", 0)
+INGEST_EMBED_BATCH_SIZE = _get_int("INGEST_EMBED_BATCH_SIZE", 64)
+INGEST_EMBED_CONCURRENCY = _get_int("INGEST_EMBED_CONCURRENCY", 4)
+INGEST_QUEUE_SIZE = _get_int("INGEST_QUEUE_SIZE", 8)
+INGEST_RECURSIVE = _get_bool("INGEST_RECURSIVE", True)
+
+# ── Graph topology ──────────────────────────────────────────────────
+# staged: router → RAG + judge → (web) → answer, up to three LLM round trips.
+# fused:  retrieval first, then one call that answers and flags insufficient
+#         context, falling back to web → answer only when flagged.
+GRAPH_TOPOLOGY = os.getenv("GRAPH_TOPOLOGY", "staged").strip().lower()
+
+# ── Speculative web search ──────────────────────────────────────────
+# off          - web search only starts after the RAG judge says "insufficient"
+# with_judge   - start Tavily in parallel with the judge call
+# on_rag_route - start Tavily as soon as the turn is routed to RAG (parallel
+#                with retrieval and the judge)
+SPECULATIVE_WEB_MODE = os.getenv("SPECULATIVE_WEB_MODE", "off").strip().lower()
+SPECULATIVE_WEB_MAX_WORKERS = _get_int("SPECULATIVE_WEB_MAX_WORKERS", 8)
+
+# ── Retrieval sufficiency fast path ─────────────────────────────────
+# Top cosine similarity >= HIGH skips the judge and answers; < LOW skips it and
+# goes to the web. Thresholds learned with
+# `python -m src.agents.sufficiency calibrate` take precedence.
+SUFFICIENCY_FAST_PATH = _get_bool("SUFFICIENCY_FAST_PATH", True)
+SUFFICIENCY_HIGH_THRESHOLD = _get_float("SUFFICIENCY_HIGH_THRESHOLD", 0.75)
+SUFFICIENCY_LOW_THRESHOLD = _get_float("SUFFICIENCY_LOW_THRESHOLD", 0.15)
+# Fraction of fast-path decisions that are also judged (off the request path)
+# so calibration sees verdicts outside the current (low, high) band.
+SUFFICIENCY_AUDIT_RATE = _get_float("SUFFICIENCY_AUDIT_RATE", 0.05)
+SUFFICIENCY_VERDICT_LOG_PATH = os.getenv("SUFFICIENCY_VERDICT_LOG_PATH", "vector_store/judge_verdicts.jsonl")
+SUFFICIENCY_THRESHOLDS_PATH = os.getenv("SUFFICIENCY_THRESHOLDS_PATH", "vector_store/sufficiency_thresholds.json")
+
+# ── Local pre-router ────────────────────────────────────────────────
+# Rules (uploads, greetings) and a nearest-centroid classifier answer the
+# easy routing decisions; router_llm only sees the low-confidence rest.
+PREROUTER_ENABLED = _get_bool("PREROUTER_ENABLED", True)
+PREROUTER_CLASSIFIER = _get_bool("PREROUTER_CLASSIFIER", True)
+PREROUTER_MIN_SIMILARITY = _get_float("PREROUTER_MIN_SIMILARITY", 0.55)
+PREROUTER_MIN_MARGIN = _get_float("PREROUTER_MIN_MARGIN", 0.12)
+# Optional JSONL of extra labelled examples: {"text": "...", "route": "rag|answer|end"}
+PREROUTER_EXAMPLES_PATH = os.getenv("PREROUTER_EXAMPLES_PATH", "")
+
+# ── Conversation checkpoints ────────────────────────────────────────
+# Threads idle for SESSION_TIMEOUT_SECONDS are dropped; past the thread / byte
+# budgets the least recently used threads are evicted. Only the last
+# CHECKPOINT_MAX_HISTORY checkpoints of a thread are kept (0 keeps all).
+SESSION_TIMEOUT_SECONDS = _get_int("SESSION_TIMEOUT_SECONDS", 600)
+CHECKPOINT_MAX_THREADS = _get_int("CHECKPOINT_MAX_THREADS", 1000)
+CHECKPOINT_MAX_BYTES = _get_int("CHECKPOINT_MAX_BYTES", 256 * 1024 * 1024)
+CHECKPOINT_MAX_HISTORY = _get_int("CHECKPOINT_MAX_HISTORY", 4)
+# SQLite file the latest checkpoint of each thread is written through to, so
+# evicted threads and restarts don't lose conversations. Empty disables it.
+CHECKPOINT_SPILL_PATH = os.getenv("CHECKPOINT_SPILL_PATH", "")
+# Retrieved / web / uploaded context of STATE_BLOB_MIN_CHARS or more is kept in
+# a content-addressed store (up to STATE_BLOB_MAX_BYTES) and referenced from
+# the checkpoints instead of being copied into them. With CHECKPOINT_SPILL_PATH
+# the blobs of each spilled checkpoint are written to the same SQLite file.
+STATE_BLOB_MIN_CHARS = _get_int("STATE_BLOB_MIN_CHARS", 1024)
+STATE_BLOB_MAX_BYTES = _get_int("STATE_BLOB_MAX_BYTES", 64 * 1024 * 1024)
+
+# ── Prompt token budgets ────────────────────────────────────────────
+# The answer prompt sees a rolling summary of older turns plus the last
+# HISTORY_RECENT_TURNS turns verbatim, capped at HISTORY_TOKEN_BUDGET tokens.
+HISTORY_RECENT_TURNS = _get_int("HISTORY_RECENT_TURNS", 4)
+HISTORY_TOKEN_BUDGET = _get_int("HISTORY_TOKEN_BUDGET", 2000)
+HISTORY_SUMMARY_TOKENS = _get_int("HISTORY_SUMMARY_TOKENS", 400)
+ROUTER_TOKEN_BUDGET = _get_int("ROUTER_TOKEN_BUDGET", 1000)
+JUDGE_TOKEN_BUDGET = _get_int("JUDGE_TOKEN_BUDGET", 3000)
+ANSWER_CONTEXT_TOKEN_BUDGET = _get_int("ANSWER_CONTEXT_TOKEN_BUDGET", 6000)
+
+# ── Uploaded documents ──────────────────────────────────────────────
+# Uploads are chunked into a per-session in-memory index; the answer prompt
+# gets the UPLOAD_RETRIEVER_K most relevant chunks instead of raw pages.
+UPLOAD_RETRIEVER_K = _get_int("UPLOAD_RETRIEVER_K", 4)
+UPLOAD_MAX_SESSIONS = _get_int("UPLOAD_MAX_SESSIONS", 200)
+UPLOAD_MAX_CHUNKS = _get_int("UPLOAD_MAX_CHUNKS", 2000)
+
+# ── KB retrieval ────────────────────────────────────────────────────
+# Hybrid retrieval: FAISS and BM25 candidates (from the chunk store's on-disk
+# FTS5 index) fused with reciprocal rank fusion, optionally reranked by a local cross-encoder (needs
+# sentence-transformers), then diversified with MMR down to RAG_TOP_K.
+RAG_TOP_K = _get_int("RAG_TOP_K", 2)
+RAG_HYBRID = _get_bool("RAG_HYBRID", True)
+RAG_CANDIDATES = _get_int("RAG_CANDIDATES", 20)
+RAG_RRF_K = _get_int("RAG_RRF_K", 60)
+RAG_MMR_LAMBDA = _get_float("RAG_MMR_LAMBDA", 0.7)   # 1.0 disables MMR
+RAG_RERANKER = os.getenv("RAG_RERANKER", "")      # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+
+# ── FAISS index ─────────────────────────────────────────────────────
+# flat (exact) | hnsw | ivf | ivfpq. Approximate types are built from the flat
+# master index, training on up to FAISS_TRAIN_SAMPLE vectors. Compare them with
+# `python -m src.tools.faiss_index benchmark`.
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").strip().lower()
+FAISS_MMAP = _get_bool("FAISS_MMAP", False)
+FAISS_TRAIN_SAMPLE = _get_int("FAISS_TRAIN_SAMPLE", 50000)
+FAISS_HNSW_M = _get_int("FAISS_HNSW_M", 32)
+FAISS_HNSW_EF_SEARCH = _get_int("FAISS_HNSW_EF_SEARCH", 64)
+FAISS_IVF_NLIST = _get_int("FAISS_IVF_NLIST", 0)        # 0 = about 4·sqrt(#chunks)
+FAISS_IVF_NPROBE = _get_int("FAISS_IVF_NPROBE", 16)
+FAISS_PQ_M = _get_int("FAISS_PQ_M", 16)
+
+# ── KB versions ─────────────────────────────────────────────────────
+# `python scripts/build_vector_store.py` publishes immutable index versions;
+# serving processes load the published one and poll for newer ones every
+# KB_RELOAD_INTERVAL_SECONDS (0 = never). Without a published version they
+# fail to start, unless KB_AUTO_BUILD lets them build one (local development).
+KB_AUTO_BUILD = _get_bool("KB_AUTO_BUILD", False)
+KB_KEEP_VERSIONS = _get_int("KB_KEEP_VERSIONS", 3)
+KB_RELOAD_INTERVAL_SECONDS = _get_float("KB_RELOAD_INTERVAL_SECONDS", 30.0)
+
+# ── KB collections ──────────────────────────────────────────────────
+# With KB_COLLECTIONS, every subdirectory of the source folder is its own
+# collection with its own index (PDFs directly in it form the "default" one).
+# Each query searches the collections whose centroid is closest to it: the
+# best one plus those within KB_COLLECTION_MARGIN cosine similarity, at most
+# KB_COLLECTIONS_PER_QUERY, in parallel. At most KB_MAX_LOADED_COLLECTIONS
+# stay loaded per process, least recently searched evicted first.
+KB_COLLECTIONS = _get_bool("KB_COLLECTIONS", False)
+KB_COLLECTIONS_PER_QUERY = _get_int("KB_COLLECTIONS_PER_QUERY", 2)
+KB_COLLECTION_MARGIN = _get_float("KB_COLLECTION_MARGIN", 0.05)
+KB_MAX_LOADED_COLLECTIONS = _get_int("KB_MAX_LOADED_COLLECTIONS", 4)
+
+# ── Web search cache ────────────────────────────────────────────────
+# Results are cached per normalized query; concurrent identical queries share
+# one in-flight request. WEB_CACHE_PATH (SQLite) keeps them across restarts.
+WEB_CACHE_ENABLED = _get_bool("WEB_CACHE_ENABLED", True)
+WEB_CACHE_TTL_SECONDS = _get_int("WEB_CACHE_TTL_SECONDS", 900)
+WEB_CACHE_MAX_ENTRIES = _get_int("WEB_CACHE_MAX_ENTRIES", 2000)
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", "")
+
+# ── HTTP API ────────────────────────────────────────────────────────
+# `python -m src.server` serves the agent over HTTP. Per worker, at most
+# API_MAX_CONCURRENCY turns run at once and API_MAX_QUEUE more may wait up to
+# API_QUEUE_TIMEOUT_SECONDS for a slot; beyond that requests get a 503.
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = _get_int("API_PORT", 8000)
+API_WORKERS = _get_int("API_WORKERS", 1)
+API_MAX_CONCURRENCY = _get_int("API_MAX_CONCURRENCY", 16)
+API_MAX_QUEUE = _get_int("API_MAX_QUEUE", 64)
+API_QUEUE_TIMEOUT_SECONDS = _get_float("API_QUEUE_TIMEOUT_SECONDS", 30.0)
+API_MAX_UPLOAD_BYTES = _get_int("API_MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+
+# ── Telemetry ───────────────────────────────────────────────────────
+# Per-node, LLM, embedding, retrieval and web-search timings, tokens and
+# estimated cost, exported at GET /metrics. TELEMETRY_TRACING also emits
+# OpenTelemetry spans (needs opentelemetry-api and a configured SDK).
+TELEMETRY_ENABLED = _get_bool("TELEMETRY_ENABLED", True)
+TELEMETRY_TRACING = _get_bool("TELEMETRY_TRACING", False)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()   # DEBUG also logs prompts, context and answers
+
+# ── Query embedding batching ────────────────────────────────────────
+# Concurrent query embeddings are collected for EMBED_BATCH_WINDOW_MS (or until
+# EMBED_BATCH_MAX are waiting) and sent as one request; recent query vectors
+# are kept in an LRU of EMBED_QUERY_CACHE_SIZE entries.
+EMBED_BATCHING = _get_bool("EMBED_BATCHING", True)
+EMBED_BATCH_WINDOW_MS = _get_float("EMBED_BATCH_WINDOW_MS", 5.0)
+EMBED_BATCH_MAX = _get_int("EMBED_BATCH_MAX", 64)
+EMBED_QUERY_CACHE_SIZE = _get_int("EMBED_QUERY_CACHE_SIZE", 1024)
+
+# ── LLM client pool ─────────────────────────────────────────────────
+# Shared by every call to a model: HTTP connection pool, concurrency limit,
+# request-rate token bucket (0 = unlimited) and circuit breaker. Transient
+# errors are retried with jittered backoff. LLM_HEDGE_AFTER_SECONDS > 0 sends
+# a duplicate router / judge request when the first is slower than that.
+LLM_TIMEOUT_SECONDS = _get_float("LLM_TIMEOUT_SECONDS", 30.0)
+LLM_MAX_ATTEMPTS = _get_int("LLM_MAX_ATTEMPTS", 3)
+LLM_MAX_CONCURRENCY = _get_int("LLM_MAX_CONCURRENCY", 32)
+LLM_MAX_CONNECTIONS = _get_int("LLM_MAX_CONNECTIONS", 100)
+LLM_REQUESTS_PER_MINUTE = _get_int("LLM_REQUESTS_PER_MINUTE", 0)
+LLM_HEDGE_AFTER_SECONDS = _get_float("LLM_HEDGE_AFTER_SECONDS", 0.0)
+LLM_BREAKER_FAILURES = _get_int("LLM_BREAKER_FAILURES", 5)
+LLM_BREAKER_COOLDOWN_SECONDS = _get_float("LLM_BREAKER_COOLDOWN_SECONDS", 30.0)
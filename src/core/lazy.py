@@ -0,0 +1,67 @@
+import time
+import logging
+import threading
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# ── Lazy process-wide singletons ────────────────────────────────────
+class Lazy(Generic[T]):
+    """
+    A process-wide singleton that is built on first use instead of at import
+    time. Construction is thread-safe and timed; the timing shows up in
+    `startup_report()`.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._ready = False
+        self.init_seconds: Optional[float] = None
+        _registry[name] = self
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def get(self) -> T:
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                logger.info(f"Initializing {self.name}...")
+                started = time.perf_counter()
+                self._value = self._factory()
+                self.init_seconds = time.perf_counter() - started
+                self._ready = True
+                logger.info(f"{self.name} initialized in {self.init_seconds:.2f}s")
+        return self._value
+
+    def set(self, value: T) -> None:
+        """Replaces the current instance, e.g. after a hot reload."""
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+            self._ready = False
+            self.init_seconds = None
+
+
+_registry: Dict[str, Lazy] = {}
+
+
+def registered() -> Dict[str, Lazy]:
+    return dict(_registry)
+
+
+def startup_report() -> Dict[str, Optional[float]]:
+    """Seconds each singleton took to build; None for those not built yet."""
+    return {name: lazy.init_seconds for name, lazy in _registry.items()}
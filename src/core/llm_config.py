@@ -1,35 +1,78 @@
 import os
 import logging
 from langchain_openai import ChatOpenAI
-from src.core.state import RouteDecision, RagJudge
+from src.core.state import RouteDecision, RagJudge, FusedAnswer
+from src.core import config
+from src.core.lazy import Lazy
+from src.core.llm_pool import ResilientLLM, http_clients
+from src.core.telemetry import LLMUsageHandler
 from dotenv import load_dotenv
 
 # ── LOGGING ─────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
 # ── Load environment variables ────────────────────────────────────────
-try:
-    logger.info("Loading environment variables...")
-    load_dotenv()
-    os.environ["LANGSMITH_TRACING"] = 'true'
-    os.environ["LANGSMITH_ENDPOINT"] = 'https://api.smith.langchain.com'
-    os.environ["LANGSMITH_API_KEY"] = os.getenv('LANGSMITH_API_KEY')
-    os.environ["LANGSMITH_PROJECT"] = 'Rag_agent_project'
-    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-    logger.info("Environment variables loaded successfully.")
-except Exception as e:
-    logger.error(f"Error loading environment variables: {e}")
-    raise
+_env_loaded = False
+
+def load_environment():
+    """Exports the API keys and LangSmith settings. Safe to call repeatedly."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    try:
+        logger.info("Loading environment variables...")
+        load_dotenv()
+        os.environ["LANGSMITH_TRACING"] = 'true'
+        os.environ["LANGSMITH_ENDPOINT"] = 'https://api.smith.langchain.com'
+        os.environ["LANGSMITH_PROJECT"] = 'Rag_agent_project'
+        for key in ("LANGSMITH_API_KEY", "OPENAI_API_KEY"):
+            if not os.getenv(key):
+                logger.warning(f"{key} is not set")
+        _env_loaded = True
+        logger.info("Environment variables loaded successfully.")
+    except Exception as e:
+        logger.error(f"Error loading environment variables: {e}")
+        raise
 
 # ── LLM instances with structured output where needed ───────────────
-try:
-    logger.info("Initializing LLM instances...")
-    router_llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0)\
-                 .with_structured_output(RouteDecision)
-    judge_llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0)\
-                .with_structured_output(RagJudge)
-    answer_llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.7)
-    logger.info("LLM instances initialized successfully.")
-except Exception as e:
-    logger.error(f"Error initializing LLM instances: {e}")
-    raise
+# Built lazily on first use (or by src.warmup) rather than at import time.
+CHAT_MODEL = "gpt-4.1-mini"
+
+def _chat_model(temperature: float, role: str) -> ChatOpenAI:
+    load_environment()
+    # The usage handler records latency, tokens and cost per role; streamed
+    # calls only report usage with stream_usage on. Retries are left to
+    # ResilientLLM so they respect the pool's limits and circuit breaker.
+    return ChatOpenAI(model=CHAT_MODEL, temperature=temperature, stream_usage=True,
+                      timeout=config.LLM_TIMEOUT_SECONDS, max_retries=0,
+                      callbacks=[LLMUsageHandler(role, CHAT_MODEL)], **http_clients())
+
+def _resilient(runnable, role: str, hedge: bool = False) -> ResilientLLM:
+    # All roles share CHAT_MODEL's pool: one concurrency limit, rate limit and breaker.
+    return ResilientLLM(runnable, CHAT_MODEL, role,
+                        hedge_after=config.LLM_HEDGE_AFTER_SECONDS if hedge else 0.0)
+
+_router_llm = Lazy("router_llm", lambda: _resilient(
+    _chat_model(0, "router").with_structured_output(RouteDecision), "router", hedge=True))
+_judge_llm = Lazy("judge_llm", lambda: _resilient(
+    _chat_model(0, "judge").with_structured_output(RagJudge), "judge", hedge=True))
+_answer_llm = Lazy("answer_llm", lambda: _resilient(_chat_model(0.7, "answer"), "answer"))
+_summary_llm = Lazy("summary_llm", lambda: _resilient(_chat_model(0, "summary"), "summary"))
+# Only used by the fused graph topology (GRAPH_TOPOLOGY=fused).
+_fused_llm = Lazy("fused_llm", lambda: _resilient(
+    _chat_model(0.7, "fused").with_structured_output(FusedAnswer), "fused"))
+
+def get_router_llm() -> ResilientLLM:
+    return _router_llm.get()
+
+def get_judge_llm() -> ResilientLLM:
+    return _judge_llm.get()
+
+def get_answer_llm() -> ResilientLLM:
+    return _answer_llm.get()
+
+def get_summary_llm() -> ResilientLLM:
+    return _summary_llm.get()
+
+def get_fused_llm() -> ResilientLLM:
+    return _fused_llm.get()
@@ -0,0 +1,419 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import openai
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from src.core import config
+from src.core.lazy import Lazy
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying (and counted by the circuit breaker). Anything else,
+# e.g. a malformed structured output, is raised straight away.
+TRANSIENT_ERRORS: Tuple[type, ...] = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    httpx.TimeoutException,
+    TimeoutError,
+)
+
+
+class LLMUnavailable(Exception):
+    """The model can't serve the call right now: retries exhausted, queue timeout or circuit open."""
+
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+
+# ── Shared HTTP connection pool ─────────────────────────────────────
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=config.LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=config.LLM_MAX_CONNECTIONS)
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """
+    An httpx.AsyncClient that can be shared across event loops. Connections
+    belong to the loop that opened them, and the Streamlit app runs every turn
+    under a fresh asyncio.run, so each request is sent through a pooled client
+    owned by the running loop; clients of loops that have closed are dropped.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._loop_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self._loop_lock = threading.Lock()
+
+    def _loop_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._loop_lock:
+            for closed in [other for other in self._loop_clients if other.is_closed()]:
+                # Its connections died with the loop; nothing left to close.
+                del self._loop_clients[closed]
+            client = self._loop_clients.get(loop)
+            if client is None:
+                client = self._loop_clients[loop] = httpx.AsyncClient(**self._client_kwargs)
+            return client
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await self._loop_client().send(request, **kwargs)
+
+    async def aclose(self) -> None:
+        with self._loop_lock:
+            client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+        await super().aclose()
+
+
+# One pool for every OpenAI client (chat models and embeddings) instead of
+# one per client; keep-alive connections are reused across calls (per event
+# loop for async calls).
+_http_client: Lazy[httpx.Client] = Lazy("llm_http_client", lambda: httpx.Client(
+    limits=_limits(), timeout=config.LLM_TIMEOUT_SECONDS))
+_http_async_client: Lazy[httpx.AsyncClient] = Lazy("llm_http_async_client", lambda: LoopLocalAsyncClient(
+    limits=_limits(), timeout=config.LLM_TIMEOUT_SECONDS))
+
+
+def http_clients() -> Dict[str, Any]:
+    """Keyword arguments that make an OpenAI client use the shared pool."""
+    return {"http_client": _http_client.get(), "http_async_client": _http_async_client.get()}
+
+
+# ── Per-model limits ────────────────────────────────────────────────
+class ConcurrencyLimit:
+    """
+    At most `limit` calls in flight, shared by threads and by coroutines on any
+    event loop (the Streamlit app runs each turn on a fresh loop, so an
+    asyncio.Semaphore can't be shared). Coroutines poll with a short backoff.
+    """
+
+    def __init__(self, limit: int):
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self, timeout: float) -> bool:
+        return self._semaphore.acquire(timeout=timeout)
+
+    def try_acquire(self) -> bool:
+        return self._semaphore.acquire(blocking=False)
+
+    async def aacquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        delay = 0.002
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return True
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive transient failures and rejects calls for
+    `cooldown_seconds`; then lets one trial call through (half-open), closing
+    again if it succeeds.
+    """
+
+    def __init__(self, name: str, failures: int, cooldown_seconds: float):
+        self.name = name
+        self.failures = failures
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown_seconds else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown_seconds or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+        metrics.set("llm_pool.breaker_open", 0, model=self.name)
+
+    def abandon_trial(self) -> None:
+        """A call ended without telling whether the model is healthy (cancelled, queue timeout)."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            trip = self._trial or (self._opened_at is None and self._consecutive >= self.failures)
+            self._trial = False
+            if trip:
+                self._opened_at = time.monotonic()
+        if trip:
+            logger.warning(f"Circuit for {self.name} opened after {self._consecutive} failures")
+            metrics.inc("llm_pool.breaker_trips", model=self.name)
+            metrics.set("llm_pool.breaker_open", 1, model=self.name)
+
+
+class ModelPool:
+    """Concurrency limit, request-rate token bucket and circuit breaker shared by all roles of one model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.limit = ConcurrencyLimit(config.LLM_MAX_CONCURRENCY)
+        rpm = config.LLM_REQUESTS_PER_MINUTE
+        self.rate_limiter = InMemoryRateLimiter(
+            requests_per_second=rpm / 60, check_every_n_seconds=0.05, max_bucket_size=max(1, rpm // 60),
+        ) if rpm > 0 else None
+        self.breaker = CircuitBreaker(model, config.LLM_BREAKER_FAILURES, config.LLM_BREAKER_COOLDOWN_SECONDS)
+
+
+_pools: Dict[str, ModelPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(model: str) -> ModelPool:
+    with _pools_lock:
+        pool = _pools.get(model)
+        if pool is None:
+            pool = _pools[model] = ModelPool(model)
+        return pool
+
+
+def pool_report() -> Dict[str, dict]:
+    with _pools_lock:
+        return {model: {"breaker": pool.breaker.state} for model, pool in _pools.items()}
+
+
+# ── Resilient calls ─────────────────────────────────────────────────
+def _backoff(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it sent one."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), config.LLM_TIMEOUT_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+
+
+# Runs both requests of hedged sync calls; threads are only started on demand.
+_hedge_executor = ThreadPoolExecutor(max_workers=2 * max(1, config.LLM_MAX_CONCURRENCY),
+                                     thread_name_prefix="llm-hedge")
+
+
+class ResilientLLM(Runnable):
+    """
+    Wraps a chat model (or structured-output chain) so every call goes through
+    its model's pool: circuit breaker, concurrency limit, rate limit, then the
+    call with jittered retries on transient errors. Raises LLMUnavailable when
+    the model can't answer, so callers can degrade instead of failing the turn.
+
+    With `hedge_after` > 0, a call still running after that many seconds gets a
+    duplicate request, if the pool has spare capacity, and the first answer
+    wins. Meant for the small router / judge calls whose tail latency is
+    dominated by upstream hiccups; not for streamed answers.
+    """
+
+    def __init__(self, runnable: Runnable, model: str, role: str, hedge_after: float = 0.0):
+        self.runnable = runnable
+        self.pool = get_pool(model)
+        self.role = role
+        self.hedge_after = hedge_after
+
+    def _admit(self) -> None:
+        if not self.pool.breaker.allow():
+            metrics.inc("llm_pool.breaker_rejections", role=self.role)
+            raise CircuitOpenError(f"{self.pool.model} is unavailable (circuit open)")
+
+    def _failed(self, attempt: int, error: Exception) -> bool:
+        """Records a transient failure; True when the call should be retried."""
+        self.pool.breaker.record_failure()
+        if attempt + 1 >= config.LLM_MAX_ATTEMPTS or self.pool.breaker.state != "closed":
+            metrics.inc("llm_pool.failures", role=self.role)
+            return False
+        metrics.inc("llm_pool.retries", role=self.role)
+        logger.warning(f"{self.role} LLM call failed ({type(error).__name__}: {error}); retrying")
+        return True
+
+    # -- sync --------------------------------------------------------------
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        self._admit()
+        for attempt in range(_attempts()):
+            try:
+                result = self._call(input, config, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                if not self._failed(attempt, e):
+                    raise LLMUnavailable(f"{self.role} LLM call failed: {e}") from e
+                time.sleep(_backoff(attempt, e))
+                continue
+            except LLMUnavailable:
+                self.pool.breaker.abandon_trial()
+                raise
+            except Exception:
+                # The model did answer, just not usefully (e.g. bad structured output).
+                self.pool.breaker.record_success()
+                raise
+            except BaseException:
+                self.pool.breaker.abandon_trial()
+                raise
+            self.pool.breaker.record_success()
+            return result
+
+    def _call(self, input, config, **kwargs):
+        queued = time.perf_counter()
+        if not self.pool.limit.acquire(timeout=_timeout()):
+            raise LLMUnavailable(f"Timed out waiting for a free {self.pool.model} slot")
+        owned = True
+        try:
+            metrics.observe("llm_pool.queue_seconds", time.perf_counter() - queued, model=self.pool.model)
+            if self.pool.rate_limiter is not None:
+                self.pool.rate_limiter.acquire()
+            if self.hedge_after <= 0:
+                return self.runnable.invoke(input, config, **kwargs)
+            # A losing request can't be cancelled, so each request releases
+            # its own slot when it actually finishes.
+            owned = False
+            return self._hedged(input, config, **kwargs)
+        finally:
+            if owned:
+                self.pool.limit.release()
+
+    def _hedged(self, input, config, **kwargs):
+        primary = _hedge_executor.submit(self._release_after, self.runnable.invoke, input, config, **kwargs)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done or not self._reserve_hedge():
+            return primary.result()
+        metrics.inc("llm_pool.hedges", role=self.role)
+        hedge = _hedge_executor.submit(self._release_after, self.runnable.invoke, input, config, **kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        metrics.inc("llm_pool.hedge_wins", role=self.role)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _reserve_hedge(self) -> bool:
+        # A hedge only goes out on spare capacity, never queues.
+        if not self.pool.limit.try_acquire():
+            return False
+        if self.pool.rate_limiter is not None and not self.pool.rate_limiter.acquire(blocking=False):
+            self.pool.limit.release()
+            return False
+        return True
+
+    def _release_after(self, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.pool.limit.release()
+
+    # -- async -------------------------------------------------------------
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        self._admit()
+        for attempt in range(_attempts()):
+            try:
+                result = await self._acall(input, config, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                if not self._failed(attempt, e):
+                    raise LLMUnavailable(f"{self.role} LLM call failed: {e}") from e
+                await asyncio.sleep(_backoff(attempt, e))
+                continue
+            except LLMUnavailable:
+                self.pool.breaker.abandon_trial()
+                raise
+            except Exception:
+                # The model did answer, just not usefully (e.g. bad structured output).
+                self.pool.breaker.record_success()
+                raise
+            except BaseException:
+                self.pool.breaker.abandon_trial()
+                raise
+            self.pool.breaker.record_success()
+            return result
+
+    async def _acall(self, input, config, **kwargs):
+        queued = time.perf_counter()
+        if not await self.pool.limit.aacquire(timeout=_timeout()):
+            raise LLMUnavailable(f"Timed out waiting for a free {self.pool.model} slot")
+        try:
+            metrics.observe("llm_pool.queue_seconds", time.perf_counter() - queued, model=self.pool.model)
+            if self.pool.rate_limiter is not None:
+                await self.pool.rate_limiter.aacquire()
+            if self.hedge_after <= 0:
+                return await self.runnable.ainvoke(input, config, **kwargs)
+            return await self._ahedged(input, config, **kwargs)
+        finally:
+            self.pool.limit.release()
+
+    async def _ahedged(self, input, config, **kwargs):
+        primary = asyncio.ensure_future(self.runnable.ainvoke(input, config, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done or not self._reserve_hedge():
+            return await primary
+        metrics.inc("llm_pool.hedges", role=self.role)
+
+        async def hedge_call():
+            try:
+                return await self.runnable.ainvoke(input, config, **kwargs)
+            finally:
+                self.pool.limit.release()
+
+        hedge = asyncio.ensure_future(hedge_call())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.inc("llm_pool.hedge_wins", role=self.role)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _attempts() -> int:
+    return max(1, config.LLM_MAX_ATTEMPTS)
+
+
+def _timeout() -> float:
+    return config.LLM_TIMEOUT_SECONDS
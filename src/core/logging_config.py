@@ -1,10 +1,11 @@
 
 import logging
 import sys
+from src.core import config
 
 def setup_logging():
     logging.basicConfig(
-        level=logging.INFO,
+        level=config.LOG_LEVEL,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         handlers=[
             logging.StreamHandler(sys.stdout)
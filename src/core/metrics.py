@@ -0,0 +1,129 @@
+import re
+import bisect
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_INVALID = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _split_key(key: str) -> Tuple[str, str]:
+    name, brace, rest = key.partition("{")
+    return name, brace + rest
+
+
+def _prometheus_name(namespace: str, name: str) -> str:
+    return _INVALID.sub("_", f"{namespace}_{name}")
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# ── Process-wide metrics registry ───────────────────────────────────
+class MetricsRegistry:
+    """
+    Minimal thread-safe counter (and gauge) store shared by the caches, routers and tools.
+    Counter names are dotted strings, e.g. "semantic_cache.hits"; labelled
+    ones are stored as 'llm.tokens{role="router"}'. Latencies go into
+    histograms via `observe`, and `prometheus()` exports everything in the
+    Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._histograms: Dict[str, _Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, /, **labels: str) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set(self, name: str, value: float, /, **labels: str) -> None:
+        """Overwrites a value; used for gauges such as current memory use."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = value
+
+    def get(self, name: str, /, **labels: str) -> float:
+        key = _key(name, labels)
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def observe(self, name: str, value: float, /, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels: str) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self, prefix: str = "") -> Dict[str, float]:
+        with self._lock:
+            return {k: v for k, v in self._counters.items() if k.startswith(prefix)}
+
+    def histograms(self, prefix: str = "") -> Dict[str, dict]:
+        """{key: {"count", "sum", "buckets": {le: cumulative count}}}"""
+        with self._lock:
+            out = {}
+            for key, h in self._histograms.items():
+                if key.startswith(prefix):
+                    cumulative, running = {}, 0
+                    for bound, count in zip(list(h.buckets) + [float("inf")], h.counts):
+                        running += count
+                        cumulative[bound] = running
+                    out[key] = {"count": h.count, "sum": h.sum, "buckets": cumulative}
+            return out
+
+    def prometheus(self, namespace: str = "rag_agent") -> str:
+        """All counters, gauges and histograms in the Prometheus text exposition format."""
+        lines: List[str] = []
+        typed = set()
+        for key, value in sorted(self.snapshot().items()):
+            name, labels = _split_key(key)
+            metric = _prometheus_name(namespace, name)
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} untyped")
+                typed.add(metric)
+            lines.append(f"{metric}{labels} {value}")
+        for key, h in sorted(self.histograms().items()):
+            name, labels = _split_key(key)
+            metric = _prometheus_name(namespace, name)
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            inner = labels[1:-1]
+            for bound, count in h["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_text = f'{inner},le="{le}"' if inner else f'le="{le}"'
+                lines.append(f"{metric}_bucket{{{label_text}}} {count}")
+            lines.append(f"{metric}_sum{labels} {h['sum']}")
+            lines.append(f"{metric}_count{labels} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = MetricsRegistry()
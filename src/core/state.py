@@ -1,6 +1,8 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional,Literal,TypedDict
+from typing import Annotated, List, Optional,Literal,TypedDict
 from langchain_core.messages import BaseMessage
+from langgraph.graph.message import add_messages
+from src.core.blobs import store_blob
 
 class RouteDecision(BaseModel):
     route: Literal["rag", "answer", "end"]
@@ -8,12 +10,24 @@ class RouteDecision(BaseModel):
 
 class RagJudge(BaseModel):
     sufficient: bool
+
+class FusedAnswer(BaseModel):
+    """Answer and sufficiency verdict of the fused topology's single call."""
+    sufficient: bool = Field(description="False when the question needs information that is neither in "
+                                         "the context nor general knowledge (e.g. recent events)")
+    answer: str = Field("", description="The answer; empty when not sufficient")
     
 
 # ── Shared state type ────────────────────────────────────────────────
+# Nodes return only the keys they change. `messages` is appended to (and
+# trimmed with RemoveMessage); the large context strings are stored by
+# reference, so read them through src.core.blobs.resolve.
 class AgentState(TypedDict, total=False):
-    messages: List[BaseMessage]
-    upload_file_content: Optional[str]
-    route:    Literal["rag", "answer", "end"]
-    rag:      str
-    web:      str
\ No newline at end of file
+    messages: Annotated[List[BaseMessage], add_messages]
+    upload_file_content: Annotated[str, store_blob]
+    upload_session: Optional[str]   # key of the session's uploaded-document index
+    new_upload: bool    # this turn came with a newly uploaded document
+    route:    Literal["rag", "answer", "web", "fused", "end"]
+    rag:      Annotated[str, store_blob]
+    web:      Annotated[str, store_blob]
+    summary:  str       # rolling summary of turns no longer kept verbatim
\ No newline at end of file
@@ -0,0 +1,185 @@
+import time
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.core import config
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# USD per million (input, output) tokens, for cost estimates
+PRICES_PER_MILLION: Dict[str, tuple] = {
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: float, completion_tokens: float = 0) -> float:
+    input_price, output_price = PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+# ── Optional trace spans (OpenTelemetry) ────────────────────────────
+def _load_tracer():
+    if not config.TELEMETRY_TRACING:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("TELEMETRY_TRACING is set but opentelemetry-api is not installed; tracing disabled")
+        return None
+    return trace.get_tracer("rag_agent")
+
+
+_tracer = _load_tracer()
+
+
+@contextmanager
+def span(kind: str, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Times a block as one operation: observes "<kind>.seconds{name=...}",
+    counts "<kind>.errors{name=...}" when it raises, and, with tracing on,
+    emits a trace span. The yielded dict takes extra span attributes.
+    """
+    if not config.TELEMETRY_ENABLED:
+        yield attributes
+        return
+    started = time.perf_counter()
+    otel = _tracer.start_as_current_span(f"{kind}.{name}") if _tracer is not None else None
+    current = otel.__enter__() if otel is not None else None
+    try:
+        yield attributes
+    except BaseException as e:
+        metrics.inc(f"{kind}.errors", name=name)
+        if otel is not None:
+            otel.__exit__(type(e), e, e.__traceback__)
+        raise
+    else:
+        if otel is not None:
+            for key, value in attributes.items():
+                if isinstance(value, (str, bool, int, float)):
+                    current.set_attribute(key, value)
+            otel.__exit__(None, None, None)
+    finally:
+        metrics.observe(f"{kind}.seconds", time.perf_counter() - started, name=name)
+
+
+# ── Graph nodes ─────────────────────────────────────────────────────
+def _record_route(node: str, out: Any) -> None:
+    if isinstance(out, dict) and out.get("route"):
+        metrics.inc("graph.routes", node=node, route=out["route"])
+
+
+def instrument_node(name: str, func: Callable) -> Callable:
+    """Wraps a (sync or async) graph node in a "node" span and counts the route it picks."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def awrapper(*args, **kwargs):
+            with span("node", name):
+                out = await func(*args, **kwargs)
+            _record_route(name, out)
+            return out
+        return awrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span("node", name):
+            out = func(*args, **kwargs)
+        _record_route(name, out)
+        return out
+    return wrapper
+
+
+# ── LLM calls ───────────────────────────────────────────────────────
+class LLMUsageHandler(BaseCallbackHandler):
+    """
+    Attached to a chat model: records per call the wall time
+    ("llm.seconds{role}"), prompt / completion tokens and estimated cost
+    ("llm.prompt_tokens", "llm.completion_tokens", "llm.cost_usd", labelled
+    by role and model). Token counts come from the provider's usage report.
+    """
+
+    run_inline = True
+
+    def __init__(self, role: str, model: str):
+        self.role = role
+        self.model = model
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        started = self._started.pop(run_id, None)
+        seconds = time.perf_counter() - started if started is not None else None
+        record_llm_call(self.role, self.model, *_usage(response), seconds=seconds)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs) -> None:
+        self._started.pop(run_id, None)
+        metrics.inc("llm.errors", role=self.role, model=self.model)
+
+
+def record_llm_call(role: str, model: str, prompt_tokens: float, completion_tokens: float,
+                    seconds: Optional[float] = None) -> None:
+    """Counts one chat model call, its tokens and estimated cost."""
+    if not config.TELEMETRY_ENABLED:
+        return
+    if seconds is not None:
+        metrics.observe("llm.seconds", seconds, role=role)
+    labels = {"role": role, "model": model}
+    metrics.inc("llm.calls", **labels)
+    metrics.inc("llm.prompt_tokens", prompt_tokens, **labels)
+    metrics.inc("llm.completion_tokens", completion_tokens, **labels)
+    metrics.inc("llm.cost_usd", estimate_cost(model, prompt_tokens, completion_tokens), **labels)
+
+
+def _usage(response) -> tuple:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    # Streamed calls report usage on the message instead.
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += metadata.get("input_tokens", 0)
+            completion_tokens += metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+# ── Embedding calls ─────────────────────────────────────────────────
+def record_embedding(model: str, texts: Sequence[str]) -> None:
+    """Counts an embeddings API call; tokens are estimated at ~4 characters each."""
+    if not config.TELEMETRY_ENABLED:
+        return
+    tokens = sum(len(t) for t in texts) / 4
+    metrics.inc("embedding.texts", len(texts), model=model)
+    metrics.inc("embedding.tokens", tokens, model=model)
+    metrics.inc("llm.cost_usd", estimate_cost(model, tokens), role="embedding", model=model)
+
+
+def cost_report() -> dict:
+    """Estimated spend and token totals by role, from the counters above."""
+    report: Dict[str, dict] = {}
+    for key, value in metrics.snapshot("llm.").items():
+        name, _, labels = key.partition("{")
+        role = next((part.split("=")[1].strip('"}') for part in labels.split(",") if part.startswith("role=")), None)
+        if role is None:
+            continue
+        field = name.split(".", 1)[1]
+        report.setdefault(role, {})[field] = report.get(role, {}).get(field, 0) + value
+    return report
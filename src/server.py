@@ -0,0 +1,398 @@
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from src.core import config
+from src.core.logging_config import setup_logging
+from src.core.metrics import metrics
+from src.core.blobs import blobs
+from src.core.llm_pool import pool_report
+from src.core.telemetry import cost_report
+from src.agents.graph import graph_agent, checkpointer
+from src.agents.prerouter import routing_mix
+from src.agents.speculation import speculation_stats
+from src.agents.sufficiency import sufficiency_report
+from src.tools.rag import retrieval_report, watch_vector_store
+from src.tools.uploads import upload_store
+from src.warmup import warmup
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Graph nodes reported as progress stages on the event stream
+STAGES = ("router", "rag_lookup", "retrieve", "fused_answer", "web_search", "answer")
+
+
+# ── Admission control ───────────────────────────────────────────────
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionController:
+    """
+    At most `max_concurrency` turns run at once; up to `max_queue` more wait
+    for a slot (for at most `queue_timeout` seconds). Anything beyond that is
+    rejected straight away, so overload shows up as fast 503s instead of
+    ever-growing latency. Turns of the same thread are also serialized, since
+    they read and write the same checkpoint.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._admitted = 0   # running + waiting
+        self._running = 0
+        self._thread_locks: Dict[str, asyncio.Lock] = {}
+        # Requests per thread holding or waiting for its lock; the lock is dropped at zero.
+        self._thread_requests: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def admit(self, thread_id: str):
+        if self._admitted >= self.max_concurrency + self.max_queue:
+            metrics.inc("api.rejected")
+            raise Overloaded("Too many requests queued")
+        self._admitted += 1
+        lock = self._thread_locks.setdefault(thread_id, asyncio.Lock())
+        self._thread_requests[thread_id] = self._thread_requests.get(thread_id, 0) + 1
+        queued = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._acquire(lock), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._leave(thread_id)
+            metrics.inc("api.queue_timeouts")
+            raise Overloaded("Timed out waiting for a free slot")
+        except BaseException:
+            self._leave(thread_id)
+            raise
+        metrics.inc("api.queue_seconds", time.perf_counter() - queued)
+        self._running += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._slots.release()
+            lock.release()
+            self._leave(thread_id)
+
+    def _leave(self, thread_id: str) -> None:
+        self._admitted -= 1
+        remaining = self._thread_requests[thread_id] - 1
+        if remaining:
+            self._thread_requests[thread_id] = remaining
+        else:
+            del self._thread_requests[thread_id]
+            self._thread_locks.pop(thread_id, None)
+
+    async def _acquire(self, lock: asyncio.Lock) -> None:
+        await lock.acquire()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            lock.release()
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": self._admitted - self._running,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": metrics.get("api.rejected"),
+            "queue_timeouts": metrics.get("api.queue_timeouts"),
+        }
+
+
+admission = AdmissionController(
+    max_concurrency=config.API_MAX_CONCURRENCY,
+    max_queue=config.API_MAX_QUEUE,
+    queue_timeout=config.API_QUEUE_TIMEOUT_SECONDS,
+)
+
+
+# ── Request handling ────────────────────────────────────────────────
+async def _read_turn(request: Request) -> dict:
+    """
+    Accepts JSON {"message", "thread_id"?} or a form with the same fields
+    plus, when multipart, an optional PDF in "file" that is indexed for the
+    thread by `_index_upload` once the turn is admitted.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        form = await request.form(max_part_size=config.API_MAX_UPLOAD_BYTES)
+        body = {"message": form.get("message") or "", "thread_id": form.get("thread_id")}
+        upload = form.get("file")
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(400, "Body must be JSON or a form")
+        if not isinstance(body, dict):
+            raise HTTPException(400, "JSON body must be an object")
+        upload = None
+    if not isinstance(body.get("message"), str):
+        raise HTTPException(400, "'message' must be a string")
+    thread_id = body.get("thread_id") or str(uuid.uuid4())
+
+    turn = {"message": body["message"], "thread_id": thread_id}
+    if upload is not None and hasattr(upload, "read"):
+        turn["upload"] = (upload.filename or "upload.pdf", await upload.read())
+    if not body["message"].strip() and "upload" not in turn and not upload_store.files(thread_id):
+        raise HTTPException(400, "'message' is empty")
+    return turn
+
+
+async def _index_upload(thread_id: str, filename: str, data: bytes) -> dict:
+    """Parses and embeds an uploaded PDF into the thread's upload index; call it once admitted."""
+    try:
+        return await asyncio.to_thread(upload_store.add, thread_id, filename, data)
+    except Exception as e:
+        logger.error(f"Error processing uploaded PDF for thread {thread_id}: {e}")
+        raise HTTPException(422, f"Could not process PDF: {e}")
+
+
+def _graph_inputs(turn: dict) -> dict:
+    thread_id = turn["thread_id"]
+    return {
+        "messages": [HumanMessage(content=turn["message"])],
+        "upload_file_content": "",
+        "upload_session": thread_id if upload_store.files(thread_id) else None,
+        "new_upload": "upload" in turn,
+    }
+
+
+async def _run_turn(turn: dict) -> AsyncIterator[dict]:
+    """
+    Runs one turn and yields simplified events:
+      {"event": "stage", "node": ...}, {"event": "token", "text": ...},
+      {"event": "done", "answer": ..., "route": ..., "cached": bool}
+    """
+    run_config = {"configurable": {"thread_id": turn["thread_id"]}}
+    final_state, cached = None, False
+    async for event in graph_agent.astream_events(_graph_inputs(turn), config=run_config, version="v2"):
+        kind = event["event"]
+        node = event.get("metadata", {}).get("langgraph_node")
+        if kind == "on_custom_event" and event["name"] == "semantic_cache_hit":
+            final_state, cached = event["data"]["output"], True
+        elif kind == "on_chain_start" and event["name"] in STAGES and node == event["name"]:
+            yield {"event": "stage", "node": node}
+        elif (kind == "on_chat_model_stream" and node == "answer"
+              and "history_summary" not in event.get("tags", [])):
+            text = event["data"]["chunk"].content or ""
+            if text:
+                yield {"event": "token", "text": text}
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            final_state = event["data"].get("output")
+
+    state = final_state or {}
+    ai_msg = next((m for m in reversed(state.get("messages", [])) if isinstance(m, AIMessage)), None)
+    yield {
+        "event": "done",
+        "answer": ai_msg.content if ai_msg else "",
+        "route": state.get("route"),
+        "cached": cached,
+    }
+
+
+def _overloaded(e: Overloaded) -> JSONResponse:
+    return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+
+
+async def chat(request: Request) -> JSONResponse:
+    turn = await _read_turn(request)
+    started = time.perf_counter()
+    try:
+        async with admission.admit(turn["thread_id"]):
+            if "upload" in turn:
+                await _index_upload(turn["thread_id"], *turn["upload"])
+            result = None
+            async for event in _run_turn(turn):
+                if event["event"] == "done":
+                    result = event
+    except Overloaded as e:
+        return _overloaded(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running turn for thread {turn['thread_id']}: {e}")
+        metrics.inc("api.errors")
+        return JSONResponse({"error": str(e), "thread_id": turn["thread_id"]}, status_code=500)
+    metrics.inc("api.requests")
+    metrics.inc("api.request_seconds", time.perf_counter() - started)
+    return JSONResponse(
+        {"thread_id": turn["thread_id"], "answer": result["answer"],
+         "route": result["route"], "cached": result["cached"]},
+        headers={"X-Thread-Id": turn["thread_id"]},
+    )
+
+
+def _sse(event: dict) -> str:
+    name = event.pop("event")
+    return f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+async def chat_stream(request: Request):
+    turn = await _read_turn(request)
+    # Admission is decided before the response starts, so overload is still a 503.
+    admitted = admission.admit(turn["thread_id"])
+    try:
+        await admitted.__aenter__()
+    except Overloaded as e:
+        return _overloaded(e)
+    released = False
+
+    async def release() -> None:
+        # Called when the body ends and again by the response's background
+        # task, which also runs when the client disconnects before the body
+        # starts or the body is never iterated.
+        nonlocal released
+        if not released:
+            released = True
+            await admitted.__aexit__(None, None, None)
+
+    if "upload" in turn:
+        try:
+            await _index_upload(turn["thread_id"], *turn["upload"])
+        except BaseException:
+            await release()
+            raise
+
+    async def events():
+        started = time.perf_counter()
+        try:
+            yield _sse({"event": "session", "thread_id": turn["thread_id"]})
+            async for event in _run_turn(turn):
+                yield _sse(event)
+            metrics.inc("api.requests")
+            metrics.inc("api.request_seconds", time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Error streaming turn for thread {turn['thread_id']}: {e}")
+            metrics.inc("api.errors")
+            yield _sse({"event": "error", "error": str(e)})
+        finally:
+            await release()
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"X-Thread-Id": turn["thread_id"], "Cache-Control": "no-cache"},
+        background=BackgroundTask(release),
+    )
+
+
+async def upload(request: Request) -> JSONResponse:
+    thread_id = request.path_params["thread_id"]
+    form = await request.form(max_part_size=config.API_MAX_UPLOAD_BYTES)
+    file = form.get("file")
+    if file is None or not hasattr(file, "read"):
+        raise HTTPException(400, "Expected a PDF in the multipart field 'file'")
+    data = await file.read()
+    # Parsing and embedding count against the same limits as turns.
+    try:
+        async with admission.admit(thread_id):
+            info = await _index_upload(thread_id, file.filename or "upload.pdf", data)
+    except Overloaded as e:
+        return _overloaded(e)
+    except HTTPException as e:
+        return JSONResponse({"error": e.detail}, status_code=e.status_code)
+    return JSONResponse({"thread_id": thread_id, **info})
+
+
+async def delete_thread(request: Request) -> JSONResponse:
+    thread_id = request.path_params["thread_id"]
+    await asyncio.to_thread(checkpointer.delete_thread, thread_id)
+    upload_store.release(thread_id)
+    return JSONResponse({"thread_id": thread_id, "deleted": True})
+
+
+async def health(request: Request) -> JSONResponse:
+    return JSONResponse({"status": "ok"})
+
+
+async def stats(request: Request) -> JSONResponse:
+    requests = metrics.get("api.requests")
+    return JSONResponse({
+        "admission": admission.stats(),
+        "mean_request_seconds": metrics.get("api.request_seconds") / requests if requests else 0.0,
+        "checkpointer": checkpointer.memory_usage(),
+        "state_blobs": blobs.stats(),
+        "uploads": upload_store.stats(),
+        "retrieval": retrieval_report(),
+        "routing": routing_mix(),
+        "sufficiency": sufficiency_report(),
+        "speculation": speculation_stats(),
+        "llm_usage": cost_report(),
+        "llm_pool": pool_report(),
+        "metrics": metrics.snapshot(),
+    })
+
+
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Each worker process builds its singletons before taking traffic.
+    await asyncio.to_thread(warmup)
+    if config.KB_RELOAD_INTERVAL_SECONDS > 0:
+        watch_vector_store(config.KB_RELOAD_INTERVAL_SECONDS)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+        Route("/metrics", prometheus_metrics, methods=["GET"]),
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Route("/threads/{thread_id}/upload", upload, methods=["POST"]),
+        Route("/threads/{thread_id}", delete_thread, methods=["DELETE"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+# ── Entry point: python -m src.server ───────────────────────────────
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Serve graph_agent over HTTP.")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument("--workers", type=int, default=config.API_WORKERS)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    from src.tools import kb_collections
+    from src.tools.rag import SAVE_PATH, build_collections
+
+    setup_logging()
+    if args.workers > 1:
+        # Build the collections here if none is published, so the workers only load them.
+        if not kb_collections.published_collections(SAVE_PATH, config.KB_COLLECTIONS) and config.KB_AUTO_BUILD:
+            build_collections()
+        if not config.FAISS_MMAP:
+            logger.warning("FAISS_MMAP is off: every worker will hold its own copy of the index")
+        if not config.CHECKPOINT_SPILL_PATH:
+            logger.warning("CHECKPOINT_SPILL_PATH is not set: a thread's history stays in the worker "
+                           "that served it, so use sticky routing by thread_id")
+    uvicorn.run("src.server:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
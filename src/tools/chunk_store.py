@@ -0,0 +1,177 @@
+import re
+import json
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain.schema import Document
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Readers memory-map the database file; hot pages are shared between processes.
+_MMAP_BYTES = 256 * 1024 * 1024
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Full-text index over chunks.text, kept in step by triggers. REPLACE only
+# fires the delete trigger with recursive_triggers on.
+_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE chunks_fts USING fts5(text, content='chunks', content_rowid='rowid')",
+    "CREATE TRIGGER chunks_fts_insert AFTER INSERT ON chunks BEGIN"
+    " INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text); END",
+    "CREATE TRIGGER chunks_fts_delete AFTER DELETE ON chunks BEGIN"
+    " INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text); END",
+    "CREATE TRIGGER chunks_fts_update AFTER UPDATE OF text ON chunks BEGIN"
+    " INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);"
+    " INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text); END",
+)
+
+
+# ── SQLite chunk store ──────────────────────────────────────────────
+class ChunkStore(Docstore, AddableMixin):
+    """
+    Chunk text and metadata on disk, keyed by chunk id and FAISS row:
+
+        chunks(id TEXT PRIMARY KEY, row INTEGER UNIQUE, text TEXT, metadata TEXT)
+        chunks_fts  - FTS5 index over the text, for `lexical_search`
+
+    Replaces the pickled InMemoryDocstore: nothing is loaded up front, only
+    the chunks of actual hits are read, and there is no unsafe pickle load.
+    Stores written before the FTS5 index existed get it on their next build;
+    until then `has_lexical_index` is False.
+
+    Writers (ingestion) keep one open transaction: adds and deletes become
+    visible only on `commit(index_to_docstore_id)`, together with the FAISS
+    row numbers of the index written alongside.
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.execute(f"PRAGMA mmap_size = {_MMAP_BYTES}")
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA recursive_triggers = ON")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id TEXT PRIMARY KEY, row INTEGER UNIQUE, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            if not self._has_fts():
+                for statement in _FTS_SCHEMA:
+                    self._conn.execute(statement)
+                self._conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+            self._conn.commit()
+        self.has_lexical_index = self._has_fts()
+
+    def _has_fts(self) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'"
+        ).fetchone() is not None
+
+    # -- Docstore / AddableMixin --------------------------------------
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT text, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+        if found is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=found[0], metadata=json.loads(found[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, row, text, metadata) VALUES (?, NULL, ?, ?)",
+                [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()],
+            )
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    # -- bulk operations ----------------------------------------------
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+
+    def commit(self, index_to_docstore_id: Mapping[int, str]) -> None:
+        """Records the FAISS row of every chunk and makes pending changes durable."""
+        with self._lock:
+            self._conn.execute("UPDATE chunks SET row = NULL")
+            self._conn.executemany(
+                "UPDATE chunks SET row = ? WHERE id = ?",
+                [(int(row), doc_id) for row, doc_id in index_to_docstore_id.items()],
+            )
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._conn.rollback()
+
+    def row_map(self) -> Dict[int, str]:
+        """FAISS row → chunk id, as the writable FAISS wrapper needs it."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT row, id FROM chunks WHERE row IS NOT NULL"))
+
+    def lexical_search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Top-k (FAISS row, BM25 score) for any of the query's words, best first,
+        straight from the FTS5 index on disk.
+        """
+        terms = sorted({t.lower() for t in _TOKEN.findall(query)})
+        if not terms or not self.has_lexical_index:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT c.row, bm25(chunks_fts) FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid"
+                " WHERE chunks_fts MATCH ? AND c.row IS NOT NULL ORDER BY bm25(chunks_fts) LIMIT ?",
+                (match, k),
+            ).fetchall()
+        # FTS5's bm25() is lower-is-better.
+        return [(row, -score) for row, score in found]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE row IS NOT NULL").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RowIdMap(Mapping):
+    """
+    Read-only FAISS row → chunk id mapping backed by a ChunkStore, used in
+    place of the in-memory index_to_docstore_id dict when serving.
+    """
+
+    def __init__(self, store: ChunkStore):
+        self._store = store
+
+    def __getitem__(self, row: int) -> str:
+        with self._store._lock:
+            found = self._store._conn.execute("SELECT id FROM chunks WHERE row = ?", (int(row),)).fetchone()
+        if found is None:
+            raise KeyError(row)
+        return found[0]
+
+    def get(self, row: int, default: Optional[str] = None) -> Optional[str]:
+        try:
+            return self[row]
+        except KeyError:
+            return default
+
+    def __iter__(self) -> Iterator[int]:
+        with self._store._lock:
+            rows = self._store._conn.execute("SELECT row FROM chunks WHERE row IS NOT NULL ORDER BY row").fetchall()
+        return (row for (row,) in rows)
+
+    def __len__(self) -> int:
+        return len(self._store)
@@ -0,0 +1,124 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src.core.metrics import metrics
+from src.core.telemetry import record_embedding
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Histogram buckets for the number of queries sent per request
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class _Batch:
+    def __init__(self):
+        self.texts: List[str] = []
+        self.futures: List[Future] = []
+        self.full = threading.Event()
+
+
+# ── Micro-batching query embeddings ─────────────────────────────────
+class BatchingEmbeddings(Embeddings):
+    """
+    Collects concurrent `embed_query` calls for up to `window_ms` (or until
+    `max_batch` queries are waiting) and sends them as one `embed_documents`
+    request, instead of one request per query. The caller that opens a batch
+    waits out the window and sends it; the others just wait for their vector.
+
+    Identical queries in flight share one slot, and the last `cache_size`
+    query vectors are kept in an LRU, since one turn embeds the same question
+    several times (semantic cache, pre-router, retrieval).
+    `embed_documents` (ingestion) is passed through unchanged.
+
+    Metrics (prefix "embedding_batcher."): requests, queries, lru_hits,
+    coalesced, and the histogram batch_size.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, window_ms: float = 5.0, max_batch: int = 64,
+                 cache_size: int = 1024):
+        self.underlying = underlying
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+        self._inflight: Dict[str, Future] = {}
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        metrics.inc("embedding_batcher.queries")
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                metrics.inc("embedding_batcher.lru_hits")
+                return vector
+            future = self._inflight.get(text)
+            if future is not None:
+                metrics.inc("embedding_batcher.coalesced")
+                leader = None
+            else:
+                future = self._inflight[text] = Future()
+                batch = self._open
+                leader = batch is None
+                if leader:
+                    batch = self._open = _Batch()
+                batch.texts.append(text)
+                batch.futures.append(future)
+                if len(batch.texts) >= self.max_batch:
+                    # Full: close it so later queries start a new batch.
+                    self._open = None
+                    batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._send(batch)
+        return future.result()
+
+    def _send(self, batch: _Batch) -> None:
+        metrics.inc("embedding_batcher.requests")
+        metrics.observe("embedding_batcher.batch_size", len(batch.texts), buckets=BATCH_SIZE_BUCKETS)
+        try:
+            vectors = self.underlying.embed_documents(batch.texts)
+            record_embedding(self.model, batch.texts)
+        except BaseException as e:
+            with self._lock:
+                for text in batch.texts:
+                    self._inflight.pop(text, None)
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        with self._lock:
+            for text, vector in zip(batch.texts, vectors):
+                self._inflight.pop(text, None)
+                self._cache[text] = vector
+                self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for future, vector in zip(batch.futures, vectors):
+            future.set_result(vector)
+
+    def stats(self) -> dict:
+        queries = metrics.get("embedding_batcher.queries")
+        requests = metrics.get("embedding_batcher.requests")
+        hits = metrics.get("embedding_batcher.lru_hits")
+        return {
+            "queries": queries,
+            "requests": requests,
+            "lru_hit_rate": hits / queries if queries else 0.0,
+            "coalesced": metrics.get("embedding_batcher.coalesced"),
+            "mean_batch_size": (queries - hits - metrics.get("embedding_batcher.coalesced")) / requests
+            if requests else 0.0,
+        }
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+from src.core.metrics import metrics
+from src.core.telemetry import record_embedding, span
+from src.tools.embedding_batcher import BatchingEmbeddings
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ── Persistent embedding cache ──────────────────────────────────────
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model with an on-disk SQLite cache keyed by
+    (model, sha256(text)). Only texts that are not in the cache are sent to the
+    underlying model, so re-indexing unchanged chunks costs nothing.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, path: str):
+        self.underlying = underlying
+        self.model = model
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def _get_many(self, hashes: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            # SQLite caps the number of bound parameters per statement.
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = array("f", blob).tolist()
+        return found
+
+    def _put_many(self, items: dict) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(self.model, h, array("f", v).tobytes()) for h, v in items.items()],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [content_hash(t) for t in texts]
+        cached = self._get_many(list(set(hashes)))
+
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        metrics.inc("embedding_cache.hits", len(texts) - len(missing))
+        metrics.inc("embedding_cache.misses", len(missing))
+
+        if missing:
+            logger.info(f"Embedding {len(missing)} new chunks ({len(texts) - len(missing)} served from cache)")
+            with span("embedding", self.model):
+                vectors = self.underlying.embed_documents(list(missing.values()))
+            record_embedding(self.model, list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._put_many(fresh)
+            cached.update(fresh)
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries are free-form and rarely repeat verbatim; don't persist them.
+        with span("embedding", self.model):
+            vector = self.underlying.embed_query(text)
+        if not isinstance(self.underlying, BatchingEmbeddings):
+            # The batcher records usage per request it actually sends.
+            record_embedding(self.model, [text])
+        return vector
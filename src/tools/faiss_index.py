@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import logging
+from typing import List
+
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+
+from src.core import config
+from src.tools.chunk_store import ChunkStore, RowIdMap
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# The flat index (index.faiss) stays the master copy: incremental
+# ingestion adds to and deletes from it exactly. Approximate index types are
+# derived from it into index.<type>.faiss and share its chunk store, since the
+# vectors are added in the same order.
+
+
+# ── Index factory ───────────────────────────────────────────────────
+def _nlist(n: int) -> int:
+    if config.FAISS_IVF_NLIST:
+        return config.FAISS_IVF_NLIST
+    # ~4·sqrt(n) lists, but at least 39 training points per list.
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def _pq_m(dim: int) -> int:
+    # The number of sub-quantizers must divide the dimension.
+    m = min(config.FAISS_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def factory_string(kind: str, dim: int, n: int) -> str:
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{config.FAISS_HNSW_M}"
+    if kind == "ivf":
+        return f"IVF{_nlist(n)},Flat"
+    if kind == "ivfpq":
+        # 8-bit codes need 256·39 training points; small corpora get 4-bit
+        # codes, and ones too small to train even those stay uncompressed.
+        if n < 16 * 39:
+            return f"IVF{_nlist(n)},Flat"
+        nbits = 8 if n >= 256 * 39 else 4
+        return f"IVF{_nlist(n)},PQ{_pq_m(dim)}x{nbits}"
+    raise ValueError(f"Unknown FAISS_INDEX_TYPE {kind!r}; expected one of {INDEX_TYPES}")
+
+
+def _all_vectors(index: faiss.Index) -> np.ndarray:
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_index(kind: str, vectors: np.ndarray) -> faiss.Index:
+    """Builds an index of type `kind` over `vectors`, training on a random sample."""
+    n, dim = vectors.shape
+    spec = factory_string(kind, dim, n)
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample_size = min(n, config.FAISS_TRAIN_SAMPLE)
+        sample = vectors[np.random.default_rng(0).choice(n, sample_size, replace=False)]
+        started = time.perf_counter()
+        index.train(sample)
+        logger.info(f"Trained {spec} on {sample_size} vectors in {time.perf_counter() - started:.1f}s")
+    index.add(vectors)
+    if kind in ("ivf", "ivfpq"):
+        # Lets the hybrid retriever reconstruct vectors for MMR; saved with the index.
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index
+
+
+def configure_search(index: faiss.Index, kind: str) -> None:
+    """Applies the query-time accuracy knobs of approximate index types."""
+    if kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = config.FAISS_HNSW_EF_SEARCH
+    elif kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = config.FAISS_IVF_NPROBE
+
+
+# ── Derived (serving) index ─────────────────────────────────────────
+def _derived_paths(save_path: str, kind: str):
+    return (os.path.join(save_path, f"index.{kind}.faiss"),
+            os.path.join(save_path, f"index.{kind}.json"))
+
+
+def sync_derived_index(save_path: str, kind: str, master_version: str) -> None:
+    """(Re)builds index.<kind>.faiss from the master index when it is stale."""
+    if kind == "flat":
+        return
+    index_path, meta_path = _derived_paths(save_path, kind)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # The factory string depends on the corpus size, so it is only checked
+        # once the master has changed anyway.
+        if os.path.exists(index_path) and meta.get("source") == master_version:
+            return
+    except (OSError, ValueError):
+        pass
+    master = faiss.read_index(os.path.join(save_path, "index.faiss"))
+    spec = factory_string(kind, master.d, master.ntotal)
+    logger.info(f"Building {spec} index from the flat index ({master.ntotal} vectors)")
+    index = build_index(kind, _all_vectors(master))
+    tmp = index_path + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, index_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"source": master_version, "factory": spec}, f)
+
+
+def load_serving_store(save_path: str, embeddings, kind: str, mmap: bool) -> FAISS:
+    """
+    Loads the store queries are served from: the flat master or the derived
+    index of type `kind`, over the master's chunk store. With `mmap` the index
+    file is memory-mapped read-only, so worker processes on one host share a
+    single page-cached copy instead of each holding it in RAM.
+    """
+    index_path = (os.path.join(save_path, "index.faiss") if kind == "flat"
+                  else _derived_paths(save_path, kind)[0])
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(index_path, flags)
+    configure_search(index, kind)
+    # Chunks are read from SQLite per hit; nothing but the index is loaded.
+    store = ChunkStore(os.path.join(save_path, "chunks.sqlite"), readonly=True)
+    logger.info(f"Loaded {kind} index from {index_path} ({index.ntotal} vectors"
+                f"{', memory-mapped' if mmap else ''})")
+    return FAISS(embeddings, index, store, RowIdMap(store))
+
+
+# ── Recall / latency benchmark ──────────────────────────────────────
+def benchmark(save_path: str, kinds: List[str], queries: int = 200, k: int = 10) -> List[dict]:
+    """
+    Compares each index type against exact flat search: recall@k, mean query
+    latency, build time and on-disk size. Queries are stored chunk vectors
+    with a little noise, so no embedding calls are needed.
+    """
+    master = faiss.read_index(os.path.join(save_path, "index.faiss"))
+    vectors = _all_vectors(master)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), min(queries, len(vectors)), replace=False)
+    q = vectors[picks] + rng.normal(0, 0.01, size=(len(picks), vectors.shape[1])).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    k = min(k, len(vectors))
+    _, truth = master.search(q, k)
+
+    results = []
+    for kind in kinds:
+        started = time.perf_counter()
+        index = master if kind == "flat" else build_index(kind, vectors)
+        build_seconds = time.perf_counter() - started
+        configure_search(index, kind)
+        started = time.perf_counter()
+        _, found = index.search(q, k)
+        latency = (time.perf_counter() - started) / len(q)
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        results.append({
+            "type": kind,
+            "factory": factory_string(kind, master.d, master.ntotal),
+            f"recall@{k}": round(float(recall), 4),
+            "ms_per_query": round(latency * 1000, 3),
+            "build_seconds": round(build_seconds, 2),
+            "bytes": len(faiss.serialize_index(index)),
+        })
+    return results
+
+
+def main(argv: List[str]) -> int:
+    if argv[:1] != ["benchmark"]:
+        print("usage: python -m src.tools.faiss_index benchmark [queries] [k]")
+        return 2
+    from src.tools import kb_versions
+    from src.tools.rag import SAVE_PATH
+    version = kb_versions.current_version(SAVE_PATH)
+    if version is None:
+        print("no vector store version published; run python scripts/build_vector_store.py")
+        return 1
+    queries = int(argv[1]) if len(argv) > 1 else 200
+    k = int(argv[2]) if len(argv) > 2 else 10
+    for row in benchmark(kb_versions.version_path(SAVE_PATH, version), list(INDEX_TYPES), queries, k):
+        print(json.dumps(row))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
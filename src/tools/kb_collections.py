@@ -0,0 +1,176 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from src.core.metrics import metrics
+from src.tools import kb_versions
+from src.utils.document_loader import list_pdf_files
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# The knowledge base is split into named collections, each with its own
+# versioned index. The default collection keeps the top-level layout of the
+# vector store directory (versions/, CURRENT), so a single-collection
+# deployment looks exactly as before; every other collection has the same
+# layout under collections/<name>/. Each version directory also holds
+# centroid.npy, the normalised mean of its vectors, which is all the query
+# router needs to pick collections without loading their indexes.
+DEFAULT_COLLECTION = "default"
+COLLECTIONS_DIR = "collections"
+CENTROID_FILE = "centroid.npy"
+
+T = TypeVar("T")
+
+
+def collection_root(save_path: str, name: str) -> str:
+    if name == DEFAULT_COLLECTION:
+        return save_path
+    return os.path.join(save_path, COLLECTIONS_DIR, name)
+
+
+def discover_collections(folder: str, split: bool, recursive: bool = True) -> Dict[str, List[str]]:
+    """
+    The source PDFs of each collection. With `split`, PDFs directly in
+    `folder` form the default collection and every subdirectory is a
+    collection named after it; otherwise everything is the default collection.
+    """
+    if not split:
+        files = list_pdf_files(folder, recursive=recursive)
+        return {DEFAULT_COLLECTION: files} if files else {}
+    found: Dict[str, List[str]] = {}
+    top = list_pdf_files(folder, recursive=False)
+    if top:
+        found[DEFAULT_COLLECTION] = top
+    if os.path.isdir(folder):
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            files = list_pdf_files(path, recursive=recursive)
+            if files:
+                found.setdefault(name, []).extend(files)
+    return found
+
+
+def published_collections(save_path: str, split: bool) -> Dict[str, str]:
+    """{name: published version}; only the default collection unless `split`."""
+    published = {}
+    version = kb_versions.current_version(save_path)
+    if version is not None:
+        published[DEFAULT_COLLECTION] = version
+    base = os.path.join(save_path, COLLECTIONS_DIR)
+    if split and os.path.isdir(base):
+        for name in sorted(os.listdir(base)):
+            version = kb_versions.current_version(os.path.join(base, name))
+            if version is not None:
+                published[name] = version
+    return published
+
+
+# ── Centroids and routing ───────────────────────────────────────────
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def compute_centroid(vectors: np.ndarray) -> np.ndarray:
+    """Normalised mean direction of a collection's (normalised) chunk vectors."""
+    return _unit(_unit(np.asarray(vectors, dtype=np.float32)).mean(axis=0))
+
+
+def save_centroid(version_dir: str, centroid: np.ndarray) -> None:
+    with open(os.path.join(version_dir, CENTROID_FILE), "wb") as f:
+        np.save(f, centroid.astype(np.float32))
+
+
+def load_centroid(version_dir: str) -> Optional[np.ndarray]:
+    try:
+        return np.load(os.path.join(version_dir, CENTROID_FILE))
+    except (OSError, ValueError):
+        return None
+
+
+def select_collections(query_vector, centroids: Dict[str, np.ndarray], max_collections: int,
+                       margin: float) -> List[Tuple[str, float]]:
+    """
+    The collections to search for a query, best first with their centroid
+    similarity: the closest one, plus any within `margin` of it, at most
+    `max_collections`. Collections without a centroid are always included.
+    """
+    known = [name for name, c in centroids.items() if c is not None]
+    unknown = [(name, 0.0) for name, c in centroids.items() if c is None]
+    if not known:
+        return unknown
+    q = _unit(np.asarray(query_vector, dtype=np.float32))
+    similarity = np.stack([centroids[name] for name in known]) @ q
+    order = np.argsort(-similarity)
+    best = float(similarity[order[0]])
+    chosen = [(known[i], float(similarity[i])) for i in order[:max(1, max_collections)]
+              if similarity[i] >= best - margin]
+    return chosen + unknown
+
+
+# ── Loaded collections ──────────────────────────────────────────────
+class CollectionCache(Generic[T]):
+    """
+    The collections currently loaded, at most `max_loaded`, least recently
+    searched evicted first. `load_fn(name, version)` loads one; concurrent
+    requests for the same collection wait for a single load. A collection is
+    reloaded when asked for a different version than the one held. Queries
+    already holding an evicted or replaced collection finish on it.
+    """
+
+    def __init__(self, load_fn: Callable[[str, str], T], max_loaded: int):
+        self._load_fn = load_fn
+        self.max_loaded = max(1, max_loaded)
+        self._lock = threading.Lock()
+        self._loaded: "OrderedDict[str, Tuple[str, T]]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def get(self, name: str, version: str) -> T:
+        with self._lock:
+            held = self._loaded.get(name)
+            if held is not None and held[0] == version:
+                self._loaded.move_to_end(name)
+                return held[1]
+            loading = self._loading.setdefault((name, version), threading.Lock())
+        with loading:
+            with self._lock:
+                held = self._loaded.get(name)
+                if held is not None and held[0] == version:
+                    return held[1]
+            try:
+                metrics.inc("kb_collections.loads", collection=name)
+                value = self._load_fn(name, version)
+                self.set(name, version, value)
+            finally:
+                with self._lock:
+                    self._loading.pop((name, version), None)
+        return value
+
+    def set(self, name: str, version: str, value: T) -> None:
+        with self._lock:
+            self._loaded[name] = (version, value)
+            self._loaded.move_to_end(name)
+            while len(self._loaded) > self.max_loaded:
+                evicted, _ = self._loaded.popitem(last=False)
+                metrics.inc("kb_collections.evictions", collection=evicted)
+                logger.info(f"Evicted collection {evicted} (more than {self.max_loaded} loaded)")
+
+    def peek(self, name: str) -> Optional[Tuple[str, T]]:
+        """(version, value) of a loaded collection without touching its recency."""
+        with self._lock:
+            return self._loaded.get(name)
+
+    def discard(self, name: str) -> None:
+        with self._lock:
+            self._loaded.pop(name, None)
+
+    def loaded(self) -> Dict[str, str]:
+        """{name: version} of the loaded collections, least recently used first."""
+        with self._lock:
+            return {name: version for name, (version, _) in self._loaded.items()}
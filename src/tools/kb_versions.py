@@ -0,0 +1,130 @@
+import os
+import shutil
+import logging
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Layout of the vector store directory:
+#
+#   versions/<version>/    one immutable, fully built artifact per KB version
+#                          (index.faiss, chunks.sqlite, manifest.json and any
+#                          derived index.<type>.faiss)
+#   versions/.staging/     the build in progress
+#   CURRENT                name of the version being served
+#
+# A build only ever writes to the staging directory, renames it into place
+# and then replaces CURRENT, so readers see either the old or the new version.
+VERSIONS_DIR = "versions"
+STAGING_DIR = ".staging"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".build.lock"
+# Files carried over from the current version so a build only embeds what changed
+SEED_FILES = ("index.faiss", "chunks.sqlite", "manifest.json")
+
+
+def version_path(root: str, version: str) -> str:
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def current_version(root: str) -> Optional[str]:
+    """The published version, or None when nothing has been built yet."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if not version or not os.path.isdir(version_path(root, version)):
+        logger.warning(f"{CURRENT_FILE} points at missing version {version!r}")
+        return None
+    return version
+
+
+def list_versions(root: str) -> List[str]:
+    """Built versions, oldest first."""
+    base = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(base):
+        return []
+    names = [n for n in os.listdir(base) if not n.startswith(".") and os.path.isdir(os.path.join(base, n))]
+    return sorted(names, key=lambda n: os.path.getmtime(os.path.join(base, n)))
+
+
+@contextmanager
+def build_lock(root: str) -> Iterator[None]:
+    """Serialises builds across processes, so concurrent workers never race to build."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), "w") as f:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def new_staging(root: str, seed: Optional[str]) -> str:
+    """
+    A fresh staging directory, seeded with the index, chunks and manifest of
+    `seed` (a version directory, or the pre-versioning flat layout). Must be
+    called under `build_lock`.
+    """
+    staging = os.path.join(root, VERSIONS_DIR, STAGING_DIR)
+    if os.path.exists(staging):
+        logger.info("Discarding the staging directory of an interrupted build")
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+    if seed is not None:
+        for name in SEED_FILES:
+            if os.path.exists(os.path.join(seed, name)):
+                shutil.copy2(os.path.join(seed, name), os.path.join(staging, name))
+    return staging
+
+
+def finalize(root: str, staging: str, version: str) -> str:
+    """Moves the staging directory to versions/<version>; returns its path."""
+    target = version_path(root, version)
+    os.replace(staging, target)
+    return target
+
+
+def publish(root: str, version: str) -> None:
+    """Atomically points CURRENT at `version`."""
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+    logger.info(f"Published vector store version {version}")
+
+
+def retire(root: str) -> None:
+    """Stops serving from `root` by removing CURRENT; its versions stay until pruned."""
+    try:
+        os.remove(os.path.join(root, CURRENT_FILE))
+    except FileNotFoundError:
+        return
+    logger.info(f"Retired the vector store in {root}")
+
+
+def prune(root: str, keep: int) -> List[str]:
+    """
+    Deletes all but the `keep` newest versions, never the published one.
+    Processes still serving a deleted version keep their open files.
+    """
+    current = current_version(root)
+    old = [v for v in list_versions(root) if v != current]
+    removed = old[:max(0, len(old) - max(0, keep - 1))]
+    for version in removed:
+        shutil.rmtree(version_path(root, version), ignore_errors=True)
+        logger.info(f"Pruned vector store version {version}")
+    return removed
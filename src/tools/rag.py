@@ -1,81 +1,661 @@
 import os
+import json
+import time
+import shutil
+import hashlib
 import logging
+import threading
+import faiss
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.tools import tool
-from src.utils.document_loader import documents
+from src.core import config
+from src.core.lazy import Lazy
+from src.core.metrics import metrics
+from src.core.llm_pool import http_clients
+from src.core.telemetry import span
+from src.utils.document_loader import folder_path
+from src.utils.ingestion import (
+    StageStats, default_workers, prefetch, parse_files, split_files, embed_batches, index_batches
+)
+from src.tools.embedding_cache import CachedEmbeddings, content_hash
+from src.tools.embedding_batcher import BatchingEmbeddings
+from src.tools.retrieval import HybridRetriever
+from src.tools.chunk_store import ChunkStore
+from src.tools import kb_collections, kb_versions
+from src.tools.kb_collections import DEFAULT_COLLECTION, CollectionCache
+from src.tools.faiss_index import factory_string, load_serving_store, sync_derived_index
 
 # ── LOGGING ─────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
 # --- CONFIGURATION ---
 SAVE_PATH = "vector_store"
-# FAISS automatically creates index.faiss and index.pkl
-FAISS_INDEX_PATH = os.path.join(SAVE_PATH, "index.faiss")
-EMBEDDINGS = OpenAIEmbeddings(model="text-embedding-3-small")
+# Each build is an immutable directory under vector_store/versions/ and
+# vector_store/CURRENT names the one served (see src.tools.kb_versions). In a
+# version directory, index.faiss holds the vectors; chunk text and metadata
+# live in chunks.sqlite, keyed by chunk id and FAISS row; manifest.json records
+# the build parameters and the source-file and chunk hashes it contains.
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+MANIFEST_FILE = "manifest.json"
+# Pickled docstore written by earlier versions; never copied into a version.
+LEGACY_DOCSTORE_FILE = "index.pkl"
+# Shared by all builds, so an interrupted build resumes without re-embedding.
+EMBEDDING_CACHE_PATH = os.path.join(SAVE_PATH, "embedding_cache.sqlite")
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+RETRIEVER_K = config.RAG_TOP_K
 
-def initialize_vector_store():
+# --- LAZY SINGLETONS ---
+# Nothing below touches the disk or the embeddings API until first use (or an
+# explicit warm-up), so importing this module is cheap and side-effect free.
+def _create_embeddings() -> CachedEmbeddings:
+    client = OpenAIEmbeddings(model=EMBEDDING_MODEL, request_timeout=config.LLM_TIMEOUT_SECONDS,
+                              **http_clients())
+    return wrap_embeddings(client)
+
+def wrap_embeddings(client: Embeddings, cache_path: str = EMBEDDING_CACHE_PATH) -> CachedEmbeddings:
+    """Puts an embeddings client behind the query batcher and the persistent embedding cache."""
+    if config.EMBED_BATCHING:
+        # Concurrent query embeddings share one request; see BatchingEmbeddings.
+        client = BatchingEmbeddings(
+            client,
+            model=EMBEDDING_MODEL,
+            window_ms=config.EMBED_BATCH_WINDOW_MS,
+            max_batch=config.EMBED_BATCH_MAX,
+            cache_size=config.EMBED_QUERY_CACHE_SIZE,
+        )
+    return CachedEmbeddings(client, model=EMBEDDING_MODEL, path=cache_path)
+
+_embeddings: Lazy[CachedEmbeddings] = Lazy("embeddings", _create_embeddings)
+
+def get_embeddings() -> CachedEmbeddings:
+    return _embeddings.get()
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _load_manifest(path: str) -> Optional[dict]:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return None
+
+def _save_manifest(path: str, manifest: dict) -> None:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def _manifest_params() -> dict:
+    return {"model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+            "docstore": "sqlite"}
+
+def _assign_chunk_ids(path: str, chunks: List[Document]) -> None:
     """
-    Checks if a FAISS index exists on disk. If not, it creates one from the source documents.
-    It then returns the loaded or newly created FAISS vector store.
+    Gives each chunk a stable id derived from the source path and its content
+    hash, so unchanged chunks keep their id across re-indexing runs.
+    """
+    path_key = content_hash(path)[:8]
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        chunk_hash = content_hash(chunk.page_content)
+        n = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = n + 1
+        chunk.metadata["chunk_hash"] = chunk_hash
+        chunk.id = f"{path_key}:{chunk_hash[:16]}:{n}"
+
+def sync_vector_store(path: str, source_files: List[str], batch_size: Optional[int] = None,
+                      concurrency: Optional[int] = None) -> Dict[str, int]:
     """
+    Brings the flat index in directory `path` in line with `source_files`,
+    the PDFs of one collection. The manifest records a hash per source file and per chunk:
+    unchanged files are skipped, changed or new files only get their new chunks
+    embedded (in batches of `batch_size`, `concurrency` requests at a time),
+    and chunks of deleted files are removed from the store. A full rebuild only
+    happens when no compatible index exists; even then, chunk embeddings are
+    served from the on-disk embedding cache where possible.
+
+    Only the build (see `build_vector_store`) calls this, on a staging copy;
+    served versions are never modified. Returns counts of added and removed
+    chunks and of re-read files.
+    """
+    index_path = os.path.join(path, INDEX_FILE)
+    store = None
     try:
-        if os.path.exists(FAISS_INDEX_PATH):
-            logger.info(f"Loading existing FAISS index from {SAVE_PATH}")
-            # Load the existing vector store from the specified folder
-            vectordb = FAISS.load_local(
-                SAVE_PATH, EMBEDDINGS, allow_dangerous_deserialization=True
-            )
-            logger.info("FAISS index loaded successfully.")
+        manifest = _load_manifest(path)
+        compatible = (os.path.exists(index_path) and os.path.exists(os.path.join(path, CHUNKS_FILE))
+                      and manifest is not None and manifest.get("params") == _manifest_params())
+        if not compatible:
+            logger.info(f"No compatible FAISS index found in {path}. Creating a new one.")
+            manifest = {"params": _manifest_params(), "files": {}}
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len
+        )
+        indexed_files: Dict[str, dict] = manifest["files"]
+        current_files = {file: _file_hash(file) for file in source_files}
+
+        to_delete: List[str] = []
+        added = 0
+
+        for file in set(indexed_files) - set(current_files):
+            logger.info(f"Source file removed, dropping its chunks: {file}")
+            to_delete.extend(c["id"] for c in indexed_files.pop(file)["chunks"])
+
+        changed = [
+            file for file, file_hash in current_files.items()
+            if indexed_files.get(file, {}).get("hash") != file_hash
+        ]
+        if compatible and not changed and not to_delete:
+            logger.info("FAISS index is up to date with the source documents.")
+            return {"added": 0, "removed": 0, "files": 0}
+
+        store = ChunkStore(os.path.join(path, CHUNKS_FILE))
+        vectordb = None
+        if compatible:
+            vectordb = FAISS(get_embeddings(), faiss.read_index(index_path), store, store.row_map())
+            logger.info(f"Loaded existing FAISS index from {path} ({vectordb.index.ntotal} vectors)")
         else:
-            logger.info(f"No FAISS index found at {FAISS_INDEX_PATH}. Creating a new one.")
-            # Step 1: Create the vector store from documents
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
-            chunks = text_splitter.split_documents(documents)
-            logger.info(f"Split the source documents into {len(chunks)} chunks.")
+            store.clear()
+
+        def _new_chunks():
+            # Diffs each file against the manifest as soon as it is chunked and
+            # streams only the chunks that are not in the index yet.
+            nonlocal added
+            for file, chunks in split_files(parsed, text_splitter, stats["split"]):
+                _assign_chunk_ids(file, chunks)
+                entry = indexed_files.get(file)
+                old_ids = {c["id"] for c in entry["chunks"]} if entry else set()
+                new_ids = {c.id for c in chunks}
+                to_delete.extend(old_ids - new_ids)
+                indexed_files[file] = {
+                    "hash": current_files[file],
+                    "chunks": [{"id": c.id, "hash": c.metadata["chunk_hash"]} for c in chunks],
+                }
+                logger.info(f"{'Updated' if entry else 'New'} source file {file}: "
+                            f"{len(new_ids - old_ids)} chunks to add, {len(old_ids - new_ids)} to remove")
+                for chunk in chunks:
+                    if chunk.id not in old_ids:
+                        added += 1
+                        yield chunk
 
-            vectordb = FAISS.from_documents(chunks, EMBEDDINGS)
+        # parse (process pool) → split → embed (batched, concurrent) → FAISS add,
+        # with bounded queues between stages. Files that fail to parse are
+        # skipped and keep their previously indexed chunks.
+        stats = {name: StageStats(name) for name in ("parse", "split", "embed", "index")}
+        workers = config.INGEST_WORKERS or default_workers()
+        parsed = prefetch(parse_files(changed, workers, stats["parse"]), config.INGEST_QUEUE_SIZE)
+        embedded = prefetch(
+            embed_batches(_new_chunks(), get_embeddings(), batch_size or config.INGEST_EMBED_BATCH_SIZE,
+                          concurrency or config.INGEST_EMBED_CONCURRENCY, stats["embed"]),
+            config.INGEST_QUEUE_SIZE,
+        )
+        vectordb = index_batches(
+            embedded, vectordb,
+            lambda text_embeddings, metadatas, ids: _new_master(store, text_embeddings, metadatas, ids),
+            stats["index"],
+        )
+        if changed:
+            logger.info("Ingestion stages: " + "; ".join(str(st) for st in stats.values()))
 
-            # Step 2: Save the newly created vector store to disk
-            vectordb.save_local(SAVE_PATH)
-            logger.info(f"Successfully created and saved FAISS index to {SAVE_PATH}")
+        if vectordb is not None and to_delete:
+            vectordb.delete(to_delete)
+        if vectordb is None:
+            raise ValueError(f"No documents found to index into {path}")
 
-        return vectordb
+        tmp = index_path + ".tmp"
+        faiss.write_index(vectordb.index, tmp)
+        os.replace(tmp, index_path)
+        store.commit(vectordb.index_to_docstore_id)
+        _save_manifest(path, manifest)
+        logger.info(f"Saved FAISS index to {path} ({added} chunks added, {len(to_delete)} removed)")
+        return {"added": added, "removed": len(to_delete), "files": len(changed)}
     except Exception as e:
-        logger.error(f"Error initializing vector store: {e}")
+        logger.error(f"Error syncing vector store: {e}")
+        if store is not None:
+            store.rollback()
         raise
 
-# --- INITIALIZATION ---
-# This code runs ONCE when the module is first imported.
-# It creates/loads the vector store and the retriever, making them ready for use.
-try:
-    logger.info("Initializing RAG tool...")
-    vectordb = initialize_vector_store()
-    retriever = vectordb.as_retriever(search_kwargs={"k": 2})
-    logger.info("RAG tool initialized successfully.")
-except Exception as e:
-    logger.error(f"Failed to initialize RAG tool: {e}")
-    # Depending on desired behavior, you might want to re-raise or handle differently
-    raise
+def _new_master(store: ChunkStore, text_embeddings, metadatas, ids) -> FAISS:
+    """An empty flat index over `store`, seeded with the first embedded batch."""
+    vectordb = FAISS(get_embeddings(), faiss.IndexFlatL2(len(text_embeddings[0][1])), store, {})
+    vectordb.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vectordb
 
+def _compute_kb_version(path: str) -> str:
+    """
+    Fingerprints a flat index file. Any change to the indexed chunks rewrites
+    index.faiss, so the version changes and downstream caches know to drop
+    their entries; an unchanged corpus keeps its version.
+    """
+    return _file_hash(os.path.join(path, INDEX_FILE))[:16]
 
-# --- TOOL DEFINITION ---
-@tool
-def rag_search_tool(query: str) -> str:
+# ── Offline build ────────────────────────────────────────────────────
+def build_vector_store(index_types: Optional[List[str]] = None, batch_size: Optional[int] = None,
+                       concurrency: Optional[int] = None, keep: Optional[int] = None,
+                       rebuild: bool = False, collection: str = DEFAULT_COLLECTION,
+                       source_files: Optional[List[str]] = None) -> str:
     """
-    Searches the RAG knowledge base for relevant documents and returns their content.
+    Builds a new version of one collection (default: the source PDFs found
+    for it) and publishes it: the current version is copied to a staging
+    directory, synced incrementally (everything when `rebuild`),
+    fingerprinted, given the derived `index_types` (default:
+    FAISS_INDEX_TYPE) and its centroid, and switched in atomically. Holds a
+    cross-process lock per collection, so concurrent callers build once.
+    Embeddings are checkpointed in the embedding cache as they arrive, so
+    re-running an interrupted build only embeds what is still missing.
+
+    Returns the published version; when nothing changed that is the current one.
+    """
+    kinds = index_types or [config.FAISS_INDEX_TYPE]
+    for kind in kinds:
+        factory_string(kind, 1, 1)  # rejects unknown types before any work is done
+    if source_files is None:
+        source_files = _discover().get(collection, [])
+    root = kb_collections.collection_root(SAVE_PATH, collection)
+    with kb_versions.build_lock(root):
+        current = kb_versions.current_version(root)
+        if rebuild:
+            seed = None
+        elif current is not None:
+            seed = kb_versions.version_path(root, current)
+        elif collection == DEFAULT_COLLECTION and os.path.exists(os.path.join(SAVE_PATH, INDEX_FILE)):
+            # Carries an index built before versioning over into the first version.
+            seed = SAVE_PATH
+        else:
+            seed = None
+        staging = kb_versions.new_staging(root, seed)
+        try:
+            counts = sync_vector_store(staging, source_files, batch_size, concurrency)
+            version = _compute_kb_version(staging)
+            target = kb_versions.version_path(root, version)
+            if os.path.isdir(target):
+                # Same chunks as an existing version (usually the current one):
+                # reuse it, only adding index types it doesn't have yet.
+                shutil.rmtree(staging)
+                _add_index_types(target, version, kinds)
+                _ensure_centroid(target)
+                _ensure_lexical_index(target)
+            else:
+                _add_index_types(staging, version, kinds)
+                _ensure_centroid(staging)
+                manifest = _load_manifest(staging)
+                manifest.update({
+                    "version": version,
+                    "collection": collection,
+                    "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "chunks": sum(len(entry["chunks"]) for entry in manifest["files"].values()),
+                    "last_build": counts,
+                })
+                _save_manifest(staging, manifest)
+                kb_versions.finalize(root, staging, version)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if version == current:
+            logger.info(f"Collection {collection} version {version} is up to date")
+        else:
+            kb_versions.publish(root, version)
+        if seed == SAVE_PATH:
+            _remove_unversioned_files()
+        kb_versions.prune(root, config.KB_KEEP_VERSIONS if keep is None else keep)
+        return version
+
+def build_collections(index_types: Optional[List[str]] = None, batch_size: Optional[int] = None,
+                      concurrency: Optional[int] = None, keep: Optional[int] = None, rebuild: bool = False,
+                      names: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Builds and publishes every collection of the source folder, or only
+    `names`. Published collections whose source PDFs are gone (e.g. the
+    default one after switching KB_COLLECTIONS on) are retired, so their
+    chunks stop being served. Returns {collection: version}.
+    """
+    found = _discover()
+    if names:
+        unknown = sorted(set(names) - set(found))
+        if unknown:
+            raise ValueError(f"Unknown collections {unknown}; found {sorted(found)} in {folder_path}")
+    elif not found:
+        raise ValueError(f"No documents found to index in {folder_path}")
+    versions = {
+        name: build_vector_store(index_types, batch_size, concurrency, keep, rebuild, name, files)
+        for name, files in found.items() if not names or name in names
+    }
+    if not names:
+        for name in kb_collections.published_collections(SAVE_PATH, split=True):
+            if name not in found:
+                root = kb_collections.collection_root(SAVE_PATH, name)
+                with kb_versions.build_lock(root):
+                    kb_versions.retire(root)
+                    kb_versions.prune(root, config.KB_KEEP_VERSIONS if keep is None else keep)
+    return versions
+
+def _discover() -> Dict[str, List[str]]:
+    return kb_collections.discover_collections(folder_path, config.KB_COLLECTIONS, config.INGEST_RECURSIVE)
+
+def _add_index_types(path: str, version: str, kinds: List[str]) -> None:
+    """Derives the serving indexes of `kinds` in a version directory and lists them in its manifest."""
+    for kind in kinds:
+        sync_derived_index(path, kind, version)
+    manifest = _load_manifest(path)
+    built = sorted(set(manifest.get("index_types", [])) | set(kinds))
+    if built != manifest.get("index_types"):
+        manifest["index_types"] = built
+        _save_manifest(path, manifest)
+
+def _ensure_centroid(path: str) -> None:
+    """Writes the centroid the query router compares collections by, if missing."""
+    if os.path.exists(os.path.join(path, kb_collections.CENTROID_FILE)):
+        return
+    index = faiss.read_index(os.path.join(path, INDEX_FILE))
+    kb_collections.save_centroid(path, kb_collections.compute_centroid(index.reconstruct_n(0, index.ntotal)))
+
+def _ensure_lexical_index(path: str) -> None:
+    """Adds the full-text index to a chunk store written before it had one."""
+    ChunkStore(os.path.join(path, CHUNKS_FILE)).close()
+
+def _remove_unversioned_files() -> None:
+    """Drops the index files of the pre-versioning layout once they were carried over."""
+    for name in os.listdir(SAVE_PATH):
+        if name in (INDEX_FILE, CHUNKS_FILE, MANIFEST_FILE, LEGACY_DOCSTORE_FILE) or (
+                name.startswith("index.") and name.endswith((".faiss", ".json"))):
+            os.remove(os.path.join(SAVE_PATH, name))
+
+# ── Serving ──────────────────────────────────────────────────────────
+class Shard(NamedTuple):
+    """A loaded collection: its FAISS store and, with RAG_HYBRID, the hybrid retriever over it."""
+    vectordb: FAISS
+    hybrid: Optional[HybridRetriever]
+
+def _load_version(collection: str, version: str) -> FAISS:
+    """
+    The configured index type of a published version, memory-mapped if
+    FAISS_MMAP. Published versions are never written to: a version built
+    without that index type is served from its flat index.
+    """
+    root = kb_collections.collection_root(SAVE_PATH, collection)
+    path = kb_versions.version_path(root, version)
+    kind = config.FAISS_INDEX_TYPE
+    if kind != "flat" and not os.path.exists(os.path.join(path, f"index.{kind}.faiss")):
+        logger.warning(f"Collection {collection} version {version} has no {kind} index; serving the flat "
+                       f"index (pass --index-types {kind} to scripts/build_vector_store.py)")
+        metrics.inc("kb.index_type_fallbacks", collection=collection)
+        kind = "flat"
+    return load_serving_store(path, get_embeddings(), kind, config.FAISS_MMAP)
+
+def _load_shard(collection: str, version: str) -> Shard:
+    vectordb = _load_version(collection, version)
+    hybrid = _build_hybrid(vectordb) if config.RAG_HYBRID else None
+    logger.info(f"Loaded collection {collection} (version {version})")
+    return Shard(vectordb, hybrid)
+
+def _load_centroid(collection: str, version: str) -> Optional[np.ndarray]:
+    root = kb_collections.collection_root(SAVE_PATH, collection)
+    path = kb_versions.version_path(root, version)
+    centroid = kb_collections.load_centroid(path)
+    if centroid is None:
+        # Built before collections had centroids: searched for every query
+        # until the next build writes one.
+        logger.warning(f"Collection {collection} version {version} has no centroid; "
+                       "rebuild it with scripts/build_vector_store.py")
+    return centroid
+
+def _published() -> Dict[str, str]:
+    return kb_collections.published_collections(SAVE_PATH, config.KB_COLLECTIONS)
+
+def initialize_collections() -> Dict[str, Tuple[str, Optional[np.ndarray]]]:
+    """
+    Reads the published version and centroid of every collection; indexes are
+    only loaded when a query is routed to them. Serving processes never write
+    to a version; when nothing has been published yet they fail, unless
+    KB_AUTO_BUILD is set and the collections are built first (once, even with
+    several workers starting together).
+    """
+    published = _published()
+    if not published:
+        if not config.KB_AUTO_BUILD:
+            raise FileNotFoundError(f"No vector store version published in {SAVE_PATH}; "
+                                    "run python scripts/build_vector_store.py")
+        logger.info("No vector store version published yet; building one")
+        build_collections()
+        published = _published()
+    return {name: (version, _load_centroid(name, version)) for name, version in published.items()}
+
+def _combined_version(catalog: Dict[str, Tuple[str, Optional[np.ndarray]]]) -> str:
+    """One tag for the whole KB: the version of a single collection, else a hash over all of them."""
+    if list(catalog) == [DEFAULT_COLLECTION]:
+        return catalog[DEFAULT_COLLECTION][0]
+    return content_hash(",".join(f"{name}={version}" for name, (version, _) in sorted(catalog.items())))[:16]
+
+def _warm_collections() -> List[str]:
+    """Loads collections ahead of the first query, as many as may stay loaded."""
+    catalog = _catalog.get()
+    names = list(catalog)[:_shards.max_loaded]
+    for name in names:
+        _shards.get(name, catalog[name][0])
+    return names
+
+# name -> (published version, centroid)
+_catalog: Lazy[Dict[str, Tuple[str, Optional[np.ndarray]]]] = Lazy("kb_collections", initialize_collections)
+_shards: CollectionCache[Shard] = CollectionCache(_load_shard, config.KB_MAX_LOADED_COLLECTIONS)
+_vector_store: Lazy[List[str]] = Lazy("vector_store", _warm_collections)
+_kb_version: Lazy[str] = Lazy("kb_version", lambda: _combined_version(_catalog.get()))
+
+def _build_hybrid(vectordb: FAISS) -> HybridRetriever:
+    return HybridRetriever(
+        vectordb,
+        candidates=max(config.RAG_CANDIDATES, RETRIEVER_K),
+        rrf_k=config.RAG_RRF_K,
+        mmr_lambda=config.RAG_MMR_LAMBDA,
+        reranker=config.RAG_RERANKER or None,
+    )
+
+def get_shard(collection: str = DEFAULT_COLLECTION) -> Shard:
+    """A published collection, loaded on first use and kept while recently searched."""
+    catalog = _catalog.get()
+    if collection not in catalog:
+        raise KeyError(f"Unknown collection {collection!r}; published: {sorted(catalog)}")
+    return _shards.get(collection, catalog[collection][0])
+
+def get_vectordb(collection: str = DEFAULT_COLLECTION) -> FAISS:
+    return get_shard(collection).vectordb
+
+def get_retriever(collection: str = DEFAULT_COLLECTION):
+    return get_vectordb(collection).as_retriever(search_kwargs={"k": RETRIEVER_K})
+
+def get_hybrid_retriever(collection: str = DEFAULT_COLLECTION) -> HybridRetriever:
+    shard = get_shard(collection)
+    return shard.hybrid or _build_hybrid(shard.vectordb)
+
+def get_kb_version() -> str:
+    """Returns the version tag of the knowledge base currently being served."""
+    return _kb_version.get()
+
+def install_collection(collection: str, version: str, vectordb: FAISS) -> None:
+    """Serves `vectordb` as a collection, without anything on disk (benchmarks)."""
+    try:
+        centroid = kb_collections.compute_centroid(vectordb.index.reconstruct_n(0, vectordb.index.ntotal))
+    except RuntimeError:
+        centroid = None  # IVF indexes can't reconstruct; the collection is then always searched
+    catalog = dict(_catalog.get()) if _catalog.ready else {}
+    catalog[collection] = (version, centroid)
+    _shards.set(collection, version, Shard(vectordb, _build_hybrid(vectordb) if config.RAG_HYBRID else None))
+    _catalog.set(catalog)
+    _kb_version.set(_combined_version(catalog))
+
+def reload_vector_store() -> Optional[str]:
+    """
+    Swaps in the published versions of all collections if any differs from
+    the ones being served; loaded collections are replaced right away, the
+    others on their next search. Queries already running keep using the
+    previous stores, so a new build can be rolled out while serving. Returns
+    the new KB version tag, or None if unchanged.
+    """
+    published = _published()
+    if not published:
+        return None
+    old = _catalog.get() if _catalog.ready else {}
+    if {name: version for name, (version, _) in old.items()} == published:
+        return None
+    catalog = {
+        name: old[name] if name in old and old[name][0] == version else (version, _load_centroid(name, version))
+        for name, version in published.items()
+    }
+    for name, version in _shards.loaded().items():
+        if name not in catalog:
+            _shards.discard(name)
+        elif catalog[name][0] != version:
+            _shards.set(name, catalog[name][0], _load_shard(name, catalog[name][0]))
+    _catalog.set(catalog)
+    version = _combined_version(catalog)
+    _kb_version.set(version)
+    logger.info(f"Vector store reloaded (kb_version={version}, collections={sorted(catalog)}).")
+    return version
+
+def refresh_vector_store() -> str:
+    """Builds new versions from the source folder and swaps them in. Returns the served KB version."""
+    build_collections()
+    reload_vector_store()
+    return get_kb_version()
+
+def watch_vector_store(interval: float) -> threading.Thread:
+    """Polls the published versions every `interval` seconds and hot-swaps newer ones."""
+    def _watch():
+        while True:
+            time.sleep(interval)
+            try:
+                reload_vector_store()
+            except Exception as e:
+                logger.error(f"Reloading the vector store failed; still serving the previous version: {e}")
+
+    thread = threading.Thread(target=_watch, name="kb-version-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+def _to_similarity(vectordb: FAISS, score: float) -> float:
+    """Converts a raw FAISS score into cosine similarity (higher is better)."""
+    if vectordb.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return float(score)
+    # IndexFlatL2 returns squared L2 distances; for unit-length embeddings
+    # (OpenAI's are) that is 2 - 2*cos.
+    return 1.0 - float(score) / 2.0
+
+def route_collections(query_vector: List[float]) -> List[str]:
+    """The collections a query is searched in, by centroid similarity (see KB_COLLECTIONS_PER_QUERY)."""
+    catalog = _catalog.get()
+    if len(catalog) == 1:
+        return list(catalog)
+    chosen = kb_collections.select_collections(
+        query_vector, {name: centroid for name, (_, centroid) in catalog.items()},
+        config.KB_COLLECTIONS_PER_QUERY, config.KB_COLLECTION_MARGIN,
+    )
+    logger.info("Routed query to collections: " + ", ".join(f"{name} ({sim:.3f})" for name, sim in chosen))
+    return [name for name, _ in chosen]
+
+def _search_collection(collection: str, query: str, query_vector: List[float],
+                       k: int) -> List[Tuple[Document, float]]:
+    shard = get_shard(collection)
+    if config.RAG_HYBRID:
+        hits = (shard.hybrid or _build_hybrid(shard.vectordb)).search(query, k, query_vector=query_vector)
+    else:
+        with span("retrieval", "faiss"):
+            found = shard.vectordb.similarity_search_with_score_by_vector(query_vector, k=k)
+        hits = [(doc, _to_similarity(shard.vectordb, score)) for doc, score in found]
+    for doc, _ in hits:
+        doc.metadata["collection"] = collection
+    metrics.inc("rag.collection_searches", collection=collection)
+    return hits
+
+def search_with_scores(query: str, k: int = RETRIEVER_K) -> List[Tuple[Document, float]]:
+    """
+    Returns the top-k chunks with their cosine similarity to the query, in
+    rank order: hybrid BM25 + FAISS retrieval when RAG_HYBRID is on, plain
+    dense search otherwise. The query is embedded once, routed to the closest
+    collections, and those are searched in parallel; their hits are merged by
+    similarity.
+    """
+    started = time.perf_counter()
+    query_vector = get_embeddings().embed_query(query)
+    names = route_collections(query_vector)
+    # The closest collection is searched on this thread, the others alongside it.
+    others = [_search_pool.submit(_search_collection, name, query, query_vector, k) for name in names[1:]]
+    hits = _search_collection(names[0], query, query_vector, k)
+    if others:
+        hits.extend(hit for future in others for hit in future.result())
+        hits = sorted(hits, key=lambda hit: -hit[1])[:k]
+    metrics.inc("rag.searches")
+    metrics.inc("rag.search_seconds", time.perf_counter() - started)
+    return hits
+
+# Threads are only started once a query spans several collections.
+_search_pool = ThreadPoolExecutor(max_workers=4 * max(1, config.KB_COLLECTIONS_PER_QUERY - 1),
+                                  thread_name_prefix="kb-search")
+
+def retrieval_report() -> dict:
+    """RAG turns, how many fell back to the web, mean search latency and the collections served."""
+    searches = metrics.get("rag.searches")
+    turns = metrics.get("rag.turns")
+    fallbacks = metrics.get("rag.web_fallbacks")
+    return {
+        "hybrid": config.RAG_HYBRID,
+        "k": RETRIEVER_K,
+        "rag_turns": turns,
+        "web_fallbacks": fallbacks,
+        "web_fallback_rate": fallbacks / turns if turns else 0.0,
+        "mean_search_seconds": metrics.get("rag.search_seconds") / searches if searches else 0.0,
+        "lexical_only_candidates": metrics.get("rag.lexical_only_candidates"),
+        "collections": sorted(_catalog.get()) if _catalog.ready else [],
+        "loaded_collections": _shards.loaded(),
+    }
+
+def rag_search_with_scores(query: str) -> Tuple[str, List[float]]:
+    """
+    Like rag_search_tool, but also returns the similarity score of each
+    retrieved chunk so callers can judge retrieval quality without an LLM.
+    Scores are empty when nothing was found or the search failed.
     """
     try:
         logger.info(f"Performing RAG search for query: {query}")
-        # The retriever is already initialized and ready to be used.
-        docs = retriever.invoke(query)
-        if docs:
-            logger.info(f"Found {len(docs)} relevant documents for query: {query}")
-            return "\n\n".join(d.page_content for d in docs)
+        hits = search_with_scores(query)
+        if hits:
+            scores = [score for _, score in hits]
+            logger.info(f"Found {len(hits)} relevant documents for query: {query} "
+                        f"(top similarity {max(scores):.3f})")
+            return "\n\n".join(d.page_content for d, _ in hits), scores
         else:
             logger.info(f"No relevant documents found for query: {query}")
-            return "No relevant documents found."
+            return "No relevant documents found.", []
     except Exception as e:
         logger.error(f"Error during RAG search for query '{query}': {e}")
-        return f"RAG_ERROR::{e}"
\ No newline at end of file
+        return f"RAG_ERROR::{e}", []
+
+# --- TOOL DEFINITION ---
+@tool
+def rag_search_tool(query: str) -> str:
+    """
+    Searches the RAG knowledge base for relevant documents and returns their content.
+    Only the collections closest to the query are searched.
+    """
+    return rag_search_with_scores(query)[0]
@@ -0,0 +1,196 @@
+import re
+import math
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+
+from src.core.metrics import metrics
+from src.core.telemetry import span
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t.lower() for t in _TOKEN.findall(text)]
+
+
+# ── Lexical index ───────────────────────────────────────────────────
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index (term → {doc position: term frequency}).
+    `ids` are returned as given, e.g. FAISS row numbers.
+    Catches the exact-match queries dense retrieval misses: names, product
+    codes, acronyms. Held in memory, so only used for in-memory docstores;
+    the on-disk ChunkStore searches its own FTS5 index instead.
+    """
+
+    def __init__(self, ids: Sequence, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lengths = np.zeros(len(self.ids), dtype=np.float32)
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self._lengths[position] = sum(counts.values())
+            for term, tf in counts.items():
+                self._postings[term][position] = tf
+        self._avg_length = float(self._lengths.mean()) if len(self.ids) else 0.0
+        n = len(self.ids)
+        self._idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self._postings.items()
+        }
+
+    def search(self, query: str, k: int) -> List[Tuple[object, float]]:
+        """Top-k (id, BM25 score), best first; documents sharing no term are left out."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for position, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / (self._avg_length or 1.0))
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[position], float(score)) for position, score in best]
+
+
+# ── Fusion and selection ────────────────────────────────────────────
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], k: int = 60) -> List[Tuple[object, float]]:
+    """Merges ranked id lists: score(d) = Σ 1 / (k + rank of d in each list)."""
+    fused: Dict[object, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def mmr_select(relevance: Sequence[float], vectors: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """
+    Maximal marginal relevance: greedily picks `k` positions trading
+    relevance against cosine similarity to what was already picked, so
+    overlapping chunks (e.g. neighbours sharing the chunk overlap) don't
+    crowd out other evidence. `vectors` must be unit length.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    if len(relevance) == 0:
+        return []
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(relevance)):
+        redundancy = (vectors @ vectors[selected].T).max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+
+def _load_cross_encoder(model_name: str):
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        logger.warning("RAG_RERANKER is set but sentence-transformers is not installed; reranking disabled")
+        return None
+    logger.info(f"Loading reranker {model_name}")
+    return CrossEncoder(model_name)
+
+
+# ── Hybrid retriever ────────────────────────────────────────────────
+class HybridRetriever:
+    """
+    Dense (FAISS) + lexical (BM25) retrieval over the same chunks. The
+    lexical side is the ChunkStore's FTS5 index on disk; for an in-memory
+    docstore a BM25Index is built over its texts. A ChunkStore written
+    before it had an FTS5 index is searched dense-only until rebuilt.
+
+      1. top `candidates` from each index
+      2. reciprocal rank fusion of the two lists
+      3. optional cross-encoder rerank of the fused candidates
+      4. MMR down to k (skipped when `mmr_lambda` >= 1)
+
+    Every returned chunk carries its cosine similarity to the query, so the
+    sufficiency gate's thresholds keep their meaning.
+    """
+
+    def __init__(self, vectordb: FAISS, candidates: int = 20, rrf_k: int = 60, mmr_lambda: float = 0.7,
+                 reranker: Optional[str] = None):
+        self.vectordb = vectordb
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.mmr_lambda = mmr_lambda
+        # Everything works on FAISS row numbers; chunk text is only fetched for
+        # the final hits (and for the reranker's candidates, when enabled).
+        self.bm25: Optional[BM25Index] = None
+        docstore = vectordb.docstore
+        if hasattr(docstore, "lexical_search"):
+            self._lexical_search = docstore.lexical_search
+            if not docstore.has_lexical_index:
+                logger.warning("Chunk store has no full-text index; hybrid retrieval is dense-only "
+                               "until the next scripts/build_vector_store.py run")
+        else:
+            docs = list(self._iter_docs())
+            self.bm25 = BM25Index([row for row, _ in docs], [text for _, text in docs])
+            self._lexical_search = self.bm25.search
+            logger.info(f"BM25 index built over {len(self.bm25.ids)} in-memory chunks")
+        self._reranker = _load_cross_encoder(reranker) if reranker else None
+
+    def _iter_docs(self) -> Iterator[Tuple[int, str]]:
+        docstore = self.vectordb.docstore
+        for row, doc_id in self.vectordb.index_to_docstore_id.items():
+            doc = docstore.search(doc_id)
+            if isinstance(doc, Document):
+                yield row, doc.page_content
+
+    def _document(self, row: int) -> Document:
+        return self.vectordb.docstore.search(self.vectordb.index_to_docstore_id[row])
+
+    def _vectors(self, rows: Sequence[int]) -> np.ndarray:
+        vectors = np.stack([self.vectordb.index.reconstruct(int(row)) for row in rows]).astype(np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def search(self, query: str, k: int, query_vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """The top-k chunks for `query`; pass `query_vector` when it is already embedded."""
+        if query_vector is None:
+            query_vector = self.vectordb.embedding_function.embed_query(query)
+        query_vector = np.asarray([query_vector], dtype=np.float32)
+        if self.vectordb._normalize_L2:
+            query_vector /= np.linalg.norm(query_vector) or 1.0
+        with span("retrieval", "faiss"):
+            _, found = self.vectordb.index.search(query_vector, self.candidates)
+        dense_rows = [int(row) for row in found[0] if row != -1]
+        with span("retrieval", "bm25"):
+            lexical_rows = [row for row, _ in self._lexical_search(query, self.candidates)]
+        fused = reciprocal_rank_fusion([dense_rows, lexical_rows], k=self.rrf_k)[:self.candidates]
+        if not fused:
+            return []
+        lexical_only = set(lexical_rows[:k]) - set(dense_rows)
+        if lexical_only:
+            metrics.inc("rag.lexical_only_candidates", len(lexical_only))
+
+        rows = [row for row, _ in fused]
+        relevance = np.array([score for _, score in fused], dtype=np.float32)
+        if self._reranker is not None:
+            texts = [self._document(row).page_content for row in rows]
+            with span("retrieval", "rerank"):
+                relevance = np.asarray(self._reranker.predict([(query, t) for t in texts]), dtype=np.float32)
+        # Scale to [0, 1] so MMR's trade-off doesn't depend on the score type.
+        spread = float(relevance.max() - relevance.min())
+        relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+        vectors = self._vectors(rows)
+        if self.mmr_lambda < 1:
+            order = mmr_select(relevance, vectors, k, self.mmr_lambda)
+        else:
+            order = [int(i) for i in np.argsort(-relevance)[:k]]
+
+        q = query_vector[0] / (np.linalg.norm(query_vector[0]) or 1.0)
+        cosine = vectors @ q
+        return [(self._document(rows[i]), float(cosine[i])) for i in order]
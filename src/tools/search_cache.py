@@ -0,0 +1,155 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from src.core.metrics import metrics
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation don't change a web search."""
+    return _SPACE.sub(" ", query.strip().lower()).rstrip("?!. ")
+
+
+# ── TTL cache with single-flight ────────────────────────────────────
+class SearchCache:
+    """
+    Caches search results per normalized query for `ttl_seconds`, and
+    coalesces concurrent identical queries: while one request for a query is
+    outstanding, other callers wait for its result instead of sending their
+    own ("single flight").
+
+    Results for which `cacheable` returns False (errors) are handed to
+    the callers already waiting but not stored. With `path`, entries are also
+    kept in SQLite and survive restarts.
+
+    Metrics (prefix "web_cache."):
+      hits, misses, coalesced   - lookups served from cache / fetched / joined an in-flight fetch
+      fetch_seconds, fetches    - time spent on real searches
+      saved_seconds             - estimated search latency avoided by hits and coalescing
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, path: Optional[str] = None,
+                 cacheable: Callable[[str], bool] = lambda result: True):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.cacheable = cacheable
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, result)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, result TEXT, created_at REAL)"
+            )
+            self._db.execute("DELETE FROM searches WHERE created_at < ?", (time.time() - ttl_seconds,))
+            self._db.commit()
+
+    def _mean_fetch_seconds(self) -> float:
+        fetches = metrics.get("web_cache.fetches")
+        return metrics.get("web_cache.fetch_seconds") / fetches if fetches else 0.0
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute("SELECT created_at, result FROM searches WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = self._entries[key] = (row[0], row[1])
+        if entry is None:
+            return None
+        if now - entry[0] > self.ttl_seconds:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key: str, result: str) -> None:
+        created_at = time.time()
+        self._entries[key] = (created_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self._db is not None:
+            try:
+                self._db.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)", (key, result, created_at))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not persist web search result: {e}")
+
+    def get_or_fetch(self, query: str, fetch: Callable[[str], str]) -> str:
+        key = normalize_query(query)
+        with self._lock:
+            cached = self._get(key)
+            if cached is not None:
+                metrics.inc("web_cache.hits")
+                metrics.inc("web_cache.saved_seconds", self._mean_fetch_seconds())
+                logger.info(f"Web search cache hit for query: {query}")
+                return cached
+            leader = self._inflight.get(key)
+            if leader is None:
+                future = self._inflight[key] = Future()
+        if leader is not None:
+            metrics.inc("web_cache.coalesced")
+            logger.info(f"Joining in-flight web search for query: {query}")
+            waited = time.perf_counter()
+            result = leader.result()
+            # Only the part of the search that had already elapsed was saved.
+            saved = self._mean_fetch_seconds() - (time.perf_counter() - waited)
+            metrics.inc("web_cache.saved_seconds", max(0.0, saved))
+            return result
+
+        metrics.inc("web_cache.misses")
+        started = time.perf_counter()
+        try:
+            result = fetch(query)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        metrics.inc("web_cache.fetches")
+        metrics.inc("web_cache.fetch_seconds", time.perf_counter() - started)
+        with self._lock:
+            if self.cacheable(result):
+                self._put(key, result)
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM searches")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        hits = metrics.get("web_cache.hits")
+        coalesced = metrics.get("web_cache.coalesced")
+        misses = metrics.get("web_cache.misses")
+        lookups = hits + coalesced + misses
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "coalesced": coalesced,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "requests_avoided_rate": (hits + coalesced) / lookups if lookups else 0.0,
+            "saved_seconds": metrics.get("web_cache.saved_seconds"),
+            "mean_search_seconds": self._mean_fetch_seconds(),
+        }
@@ -0,0 +1,166 @@
+import io
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pypdf import PdfReader
+from langchain_community.vectorstores import FAISS
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from src.core import config
+from src.core.metrics import metrics
+from src.tools.rag import CHUNK_SIZE, CHUNK_OVERLAP, get_embeddings
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+
+# ── In-memory PDF parsing ───────────────────────────────────────────
+def parse_pdf_bytes(data: bytes, name: str) -> List[Document]:
+    """One Document per non-empty page, like PyPDFLoader, without a temp file."""
+    reader = PdfReader(io.BytesIO(data))
+    pages = []
+    for number, page in enumerate(reader.pages):
+        text = page.extract_text() or ""
+        if text.strip():
+            pages.append(Document(page_content=text, metadata={"source": name, "page": number}))
+    return pages
+
+
+# ── Per-session upload index ────────────────────────────────────────
+class SessionUploads:
+    """The uploaded documents of one chat session and their FAISS index."""
+
+    def __init__(self):
+        self.vectordb: Optional[FAISS] = None
+        self.files: Dict[str, str] = {}       # content hash -> file name
+        self.first_chunks: List[Document] = []  # opening chunks of the latest upload
+        self.chunks = 0
+        self.last_access = time.time()
+
+
+class UploadStore:
+    """
+    Ephemeral, per-session vector indexes over uploaded PDFs.
+
+    Uploads are parsed in memory, deduplicated per session by content hash,
+    chunked like the KB and embedded through the shared (cached) embeddings.
+    Sessions idle for `ttl_seconds` are released on the next access, and at
+    most `max_sessions` are kept (least recently used first out).
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int, max_chunks: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_chunks = max_chunks
+        self._sessions: "OrderedDict[str, SessionUploads]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    def _sweep(self) -> None:
+        now = time.time()
+        for session_id in [s for s, u in self._sessions.items() if now - u.last_access > self.ttl_seconds]:
+            del self._sessions[session_id]
+            metrics.inc("uploads.expired")
+            logger.info(f"Released upload index of expired session {session_id}")
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            metrics.inc("uploads.evicted")
+
+    def _session(self, session_id: str, create: bool = False) -> Optional[SessionUploads]:
+        with self._lock:
+            self._sweep()
+            session = self._sessions.get(session_id)
+            if session is None and create:
+                session = self._sessions[session_id] = SessionUploads()
+            if session is not None:
+                session.last_access = time.time()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def add(self, session_id: str, name: str, data: bytes) -> dict:
+        """
+        Indexes an uploaded PDF for `session_id`. Returns
+        {"name", "hash", "pages", "chunks", "duplicate"}.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        session = self._session(session_id, create=True)
+        if digest in session.files:
+            metrics.inc("uploads.duplicates")
+            logger.info(f"Upload {name} is already indexed for session {session_id}")
+            return {"name": name, "hash": digest, "pages": 0, "chunks": 0, "duplicate": True}
+
+        pages = parse_pdf_bytes(data, name)
+        chunks = self._splitter.split_documents(pages)
+        room = self.max_chunks - session.chunks
+        if len(chunks) > room:
+            logger.warning(f"Upload {name} truncated to {max(room, 0)} of {len(chunks)} chunks")
+            chunks = chunks[:max(room, 0)]
+        if chunks:
+            texts = [c.page_content for c in chunks]
+            vectors = get_embeddings().embed_documents(texts)
+            metadatas = [c.metadata for c in chunks]
+            with self._lock:
+                if session.vectordb is None:
+                    session.vectordb = FAISS.from_embeddings(
+                        list(zip(texts, vectors)), get_embeddings(), metadatas=metadatas
+                    )
+                else:
+                    session.vectordb.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+                session.chunks += len(chunks)
+                session.first_chunks = chunks[:config.UPLOAD_RETRIEVER_K]
+        session.files[digest] = name
+        metrics.inc("uploads.files")
+        metrics.inc("uploads.chunks", len(chunks))
+        logger.info(f"Indexed upload {name} for session {session_id}: {len(pages)} pages, {len(chunks)} chunks")
+        return {"name": name, "hash": digest, "pages": len(pages), "chunks": len(chunks), "duplicate": False}
+
+    def search(self, session_id: str, query: str, k: Optional[int] = None) -> str:
+        """
+        The `k` chunks of the session's uploads most relevant to `query`,
+        formatted for the answer prompt. Without a query (an upload sent with no
+        question) the opening chunks of the latest upload are returned.
+        """
+        k = k or config.UPLOAD_RETRIEVER_K
+        session = self._session(session_id)
+        if session is None or session.vectordb is None:
+            return ""
+        if query.strip():
+            docs = session.vectordb.similarity_search(query, k=k)
+        else:
+            docs = session.first_chunks[:k]
+        metrics.inc("uploads.searches")
+        return "\n\n".join(
+            f"[{d.metadata.get('source', 'upload')}, page {d.metadata.get('page', 0) + 1}]\n{d.page_content}"
+            for d in docs
+        )
+
+    def files(self, session_id: str) -> List[str]:
+        session = self._session(session_id)
+        return list(session.files.values()) if session else []
+
+    def release(self, session_id: str) -> None:
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                logger.info(f"Released upload index of session {session_id}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "chunks": sum(s.chunks for s in self._sessions.values()),
+                "files": metrics.get("uploads.files"),
+                "duplicates": metrics.get("uploads.duplicates"),
+                "expired": metrics.get("uploads.expired"),
+            }
+
+
+upload_store = UploadStore(
+    ttl_seconds=config.SESSION_TIMEOUT_SECONDS,
+    max_sessions=config.UPLOAD_MAX_SESSIONS,
+    max_chunks=config.UPLOAD_MAX_CHUNKS,
+)
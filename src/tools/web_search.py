@@ -3,27 +3,38 @@ import logging
 from langchain_tavily import TavilySearch
 from langchain_core.tools import tool
 from dotenv import load_dotenv
+from src.core import config
+from src.core.lazy import Lazy
+from src.core.telemetry import span
+from src.tools.search_cache import SearchCache
 
 # ── LOGGING ─────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
-# Initialize Tavily search tool
+# Tavily search client, built on first use
 # Note: Ensure you have the correct API key set in your environment for Tavily
-try:
-    load_dotenv()
-    os.environ["TAVILY_API_KEY"] = os.getenv("TAVILY_API_KEY")
-    tavily = TavilySearch(max_results=3, topic="general")
-    logger.info("TavilySearch tool initialized successfully.")
-except Exception as e:
-    logger.error(f"Error initializing TavilySearch tool: {e}")
-    raise
+def _create_tavily() -> TavilySearch:
+    try:
+        load_dotenv()
+        if not os.getenv("TAVILY_API_KEY"):
+            logger.warning("TAVILY_API_KEY is not set")
+        client = TavilySearch(max_results=3, topic="general")
+        logger.info("TavilySearch tool initialized successfully.")
+        return client
+    except Exception as e:
+        logger.error(f"Error initializing TavilySearch tool: {e}")
+        raise
 
-@tool
-def web_search_tool(query: str) -> str:
-    """Up-to-date web info via Tavily"""
+_tavily: Lazy[TavilySearch] = Lazy("search_client", _create_tavily)
+
+def get_tavily() -> TavilySearch:
+    return _tavily.get()
+
+def _search_tavily(query: str) -> str:
     try:
         logger.info(f"Performing web search for query: {query}")
-        result = tavily.invoke({"query": query})
+        with span("tool", "tavily"):
+            result = get_tavily().invoke({"query": query})
 
         # Extract and format the results from Tavily response
         if isinstance(result, dict) and 'results' in result:
@@ -43,3 +54,18 @@ def web_search_tool(query: str) -> str:
         logger.error(f"Error during web search for query '{query}': {e}")
         return f"WEB_ERROR::{e}"
 
+# Identical fallback queries (e.g. many sessions asking about the same news)
+# share one Tavily request and its result for WEB_CACHE_TTL_SECONDS.
+web_cache = SearchCache(
+    ttl_seconds=config.WEB_CACHE_TTL_SECONDS,
+    max_entries=config.WEB_CACHE_MAX_ENTRIES,
+    path=config.WEB_CACHE_PATH or None,
+    cacheable=lambda result: not result.startswith("WEB_ERROR::"),
+)
+
+@tool
+def web_search_tool(query: str) -> str:
+    """Up-to-date web info via Tavily"""
+    if not config.WEB_CACHE_ENABLED:
+        return _search_tavily(query)
+    return web_cache.get_or_fetch(query, _search_tavily)
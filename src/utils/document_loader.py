@@ -8,36 +8,49 @@ from langchain.schema import Document
 # ── LOGGING ─────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
-def load_documents(folder_path: str) -> List[Document]:
-    documents = []
+def list_pdf_files(folder_path: str, recursive: bool = True) -> List[str]:
+    """Returns the paths of the PDF files under `folder_path`, sorted for stable ordering."""
+    if not os.path.isdir(folder_path):
+        logger.error(f"Folder not found: {folder_path}")
+        return []
+    paths = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for filename in files:
+            if filename.lower().endswith('.pdf'):
+                paths.append(os.path.join(root, filename))
+            else:
+                logger.debug(f"Skipping unsupported file type: {filename}")
+        if not recursive:
+            break
+    return sorted(paths)
+
+def load_pdf(file_path: str) -> List[Document]:
+    loader = PyPDFLoader(file_path)
+    return loader.load()
+
+def load_documents(folder_path: str, recursive: bool = True, workers: int = 0) -> List[Document]:
+    """
+    Loads every PDF under `folder_path` into memory. Kept for callers that need
+    the whole corpus at once; indexing streams through `src.utils.ingestion`
+    instead and never materialises the full list.
+    """
+    from src.utils.ingestion import StageStats, default_workers, parse_files
+
     logger.info(f"Attempting to load documents from folder: {folder_path}")
     try:
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            if filename.endswith('.pdf'):
-                try:
-                    loader = PyPDFLoader(file_path)
-                    docs = loader.load()
-                    documents.extend(docs)
-                    logger.info(f"Successfully loaded {len(docs)} documents from {filename}")
-                except Exception as e:
-                    logger.error(f"Error loading PDF file {filename}: {e}")
-            else:
-                logger.warning(f"Skipping unsupported file type: {filename}")
-                continue
-        logger.info(f"Finished loading documents. Total documents loaded: {len(documents)}")
+        stats = StageStats("parse")
+        paths = list_pdf_files(folder_path, recursive=recursive)
+        documents = []
+        for path, docs in parse_files(paths, workers or default_workers(), stats):
+            documents.extend(docs)
+            logger.info(f"Successfully loaded {len(docs)} documents from {path}")
+        logger.info(f"Finished loading documents. Total documents loaded: {len(documents)} ({stats})")
         return documents
-    except FileNotFoundError:
-        logger.error(f"Folder not found: {folder_path}")
-        return []
     except Exception as e:
         logger.error(f"An unexpected error occurred while loading documents: {e}")
         return []
 
+# Source folder of the RAG knowledge base. Documents are parsed on demand by
+# the vector store, which only re-reads files whose content hash changed.
 folder_path = "./data"
-try:
-    documents = load_documents(folder_path)
-    logger.info(f"Loaded {len(documents)} documents from the folder.")
-except Exception as e:
-    logger.critical(f"Failed to load documents at application startup: {e}")
-    documents = [] # Ensure documents is defined even if loading fails
@@ -0,0 +1,218 @@
+import os
+import time
+import queue
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from src.core.metrics import metrics
+from src.utils.document_loader import load_pdf
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+# ── Stage metrics ───────────────────────────────────────────────────
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    seconds: float = 0.0
+
+    def record(self, items: int, seconds: float) -> None:
+        self.items += items
+        self.seconds += seconds
+        metrics.inc(f"ingest.{self.name}.items", items)
+        metrics.inc(f"ingest.{self.name}.seconds", seconds)
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.items} items in {self.seconds:.2f}s ({self.throughput:.1f}/s)"
+
+
+# ── Plumbing ────────────────────────────────────────────────────────
+def prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """
+    Runs `iterable` in a background thread, handing items over through a
+    bounded queue. The producer blocks once `maxsize` items are waiting, which
+    gives the pipeline backpressure while letting adjacent stages overlap.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put(item):
+                    return
+            _put(_DONE)
+        except BaseException as e:
+            _put(e)
+
+    thread = threading.Thread(target=_produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def bounded_map(executor: Executor, fn: Callable, iterable: Iterable,
+                max_in_flight: int, ordered: bool = True) -> Iterator[Tuple[object, object]]:
+    """
+    Like Executor.map, but never submits more than `max_in_flight` tasks ahead
+    of the consumer, so large inputs don't pile up as pending futures. Yields
+    (item, result) pairs, either in input order or as they complete.
+    """
+    pending = deque()
+    items = iter(iterable)
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < max_in_flight:
+            try:
+                item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            pending.append((item, executor.submit(fn, item)))
+        if not pending:
+            return
+        if ordered:
+            item, future = pending.popleft()
+            yield item, future.result()
+        else:
+            done, _ = wait([f for _, f in pending], return_when=FIRST_COMPLETED)
+            for entry in [p for p in pending if p[1] in done]:
+                pending.remove(entry)
+                yield entry[0], entry[1].result()
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ── Stages ──────────────────────────────────────────────────────────
+def _safe_load_pdf(path: str) -> Optional[List[Document]]:
+    # Runs in a worker process; exceptions are reported by the parent.
+    try:
+        return load_pdf(path)
+    except Exception as e:
+        logger.error(f"Error loading PDF file {path}: {e}")
+        return None
+
+
+def parse_files(paths: List[str], workers: int, stats: StageStats) -> Iterator[Tuple[str, List[Document]]]:
+    """
+    Parses PDFs in a process pool and yields (path, pages) as files finish.
+    Failed files are skipped. The pool is created here, in the calling
+    thread, even when iteration later moves to a `prefetch` thread, and its
+    workers are spawned rather than forked: forking a process with live
+    threads (queues, HTTP clients, FAISS) can deadlock the child.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        return _parse_serially(paths, stats)
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(paths)),
+                               mp_context=multiprocessing.get_context("spawn"))
+    return _parse_in_pool(pool, paths, workers, stats)
+
+
+def _parse_serially(paths: List[str], stats: StageStats) -> Iterator[Tuple[str, List[Document]]]:
+    started = time.perf_counter()
+    for path in paths:
+        pages = _safe_load_pdf(path)
+        stats.record(1, time.perf_counter() - started)
+        if pages is not None:
+            yield path, pages
+        started = time.perf_counter()
+
+
+def _parse_in_pool(pool: ProcessPoolExecutor, paths: List[str], workers: int,
+                   stats: StageStats) -> Iterator[Tuple[str, List[Document]]]:
+    started = time.perf_counter()
+    with pool:
+        for path, pages in bounded_map(pool, _safe_load_pdf, paths, workers * 2, ordered=False):
+            stats.record(1, time.perf_counter() - started)
+            if pages is not None:
+                yield path, pages
+            started = time.perf_counter()
+
+
+def split_files(parsed: Iterable[Tuple[str, List[Document]]], text_splitter,
+                stats: StageStats) -> Iterator[Tuple[str, List[Document]]]:
+    """Splits each parsed file into chunks as soon as it arrives."""
+    for path, pages in parsed:
+        started = time.perf_counter()
+        chunks = text_splitter.split_documents(pages)
+        stats.record(len(chunks), time.perf_counter() - started)
+        yield path, chunks
+
+
+def embed_batches(chunks: Iterable[Document], embeddings, batch_size: int, concurrency: int,
+                  stats: StageStats) -> Iterator[Tuple[List[Document], List[List[float]]]]:
+    """Groups chunks into batches and embeds up to `concurrency` batches at a time."""
+    def _embed(batch: List[Document]):
+        started = time.perf_counter()
+        vectors = embeddings.embed_documents([d.page_content for d in batch])
+        return vectors, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for batch, (vectors, seconds) in bounded_map(pool, _embed, batched(chunks, batch_size), concurrency):
+            stats.record(len(batch), seconds)
+            yield batch, vectors
+
+
+def index_batches(batches: Iterable[Tuple[List[Document], List[List[float]]]], vectordb,
+                  create_fn: Callable, stats: StageStats):
+    """
+    Adds embedded batches to the FAISS store as they arrive. When `vectordb` is
+    None the store is created from the first batch with `create_fn`. Returns
+    the (possibly new) store.
+    """
+    for batch, vectors in batches:
+        started = time.perf_counter()
+        text_embeddings = [(d.page_content, v) for d, v in zip(batch, vectors)]
+        metadatas = [d.metadata for d in batch]
+        ids = [d.id for d in batch]
+        if vectordb is None:
+            vectordb = create_fn(text_embeddings, metadatas, ids)
+        else:
+            vectordb.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        stats.record(len(batch), time.perf_counter() - started)
+    return vectordb
+
+
+def default_workers() -> int:
+    return max(1, min(8, (os.cpu_count() or 2) - 1))
@@ -0,0 +1,58 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+from src.core.lazy import registered, startup_report
+# Imported for their side effect of registering their lazy singletons.
+import src.core.llm_config  # noqa: F401
+import src.agents.prerouter  # noqa: F401
+import src.tools.rag  # noqa: F401
+import src.tools.web_search  # noqa: F401
+
+# ── LOGGING ─────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Warm-up ─────────────────────────────────────────────────────────
+def warmup(components: Optional[Iterable[str]] = None, parallel: bool = True) -> Dict[str, dict]:
+    """
+    Builds the lazy singletons (vector store, retriever, search client, LLMs...)
+    ahead of the first request. Components are built concurrently when
+    `parallel` is set; a failing component is logged and reported but does not
+    stop the others. Returns {name: {"seconds": float | None, "error": str | None}}.
+
+    Timings are inclusive: a component that depends on another one (the
+    retriever on the vector store) also counts the time spent waiting for it.
+    """
+    lazies = registered()
+    names = list(components) if components is not None else list(lazies)
+    unknown = [n for n in names if n not in lazies]
+    if unknown:
+        raise ValueError(f"Unknown components: {unknown}. Known: {sorted(lazies)}")
+
+    errors: Dict[str, str] = {}
+
+    def _build(name: str) -> None:
+        try:
+            lazies[name].get()
+        except Exception as e:
+            logger.error(f"Warm-up of {name} failed: {e}")
+            errors[name] = str(e)
+
+    started = time.perf_counter()
+    if parallel:
+        with ThreadPoolExecutor(max_workers=max(1, len(names))) as pool:
+            list(pool.map(_build, names))
+    else:
+        for name in names:
+            _build(name)
+    total = time.perf_counter() - started
+
+    timings = startup_report()
+    report = {name: {"seconds": timings.get(name), "error": errors.get(name)} for name in names}
+    summary = ", ".join(
+        f"{name}=FAILED" if info["error"] else f"{name}={info['seconds'] or 0:.2f}s"
+        for name, info in report.items()
+    )
+    logger.info(f"Startup report ({total:.2f}s total): {summary}")
+    return report
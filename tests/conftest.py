@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read once, on the first import of src.core.config; keep the
+# tests away from the real vector store, logs and tracing.
+_tmp = tempfile.mkdtemp(prefix="rag-agent-tests-")
+os.environ.update({
+    "LANGSMITH_TRACING": "false",
+    "SUFFICIENCY_VERDICT_LOG_PATH": os.path.join(_tmp, "judge_verdicts.jsonl"),
+    "SUFFICIENCY_THRESHOLDS_PATH": os.path.join(_tmp, "sufficiency_thresholds.json"),
+    "CHECKPOINT_SPILL_PATH": "",
+    "PREROUTER_EXAMPLES_PATH": "",
+    "WEB_CACHE_PATH": "",
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "SPECULATIVE_WEB_MODE": "off",
+})
+
+KB_QUESTION = "Who is the CEO of Starx AI technology?"
+GENERAL_QUESTION = "Write a haiku about the sea."
+
+ROUTER_SCRIPT = {KB_QUESTION: {"route": "rag"}, GENERAL_QUESTION: {"route": "answer"}}
+JUDGE_SCRIPT = {KB_QUESTION: {"sufficient": True}}
+
+
+@pytest.fixture(scope="session")
+def fakes():
+    """The benchmark's local stand-ins behind every model, search and KB singleton."""
+    from src.bench import fakes
+    fakes.install(ROUTER_SCRIPT, JUDGE_SCRIPT, fakes.synthetic_kb(50, [KB_QUESTION]))
+    return fakes
@@ -0,0 +1,72 @@
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+
+from src.core import blobs as blob_module
+from src.core.blobs import BLOB_PREFIX, BlobStore, MissingBlob
+from src.core.checkpointer import BoundedCheckpointSaver
+
+TEXT = "retrieved chunk " * 100
+
+
+def _put(saver, thread_id: str, value: str, step: int = 1):
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = f"1ef0-{step:04d}"
+    checkpoint["channel_values"] = {"rag": value}
+    checkpoint["channel_versions"] = {"rag": step}
+    saver.put({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}, checkpoint, {}, {"rag": step})
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """A fresh process-wide blob store, as seen by the checkpointer."""
+    store = BlobStore(max_bytes=len(TEXT) + 10, min_chars=100)
+    monkeypatch.setattr(blob_module, "blobs", store)
+    monkeypatch.setattr("src.core.checkpointer.state_blobs", store)
+    return store
+
+
+def test_short_strings_stay_inline(store):
+    assert store.put("short") == "short"
+    assert store.put(TEXT).startswith(BLOB_PREFIX)
+
+
+def test_evicted_blob_without_durable_copy_raises(store):
+    ref = store.put(TEXT)
+    store.put("other " * 100)
+    assert store.peek(ref) is None
+    with pytest.raises(MissingBlob):
+        store.get(ref)
+
+
+def test_evicted_blob_is_loaded_from_the_spill_file(store, tmp_path):
+    saver = BoundedCheckpointSaver(spill_path=str(tmp_path / "spill.db"))
+    ref = store.put(TEXT)
+    _put(saver, "t1", ref)
+    store.put("other " * 100)
+    assert store.peek(ref) is None
+    assert store.get(ref) == TEXT
+
+
+def test_restored_thread_brings_its_blobs_back(store, tmp_path, monkeypatch):
+    path = str(tmp_path / "spill.db")
+    ref = store.put(TEXT)
+    _put(BoundedCheckpointSaver(spill_path=path), "t1", ref)
+
+    # A restarted process: empty blob store, new saver on the same file.
+    fresh = BlobStore(max_bytes=1 << 20, min_chars=100)
+    monkeypatch.setattr("src.core.checkpointer.state_blobs", fresh)
+    restarted = BoundedCheckpointSaver(spill_path=path)
+    fresh.loader = None
+    restored = restarted.get_tuple({"configurable": {"thread_id": "t1", "checkpoint_ns": ""}})
+    assert restored.checkpoint["channel_values"]["rag"] == ref
+    assert fresh.get(ref) == TEXT
+
+
+def test_deleted_thread_drops_its_blobs(store, tmp_path):
+    saver = BoundedCheckpointSaver(spill_path=str(tmp_path / "spill.db"))
+    ref = store.put(TEXT)
+    _put(saver, "t1", ref)
+    saver.delete_thread("t1")
+    store.put("other " * 100)
+    with pytest.raises(MissingBlob):
+        store.get(ref)
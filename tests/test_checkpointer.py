@@ -0,0 +1,111 @@
+import time
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+
+from src.core.blobs import BlobStore
+from src.core.checkpointer import BoundedCheckpointSaver
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def _put(saver, thread_id: str, value: str, step: int = 1):
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = f"1ef0-{step:04d}"
+    checkpoint["channel_values"] = {"rag": value}
+    checkpoint["channel_versions"] = {"rag": step}
+    saver.put(_config(thread_id), checkpoint, {}, {"rag": step})
+
+
+def _value(saver, thread_id: str):
+    restored = saver.get_tuple(_config(thread_id))
+    return restored.checkpoint["channel_values"]["rag"] if restored else None
+
+
+@pytest.fixture(autouse=True)
+def state_blobs(monkeypatch):
+    # Savers with a spill file register themselves as the blob loader.
+    monkeypatch.setattr("src.core.checkpointer.state_blobs", BlobStore(max_bytes=1 << 20, min_chars=100))
+
+
+def test_least_recently_used_thread_is_evicted():
+    saver = BoundedCheckpointSaver(max_threads=2)
+    _put(saver, "a", "first")
+    _put(saver, "b", "second")
+    assert _value(saver, "a") == "first"
+    _put(saver, "c", "third")
+    assert _value(saver, "b") is None
+    assert [_value(saver, t) for t in ("a", "c")] == ["first", "third"]
+    assert saver.memory_usage()["threads"] == 2
+
+
+def test_byte_budget_evicts_threads():
+    saver = BoundedCheckpointSaver(max_bytes=1)
+    _put(saver, "a", "first")
+    assert _value(saver, "a") is None
+    assert saver.memory_usage()["bytes"] == 0
+
+
+def test_idle_threads_expire():
+    saver = BoundedCheckpointSaver(ttl_seconds=0.05, sweep_interval=0)
+    _put(saver, "a", "first")
+    time.sleep(0.1)
+    _put(saver, "b", "second")
+    assert _value(saver, "a") is None
+    assert _value(saver, "b") == "second"
+
+
+def test_history_is_pruned():
+    saver = BoundedCheckpointSaver(max_history=2)
+    for step in range(1, 6):
+        _put(saver, "a", f"turn {step}", step)
+    assert len(list(saver.list(_config("a")))) == 2
+    assert _value(saver, "a") == "turn 5"
+
+
+def test_evicted_thread_is_restored_from_the_spill(tmp_path):
+    saver = BoundedCheckpointSaver(max_threads=1, spill_path=str(tmp_path / "spill.db"))
+    _put(saver, "a", "first")
+    _put(saver, "b", "second")
+    assert "a" not in saver.storage
+    assert _value(saver, "a") == "first"
+    assert saver.memory_usage()["restored"] >= 1
+
+
+def test_spill_survives_a_restart(tmp_path):
+    path = str(tmp_path / "spill.db")
+    _put(BoundedCheckpointSaver(spill_path=path), "a", "first")
+    assert _value(BoundedCheckpointSaver(spill_path=path), "a") == "first"
+
+
+def test_expired_spill_rows_are_not_restored(tmp_path):
+    path = str(tmp_path / "spill.db")
+    _put(BoundedCheckpointSaver(spill_path=path), "a", "first")
+    time.sleep(0.1)
+    assert _value(BoundedCheckpointSaver(spill_path=path, ttl_seconds=0.05), "a") is None
+
+
+def test_deleted_thread_is_not_restored(tmp_path):
+    path = str(tmp_path / "spill.db")
+    saver = BoundedCheckpointSaver(spill_path=path)
+    _put(saver, "a", "first")
+    saver.delete_thread("a")
+    assert _value(saver, "a") is None
+    assert _value(BoundedCheckpointSaver(spill_path=path), "a") is None
+
+
+def test_known_thread_skips_reading_its_checkpoint_back(tmp_path):
+    path = str(tmp_path / "spill.db")
+    saver = BoundedCheckpointSaver(spill_path=path)
+    _put(saver, "a", "first")
+    statements = []
+    saver._spill.set_trace_callback(statements.append)
+    assert _value(saver, "a") == "first"
+    assert not any("SELECT checkpoint_type" in sql for sql in statements)
+
+    # Another worker takes the conversation further.
+    _put(BoundedCheckpointSaver(spill_path=path), "a", "second", step=2)
+    assert _value(saver, "a") == "second"
+    assert any("SELECT checkpoint_type" in sql for sql in statements)
@@ -0,0 +1,47 @@
+import sqlite3
+
+from langchain_core.documents import Document
+
+from src.tools.chunk_store import ChunkStore
+
+
+def _store(tmp_path, texts):
+    store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+    store.add({f"c{i}": Document(page_content=text) for i, text in enumerate(texts)})
+    store.commit({i: f"c{i}" for i in range(len(texts))})
+    return store
+
+
+def test_lexical_search_ranks_rows_from_the_fts_index(tmp_path):
+    store = _store(tmp_path, ["the ACME-42 widget manual", "pricing of widgets", "company history"])
+    rows = [row for row, _ in store.lexical_search("acme 42 widget", 3)]
+    assert rows[0] == 0
+    assert 2 not in rows
+
+
+def test_replaced_and_deleted_chunks_leave_the_fts_index(tmp_path):
+    store = _store(tmp_path, ["alpha", "beta"])
+    store.add({"c0": Document(page_content="gamma")})
+    store.delete(["c1"])
+    store.commit({0: "c0"})
+    assert store.lexical_search("alpha", 5) == []
+    assert store.lexical_search("beta", 5) == []
+    assert [row for row, _ in store.lexical_search("gamma", 5)] == [0]
+
+
+def test_store_without_fts_index_gets_one_when_opened_for_writing(tmp_path):
+    path = str(tmp_path / "chunks.sqlite")
+    _store(tmp_path, ["alpha", "beta"]).close()
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE chunks_fts")
+    for name in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER chunks_fts_{name}")
+    conn.commit()
+    conn.close()
+
+    reader = ChunkStore(path, readonly=True)
+    assert not reader.has_lexical_index
+    assert reader.lexical_search("alpha", 5) == []
+
+    ChunkStore(path).close()
+    assert [row for row, _ in ChunkStore(path, readonly=True).lexical_search("beta", 5)] == [1]
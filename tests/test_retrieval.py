@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.tools.retrieval import BM25Index, mmr_select, reciprocal_rank_fusion
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]])
+    assert [doc_id for doc_id, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_rrf_keeps_a_single_ranking_in_order():
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([["x", "y", "z"]])] == ["x", "y", "z"]
+
+
+def _unit(*rows):
+    vectors = np.asarray(rows, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_mmr_skips_near_duplicates():
+    vectors = _unit([1, 0], [0.99, 0.01], [0, 1])
+    relevance = [0.9, 0.89, 0.5]
+    assert mmr_select(relevance, vectors, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_mmr_with_lambda_one_is_plain_relevance_order():
+    vectors = _unit([1, 0], [0.99, 0.01], [0, 1])
+    assert mmr_select([0.9, 0.89, 0.5], vectors, k=3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_mmr_handles_empty_and_short_inputs():
+    assert mmr_select([], np.zeros((0, 2), dtype=np.float32), k=3, lambda_mult=0.5) == []
+    assert mmr_select([0.3], _unit([1, 0]), k=3, lambda_mult=0.5) == [0]
+
+
+def test_bm25_ranks_term_matches_first():
+    index = BM25Index(["a", "b", "c"], ["the ceo of starx", "quarterly revenue report", "starx office locations"])
+    assert [doc_id for doc_id, _ in index.search("starx ceo", 3)][:2] == ["a", "c"]
@@ -0,0 +1,52 @@
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agents.history import HistoryWindow
+from src.agents.nodes import _answer_prompt, router_node
+from src.core.blobs import resolve
+from tests.conftest import GENERAL_QUESTION, KB_QUESTION
+
+
+def _turn(query: str, new_upload: bool) -> dict:
+    return {"messages": [HumanMessage(content=query)], "upload_session": "session-1", "new_upload": new_upload}
+
+
+def test_upload_turn_is_answered_from_the_upload(fakes):
+    assert router_node(_turn(KB_QUESTION, new_upload=True))["route"] == "answer"
+
+
+def test_kb_question_after_upload_routes_to_rag(fakes):
+    assert router_node(_turn(KB_QUESTION, new_upload=False))["route"] == "rag"
+
+
+def test_greeting_after_upload_gets_the_canned_reply(fakes):
+    out = router_node(_turn("hi", new_upload=False))
+    assert out["route"] == "end"
+    assert isinstance(out["messages"][-1], AIMessage)
+
+
+def test_graph_retrieves_from_the_kb_after_an_upload(fakes):
+    from src.agents.graph import build_graph
+
+    graph = build_graph("staged").compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    graph.invoke(_turn(GENERAL_QUESTION, new_upload=True), config)
+    result = graph.invoke(_turn(KB_QUESTION, new_upload=False), config)
+    assert KB_QUESTION in resolve(result["rag"])
+
+
+def test_answer_prompt_keeps_kb_and_web_context_next_to_upload_excerpts():
+    state = {"messages": [HumanMessage(content=KB_QUESTION)], "rag": "kb chunk", "web": "web snippet"}
+    prompt = _answer_prompt(state, HistoryWindow(state["messages"]), upload_ctx="upload excerpt")
+    assert "upload excerpt" in prompt
+    assert "kb chunk" in prompt
+    assert "web snippet" in prompt
+
+
+def test_router_clears_context_from_the_previous_turn(fakes):
+    state = {**_turn(GENERAL_QUESTION, new_upload=False), "rag": "stale kb chunk", "web": "stale snippet"}
+    out = router_node(state)
+    assert out["route"] == "answer"
+    assert out["rag"] == "" and out["web"] == ""
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from src.server import AdmissionController, Overloaded
+
+
+async def _hold(admission: AdmissionController, thread_id: str, release: asyncio.Event, log: list):
+    async with admission.admit(thread_id):
+        log.append(("start", thread_id))
+        await release.wait()
+        log.append(("end", thread_id))
+
+
+def test_requests_beyond_the_queue_are_rejected():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        release, log = asyncio.Event(), []
+        running = asyncio.create_task(_hold(admission, "a", release, log))
+        queued = asyncio.create_task(_hold(admission, "b", release, log))
+        await asyncio.sleep(0.01)
+        assert admission.stats()["running"] == 1
+        assert admission.stats()["waiting"] == 1
+        with pytest.raises(Overloaded):
+            async with admission.admit("c"):
+                pass
+        release.set()
+        await asyncio.gather(running, queued)
+        assert admission.stats()["running"] == admission.stats()["waiting"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_is_an_overload():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        release, log = asyncio.Event(), []
+        running = asyncio.create_task(_hold(admission, "a", release, log))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            async with admission.admit("b"):
+                pass
+        release.set()
+        await running
+        assert admission._thread_requests == {}
+
+    asyncio.run(scenario())
+
+
+def test_turns_of_one_thread_are_serialized():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=4, max_queue=4, queue_timeout=5)
+        first, second, other, log = asyncio.Event(), asyncio.Event(), asyncio.Event(), []
+        tasks = [
+            asyncio.create_task(_hold(admission, "t1", first, log)),
+            asyncio.create_task(_hold(admission, "t1", second, log)),
+            asyncio.create_task(_hold(admission, "t2", other, log)),
+        ]
+        await asyncio.sleep(0.01)
+        # The second t1 turn waits for the first; t2 runs alongside.
+        assert log == [("start", "t1"), ("start", "t2")]
+        second.set()
+        other.set()
+        await asyncio.sleep(0.01)
+        assert log.count(("start", "t1")) == 1
+        first.set()
+        await asyncio.gather(*tasks)
+        t1 = [event for event, thread_id in log if thread_id == "t1"]
+        assert t1 == ["start", "end", "start", "end"]
+        assert admission._thread_locks == {} and admission._thread_requests == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from src.agents.sufficiency import SufficiencyGate, calibrate, load_verdicts
+
+
+def _wait_for_audits(gate: SufficiencyGate):
+    gate._auditor.shutdown(wait=True)
+    gate._auditor = None
+
+
+def test_thresholds_decide_without_the_judge():
+    gate = SufficiencyGate(low=0.2, high=0.8)
+    assert gate.decide([0.1, 0.9]) == "answer"
+    assert gate.decide([0.8]) == "answer"
+    assert gate.decide([0.1, 0.19]) == "web"
+    assert gate.decide([]) == "web"
+    assert gate.decide([0.5]) == "judge"
+
+
+def test_disabled_gate_always_judges():
+    gate = SufficiencyGate(low=0.2, high=0.8, enabled=False)
+    assert gate.decide([0.99]) == "judge"
+    assert not SufficiencyGate(low=0.2, high=0.8, enabled=False, audit_rate=1.0).should_audit("answer")
+
+
+def test_calibrate_learns_both_thresholds():
+    verdicts = [(0.1 + i / 100, False) for i in range(30)] + [(0.6 + i / 100, True) for i in range(30)]
+    low, high = calibrate(verdicts, target_precision=0.99, min_samples=10)
+    assert high == pytest.approx(0.6)
+    assert low == pytest.approx(0.39 + 1e-6)
+
+
+def test_calibrate_needs_min_samples():
+    assert calibrate([(0.9, True)] * 5, min_samples=20) is None
+
+
+def test_sampled_verdicts_are_weighted():
+    # Ten in-band "sufficient" verdicts plus one sampled "insufficient"
+    # verdict above them standing for 20 fast decisions.
+    verdicts = [(0.6, True, 1.0)] * 10 + [(0.9, False, 20.0)]
+    assert calibrate(verdicts, target_precision=0.9, min_samples=5) is None
+    assert calibrate([v[:2] for v in verdicts], target_precision=0.9, min_samples=5)[1] == 0.6
+
+
+def test_audits_log_sampled_verdicts_outside_the_band(tmp_path):
+    log = tmp_path / "verdicts.jsonl"
+    gate = SufficiencyGate(low=0.2, high=0.8, log_path=str(log), audit_rate=1.0)
+    assert not gate.should_audit("judge")
+    assert gate.should_audit("answer")
+
+    gate.audit([0.95], "answer", lambda: False)
+    gate.audit([0.05], "web", lambda: (_ for _ in ()).throw(RuntimeError("judge down")))
+    _wait_for_audits(gate)
+    gate.record([0.5], True)
+
+    records = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [r.get("sampled", False) for r in records] == [True, False]
+    assert load_verdicts(str(log)) == [(0.95, False, 1.0), (0.5, True, 1.0)]
+
+
+def test_audit_rate_zero_never_samples(tmp_path):
+    gate = SufficiencyGate(low=0.2, high=0.8, log_path=str(tmp_path / "v.jsonl"), audit_rate=0.0)
+    assert not any(gate.should_audit("answer") for _ in range(100))